@@ -0,0 +1,342 @@
+import sys
+import numpy as np
+import pandas as pd
+
+# Data in the IAMC format is internally kept as a dict of columns: one
+# categorical per dimension (codes into the unique labels) and the values as
+# float array ('value'). Thus, selections, renamings and unit conversions
+# only touch the codes and values instead of copying the whole table, as the
+# methods of the IamDataFrame do. IamDataFrames are only accepted and
+# returned at the public functions of the downscaling.
+IAMC_COLUMNS = ["model", "scenario", "region", "variable", "unit", "year"]
+
+
+def is_columnar(data=None):
+    return isinstance(data, dict) and "value" in data
+
+
+def is_iamdf(df=None):
+    # An IamDataFrame requires that pyam was already imported
+    _pyam = sys.modules.get("pyam")
+    return _pyam is not None and isinstance(df, _pyam.IamDataFrame)
+
+
+def from_iamdf(df=None):
+
+    """
+
+    Parameters
+    ----------
+    df : IamDataFrame, required
+        Includes the data in the IAMC format. Columnar data is returned as is.
+        The default is None.
+
+    Returns
+    -------
+    data : dict
+        Includes a Categorical per column of the IAMC format and the values
+        as float array ('value'). The codes and labels are taken from the
+        index of the IamDataFrame without copying the table. The rows are
+        sorted by the columns (as the data of filtered IamDataFrames), since
+        the results of the sequential algorithm depend on the order of the
+        regions.
+
+    """
+
+    if is_columnar(df):
+        return df
+
+    # The internal data of pyam (a Series with a MultiIndex of the columns)
+    # is not part of its public interface. Other layouts are converted from
+    # the (copied) long table.
+    _data = getattr(df, "_data", None)
+    if not (
+        isinstance(_data, pd.Series)
+        and isinstance(_data.index, pd.MultiIndex)
+        and list(_data.index.names) == IAMC_COLUMNS
+    ):
+        _df = df.data.sort_values(IAMC_COLUMNS, ignore_index=True)
+        data = {_column: pd.Categorical(_df[_column]) for _column in IAMC_COLUMNS}
+        data["value"] = _df["value"].to_numpy(dtype=float)
+        return data
+
+    _index = _data.index
+    _order = np.lexsort(_index.codes[::-1])
+    data = {
+        _column: pd.Categorical.from_codes(
+            _index.codes[_i][_order], _index.levels[_i]
+        )
+        for _i, _column in enumerate(_index.names)
+    }
+    data["value"] = _data.to_numpy(dtype=float)[_order]
+
+    return data
+
+
+def from_dict(dictionary=None, keys=None, **columns):
+
+    """
+
+    Parameters
+    ----------
+    dictionary : dict, required
+        Includes the values with tuples as keys, e.g., the results of the
+        sequential algorithm. The default is None.
+    keys : list, required
+        Includes the columns of the elements of the key tuples (in this
+        order). The default is None.
+    **columns
+        The constant label of each further column of the IAMC format.
+
+    Returns
+    -------
+    data : dict
+        Includes the values of the dictionary as columnar data.
+
+    """
+
+    _keys = list(dictionary.keys())
+    _length = len(_keys)
+
+    data = dict()
+    for _column in IAMC_COLUMNS:
+        if _column in keys:
+            _i = keys.index(_column)
+            data[_column] = pd.Categorical([_k[_i] for _k in _keys])
+        else:
+            _label = columns[_column]
+            data[_column] = pd.Categorical.from_codes(
+                np.zeros(_length, dtype=np.int8), [_label]
+            )
+    data["value"] = np.fromiter(dictionary.values(), float, _length)
+
+    return data
+
+
+def to_frame(data=None):
+
+    """
+
+    Parameters
+    ----------
+    data : dict, required
+        Includes the columnar data. The default is None.
+
+    Returns
+    -------
+    df : DataFrame
+        Includes the data in the long IAMC format (one row per value).
+
+    """
+
+    df = pd.DataFrame(
+        {_column: np.asarray(_values) for _column, _values in data.items()}
+    )
+
+    return df
+
+
+def to_iamdf(data=None):
+
+    """
+
+    Parameters
+    ----------
+    data : dict, required
+        Includes the columnar data. The default is None.
+
+    Returns
+    -------
+    df : IamDataFrame
+
+    """
+
+    from pyam import IamDataFrame
+
+    df = IamDataFrame(to_frame(data))
+
+    return df
+
+
+def get_values(data=None, column=None):
+
+    """
+
+    Parameters
+    ----------
+    data : dict, required
+        Includes the columnar data. The default is None.
+    column : String, required
+        Column of the IAMC format. The default is None.
+
+    Returns
+    -------
+    values : list
+        The sorted labels of the column, which occur in the data (as the
+        corresponding attribute of an IamDataFrame).
+
+    """
+
+    _categorical = data[column]
+    values = sorted(_categorical.categories[np.unique(_categorical.codes)])
+
+    return values
+
+
+def select(data=None, **filters):
+
+    """
+
+    Parameters
+    ----------
+    data : dict, required
+        Includes the columnar data. The default is None.
+    **filters
+        The label or list of labels per column, which are selected.
+
+    Returns
+    -------
+    selection : dict
+        Includes the rows of the data that match all filters.
+
+    """
+
+    _mask = np.ones(len(data["value"]), dtype=bool)
+    for _column, _labels in filters.items():
+        if np.ndim(_labels) == 0:
+            _labels = [_labels]
+        _codes = data[_column].categories.get_indexer(list(_labels))
+        _mask &= np.isin(data[_column].codes, _codes[_codes >= 0])
+
+    selection = {_column: _values[_mask] for _column, _values in data.items()}
+
+    return selection
+
+
+def rename(data=None, column=None, mapping=None):
+
+    """
+
+    Parameters
+    ----------
+    data : dict, required
+        Includes the columnar data. The default is None.
+    column : String, required
+        Column of the IAMC format. The default is None.
+    mapping : dict, required
+        Includes the new label per label. Labels, which are renamed to the
+        same label, are merged (see 'sum_duplicates'). The default is None.
+
+    Returns
+    -------
+    renamed : dict
+        Includes the data with the renamed labels.
+
+    """
+
+    _categorical = data[column]
+    _labels = pd.Index([mapping.get(_l, _l) for _l in _categorical.categories])
+    _codes, _uniques = pd.factorize(_labels)
+
+    renamed = dict(data)
+    renamed[column] = pd.Categorical.from_codes(
+        _codes[_categorical.codes], _uniques
+    )
+
+    return renamed
+
+
+def convert_unit(data=None, current=None, to=None, factor=None):
+
+    """
+
+    Parameters
+    ----------
+    data : dict, required
+        Includes the columnar data. The default is None.
+    current : String, required
+        Unit, which is converted. The default is None.
+    to : String, required
+        Unit, to which the values are converted. The default is None.
+    factor : float, optional
+        Conversion factor. The default is None, for which it is derived from
+        the unit registry of pyam ('iam_units').
+
+    Returns
+    -------
+    converted : dict
+        Includes the data with the converted values and units.
+
+    """
+
+    if factor is None:
+        from iam_units import registry
+
+        factor = registry.Quantity(1, current).to(to).magnitude
+
+    _where = np.asarray(data["unit"] == current)
+
+    converted = rename(data, "unit", {current: to})
+    converted["value"] = np.where(_where, data["value"] * factor, data["value"])
+
+    return converted
+
+
+def concat(datas=None):
+
+    """
+
+    Parameters
+    ----------
+    datas : list, required
+        Includes the columnar data, which is concatenated. The default is None.
+
+    Returns
+    -------
+    data : dict
+        Includes the rows of all data (with the union of the labels).
+
+    """
+
+    from pandas.api.types import union_categoricals
+
+    data = {
+        _column: union_categoricals([_d[_column] for _d in datas])
+        for _column in datas[0].keys()
+        if _column != "value"
+    }
+    data["value"] = np.concatenate([_d["value"] for _d in datas])
+
+    return data
+
+
+def sum_duplicates(data=None):
+
+    """
+
+    Parameters
+    ----------
+    data : dict, required
+        Includes the columnar data. The default is None.
+
+    Returns
+    -------
+    aggregated : dict
+        Includes the sum of the values per unique combination of the labels
+        (sorted by the codes of the columns).
+
+    """
+
+    _columns = [_column for _column in data.keys() if _column != "value"]
+    _codes = np.stack([data[_column].codes for _column in _columns], axis=1)
+    _unique, _inverse = np.unique(_codes, axis=0, return_inverse=True)
+
+    aggregated = {
+        _column: pd.Categorical.from_codes(_unique[:, _i], data[_column].categories)
+        for _i, _column in enumerate(_columns)
+    }
+    aggregated["value"] = np.bincount(
+        _inverse.ravel(), weights=data["value"], minlength=len(_unique)
+    )
+
+    return aggregated
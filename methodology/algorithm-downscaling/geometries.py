@@ -0,0 +1,170 @@
+import os
+import numpy as np
+import pandas as pd
+import shapely
+
+# Derivatives of the polygons of the regions, which are computed once per
+# version of the geometries: centroid coordinates, area, perimeter and
+# bounding box, and a simplified polygon (the geometry) for rendering
+DERIVATIVE_COLUMNS = ["x", "y", "area", "perimeter", "minx", "miny", "maxx", "maxy"]
+
+# Tolerance of the simplified polygons (meters for EPSG:3035)
+SIMPLIFY_TOLERANCE = 50
+
+
+def create_geometry_derivatives(geometries=None, tolerance=SIMPLIFY_TOLERANCE):
+
+    """
+
+    Parameters
+    ----------
+    geometries : GeoDataFrame, required
+        Includes the 'region' and the polygons of the regions (e.g., as
+        created by 'create_lau_geometries'). Only the first polygon of
+        duplicate regions is considered. The default is None.
+    tolerance : float, optional
+        Tolerance for the simplification of the polygons. The default is 50.
+
+    Returns
+    -------
+    derivatives : GeoDataFrame
+        One row per region, indexed by the name of the region, with the
+        'DERIVATIVE_COLUMNS' (as float) and the simplified polygons.
+
+    """
+
+    import geopandas as gpd
+    import shapely
+
+    _geometries = geometries.drop_duplicates(subset="region")
+    _polygons = np.asarray(_geometries.geometry.values)
+    _centroids = shapely.get_coordinates(shapely.centroid(_polygons))
+    _bounds = shapely.bounds(_polygons)
+
+    derivatives = gpd.GeoDataFrame(
+        {
+            "x": _centroids[:, 0],
+            "y": _centroids[:, 1],
+            "area": shapely.area(_polygons),
+            "perimeter": shapely.length(_polygons),
+            "minx": _bounds[:, 0],
+            "miny": _bounds[:, 1],
+            "maxx": _bounds[:, 2],
+            "maxy": _bounds[:, 3],
+        },
+        geometry=shapely.simplify(_polygons, tolerance),
+        index=pd.Index(_geometries["region"].to_numpy(), name="region"),
+        crs=geometries.crs,
+    )
+
+    return derivatives
+
+
+def read_geometry_derivatives(
+    geometries=None, derivatives=None, tolerance=SIMPLIFY_TOLERANCE
+):
+
+    """
+
+    Parameters
+    ----------
+    geometries : String, required
+        Path of the GeoParquet file of the geometries (see
+        'create_geometry_derivatives'). The default is None.
+    derivatives : String, optional
+        Path of the GeoParquet file of the derivatives, which is written at
+        the first call. Later calls only read this file as long as it is
+        newer than the geometries (or the geometries are not available).
+        The default is None, for which it is stored next to the geometries
+        (e.g., 'lau-geometries.derivatives.parquet').
+    tolerance : float, optional
+        Tolerance for the simplification of the polygons. The default is 50.
+
+    Returns
+    -------
+    derivatives : GeoDataFrame
+        Includes the derivatives of the geometries.
+
+    """
+
+    import geopandas as gpd
+
+    _path = derivatives
+    if _path is None:
+        _path = os.path.splitext(geometries)[0] + ".derivatives.parquet"
+
+    if os.path.exists(_path) and (
+        not os.path.exists(geometries)
+        or os.path.getmtime(_path) >= os.path.getmtime(geometries)
+    ):
+        return gpd.read_parquet(_path)
+
+    derivatives = create_geometry_derivatives(
+        gpd.read_parquet(geometries), tolerance
+    )
+    derivatives.to_parquet(_path)
+
+    return derivatives
+
+
+def get_centroids(derivatives=None, regions=None):
+
+    """
+
+    Parameters
+    ----------
+    derivatives : GeoDataFrame, required
+        Includes the derivatives of the geometries. The default is None.
+    regions : list, optional
+        Includes the regions (in this order). The default is None (all).
+
+    Returns
+    -------
+    centroids : GeoSeries
+        Includes the centroids of the regions indexed by region.
+
+    """
+
+    import geopandas as gpd
+    import shapely
+
+    _derivatives = derivatives if regions is None else derivatives.loc[regions]
+    centroids = gpd.GeoSeries(
+        shapely.points(_derivatives["x"].to_numpy(), _derivatives["y"].to_numpy()),
+        index=_derivatives.index,
+        crs=derivatives.crs,
+    )
+
+    return centroids
+
+
+def find_overlapping_bounds(derivatives=None, regions=None):
+
+    """
+
+    Parameters
+    ----------
+    derivatives : GeoDataFrame, required
+        Includes the derivatives of the geometries. The default is None.
+    regions : list, required
+        Includes the regions. The default is None.
+
+    Returns
+    -------
+    pairs : ndarray
+        Includes the pairs of positions (i < j) in 'regions', whose bounding
+        boxes overlap or touch (in the order of 'itertools.combinations').
+        Only these regions can share a boundary.
+
+    """
+
+    _bounds = derivatives.loc[regions, ["minx", "miny", "maxx", "maxy"]].to_numpy(float)
+    _boxes = shapely.box(*_bounds.T)
+
+    # The spatial index only compares boxes near each other (not all pairs)
+    _i, _j = shapely.STRtree(_boxes).query(_boxes, predicate="intersects")
+    _keep = _i < _j
+    pairs = np.column_stack((_i[_keep], _j[_keep]))
+    pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+    return pairs
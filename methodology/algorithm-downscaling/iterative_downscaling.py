@@ -1,21 +1,51 @@
-import matplotlib.pyplot as plt
+import hashlib
+import json
+import logging
+import networkx as nx
+import numpy as np
 import pandas as pd
 import os
-import geopandas as gpd
-import pyam
+import time
 
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from itertools import combinations
 from pathlib import Path
 
-from utils import make_networkx_from_shapefile
-from utils import add_quantities_to_nodes
-from utils import calculate_cluster_coefficient
-from utils import calculate_distance_coefficient
-from utils import calculate_total_indicator_value
+from iterative_utils import make_networkx_from_shapefile
+from iterative_utils import add_quantities_to_nodes
+from iterative_utils import calculate_cluster_structure
+from iterative_utils import calculate_cluster_coefficient
+from iterative_utils import calculate_distance_coefficient
+from iterative_utils import calculate_total_indicator_value
+from geometries import create_geometry_derivatives
+from geometries import find_overlapping_bounds
+from geometries import get_centroids
+from regions import create_region_registry
+from regions import decode_regions
+from regions import encode_regions
 
+import profiling
 
-def iterative_downscaling(init_quantities=None, lines=None):
+
+logger = logging.getLogger(__name__)
+
+# Columns that identify a run in the results written by 'write_results'
+RESULT_KEYS = ["country", "NUTS3_CODE", "scenario", "run_id"]
+
+# Attributes of the (EU-wide) LAU shapefile, which are read per country
+LAU_COLUMNS = ["LAU_ID", "LAU_NAME"]
+
+
+def iterative_downscaling(
+    init_quantities=None,
+    lines=None,
+    population=None,
+    processes=None,
+    batch_size=None,
+    batch_quantile=None,
+    checkpoint=None,
+    checkpoint_interval=50,
+):
 
     """
 
@@ -29,6 +59,44 @@ def iterative_downscaling(init_quantities=None, lines=None):
     lines : Shapefile, required
         Includes the connection lines between the nodes on the local level (LAU).
         The default is None.
+    population : dict, optional
+        Includes the population per node as created by
+        'create_population_index'. The default is None, in which case the
+        population of removed nodes is not available (NaN).
+    processes : int, optional
+        If set, the graph is split into its connected components, which are
+        distributed over this many worker processes (evaluated in this
+        process for 1). Each worker keeps the cluster structure of its
+        components, updates it only for the neighbours of removed nodes and
+        evaluates the indicator values of its nodes per iteration. The nodes
+        with the global minimum are removed and the heat is shifted against
+        the decentralized heat generation of the whole graph, since the
+        stopping rule depends on it. The results are identical to the
+        default, which recalculates all indicators (including the unused
+        distance coefficient) in this process in every iteration.
+        The default is None.
+    batch_size : int, optional
+        Maximum number of nodes with the lowest indicator values that are
+        removed per iteration. The batch is reduced to the nodes whose
+        centralized heat generation is covered by the decentralized heat
+        generation of the remaining nodes, and the heat is shifted in one
+        step. Batch removal uses the components of the graph (see
+        'processes'). Use 'compare_removal_traces' to compare the results with
+        the removal of single nodes. The default is None (one node).
+    batch_quantile : float, optional
+        Alternatively to 'batch_size', all nodes with indicator values up to
+        this quantile are removed per iteration (at least one).
+        The default is None.
+    checkpoint : String, optional
+        Path to a checkpoint file, to which the state of the removal
+        (remaining nodes, quantities, indicator values and removed nodes) is
+        written every 'checkpoint_interval' iterations. If the file already
+        exists, the run resumes from it and gives the same results as an
+        uninterrupted run. A checkpoint of other quantities, lines or
+        parameters raises a ValueError. The file is removed at the end of the
+        run. The default is None (no checkpoints).
+    checkpoint_interval : int, optional
+        Number of iterations between two checkpoints. The default is 50.
 
     Returns
     -------
@@ -37,115 +105,818 @@ def iterative_downscaling(init_quantities=None, lines=None):
     final_lines : Shapefile
         Includes the shapefile with final connection lines between nodes.
     benchmark_df : DataFrame
-        Includes the benchmark indicator values of nodes.
+        Includes the benchmark indicator values (float32) of nodes (rows) per
+        iteration (columns). Values of already removed nodes are NaN.
+    removed_population : DataFrame
+        Includes the removed nodes (in order of removal), the iteration of
+        their removal (the column of 'benchmark_df' with the indicator values
+        that led to the removal) and their population.
 
     """
 
-    # Add connection lines with switched start and end nodes
-    _inverted_lines = lines.rename(columns={"START": "END", "END": "START"})
-    lines = lines.append(_inverted_lines)
-
     # Create networkx graph from shapefiles
     graph = make_networkx_from_shapefile(lines)
     graph = add_quantities_to_nodes(graph, init_quantities)
 
-    # nodes = len(graph._node.keys())
-
-    _benchmarks = list()
-    _removed_pop = list()
-    _pop_lau_level = pd.read_excel("data\Population_on_LAU_level_in_2050.xlsx")
-    _lau_and_code = pd.read_excel("data\LAU_and_CODE.xlsx")
-    
-    
-
-    while True:
-        cluster_coefficient = calculate_cluster_coefficient(graph)
-        distance_coefficient = calculate_distance_coefficient(graph)
-        indicators = calculate_total_indicator_value(
-            cluster_coefficient, distance_coefficient
-        )
-
-        _benchmarks.append(list(indicators.values()))
-
-        for key in indicators.keys():
-            if indicators[key] == min(indicators.values()):
-                node_to_drop = key
-        # print("Node that is removed from graph: " + node_to_drop)
-        _lau_name = node_to_drop.split("|")[1]
-        _lau_code = _lau_and_code.loc[_lau_and_code.LAU_NAME == _lau_name]["LAU_CODE"].item()
-        # print(_lau_code)
-        _pop = _pop_lau_level.loc[_pop_lau_level.region == _lau_code][2050].item()
-        # print(_pop)
-        _removed_pop.append(_pop)
-        
-        
-        
-        
-        # print("Population disconnected from district heating: " + _pop_lau_level.loc[])
-
-        total_decentralized = sum(
-            graph._node[_key]["Decentralized"]
-            for _key in graph._node.keys()
-            if _key is not node_to_drop
+    # The nodes are relabelled to the ids of a region registry (in the order
+    # of the nodes), so that the names are only used again for the results.
+    registry = create_region_registry(list(graph._node.keys()))
+    graph = nx.relabel_nodes(graph, dict(zip(registry.index, range(len(registry)))))
+
+    # The indicator values are stored per iteration (row) and original node
+    # (column). There are at most as many iterations as nodes, since one node
+    # is removed per iteration. Removed nodes keep NaN as indicator value.
+    _nodes = list(registry.index)
+    _benchmarks = np.full((len(_nodes), len(_nodes)), np.nan, dtype=np.float32)
+    _iteration = 0
+    _removed_nodes = list()
+    _removal_iterations = list()
+
+    if processes is None and (batch_size is not None or batch_quantile is not None):
+        processes = 1
+
+    if checkpoint is not None:
+        _key = create_checkpoint_key(
+            init_quantities,
+            lines,
+            processes=processes,
+            batch_size=batch_size,
+            batch_quantile=batch_quantile,
         )
 
-        if total_decentralized < graph._node[node_to_drop]["Centralized"]:
-            print(
-                "Stop heat generation reallocation (decentralized lower than centralized)"
+    if checkpoint is not None and os.path.exists(checkpoint):
+        _state = read_checkpoint(checkpoint)
+        if _state["nodes"].tolist() != _nodes or str(_state.get("key")) != _key:
+            raise ValueError(
+                "Checkpoint {} belongs to a different run (network, quantities "
+                "or parameters)".format(checkpoint)
             )
-            break
-        else:
-            reduced_graph = graph
-            shift = (
-                reduced_graph._node[node_to_drop]["Centralized"] / total_decentralized
+        graph.remove_nodes_from(np.flatnonzero(~_state["alive"]).tolist())
+        for _node in graph._node.keys():
+            graph._node[_node]["Centralized"] = float(_state["centralized"][_node])
+            graph._node[_node]["Decentralized"] = float(
+                _state["decentralized"][_node]
+            )
+        _iteration = int(_state["iteration"])
+        _benchmarks[:_iteration] = _state["benchmarks"]
+        _removed_nodes = _state["removed"].tolist()
+        _removal_iterations = _state["removal_iterations"].tolist()
+        logger.info("Resume from {} at iteration {}".format(checkpoint, _iteration))
+
+    if processes is not None:
+        _components = _create_component_pool(graph, processes)
+        _pending = list()
+        _shift = None
+
+    # The worker processes are shut down in any case (also on exceptions)
+    try:
+        while True:
+            if profiling.ENABLED:
+                _start = time.perf_counter()
+
+            if processes is None:
+                cluster_coefficient = calculate_cluster_coefficient(graph)
+                distance_coefficient = calculate_distance_coefficient(graph)
+            else:
+                # The removals and the shift of the last iteration are passed to
+                # the components, which return the indicator values of their nodes
+                _values = dict()
+                for _v in _advance_component_pool(
+                    _components,
+                    _pending,
+                    _shift,
+                    max(graph._node[_key]["Centralized"] for _key in graph._node),
+                ):
+                    _values.update(_v)
+                cluster_coefficient = {_key: _values[_key] for _key in graph._node}
+                distance_coefficient = None
+            indicators = calculate_total_indicator_value(
+                cluster_coefficient, distance_coefficient
             )
-            del reduced_graph._node[node_to_drop]
-            del reduced_graph._adj[node_to_drop]
 
-            remove = dict()
-            for node1 in reduced_graph._node.keys():
-                for node2 in reduced_graph._adj[node1].keys():
-                    if node2 == node_to_drop:
-                        remove[node1] = node2
+            # Nodes removed in this iteration are recorded with its (0-based)
+            # number, which is the column of its indicators in 'benchmark_df'
+            _current = _iteration
+            _benchmarks[_current, list(indicators.keys())] = list(indicators.values())
+            _iteration += 1
 
-                reduced_graph._node[node1]["Centralized"] += (
-                    shift * reduced_graph._node[node1]["Decentralized"]
-                )
-                reduced_graph._node[node1]["Decentralized"] -= (
-                    shift * reduced_graph._node[node1]["Decentralized"]
-                )
+            nodes_to_drop = select_nodes_to_drop(
+                graph, indicators, batch_size, batch_quantile
+            )
 
-            for region in remove.keys():
-                del reduced_graph._adj[region][remove[region]]
-                if remove[region] in reduced_graph._adj.keys():
-                    del reduced_graph.adj[remove[region]]
+            _drop = set(nodes_to_drop)
+            total_decentralized = sum(
+                graph._node[_key]["Decentralized"]
+                for _key in graph._node.keys()
+                if _key not in _drop
+            )
+            total_centralized = sum(
+                graph._node[_key]["Centralized"] for _key in nodes_to_drop
+            )
 
-            graph = reduced_graph
+            if total_decentralized < total_centralized:
+                print(
+                    "Stop heat generation reallocation (decentralized lower than centralized)"
+                )
+                break
+            else:
+                shift = total_centralized / total_decentralized
+
+                graph.remove_nodes_from(nodes_to_drop)
+                _removed_nodes.extend(nodes_to_drop)
+                _removal_iterations.extend([_current] * len(nodes_to_drop))
+
+                for node1 in graph._node.keys():
+                    graph._node[node1]["Centralized"] += (
+                        shift * graph._node[node1]["Decentralized"]
+                    )
+                    graph._node[node1]["Decentralized"] -= (
+                        shift * graph._node[node1]["Decentralized"]
+                    )
+
+                if processes is not None:
+                    _pending = nodes_to_drop
+                    _shift = shift
+
+                if profiling.ENABLED:
+                    profiling.record(
+                        "iteration",
+                        iteration=_current,
+                        nodes=graph.number_of_nodes(),
+                        edges=graph.number_of_edges(),
+                        removed=len(nodes_to_drop),
+                        wall=time.perf_counter() - _start,
+                    )
+
+                if checkpoint is not None and _iteration % checkpoint_interval == 0:
+                    write_checkpoint(
+                        checkpoint,
+                        graph,
+                        _nodes,
+                        _benchmarks[:_iteration],
+                        _removed_nodes,
+                        _removal_iterations,
+                        _key,
+                    )
+    finally:
+        if processes is not None:
+            _shutdown_component_pool(_components)
+
+    # A completed run is not resumed again
+    if checkpoint is not None and os.path.exists(checkpoint):
+        os.remove(checkpoint)
 
     final_graph = graph
-    benchmark_df = pd.DataFrame(_benchmarks).T
+    benchmark_df = pd.DataFrame(_benchmarks[:_iteration].T, index=_nodes)
 
-    final_nodes = list(final_graph._node.keys())
+    final_nodes = decode_regions(registry, list(final_graph._node.keys()))
+    final_centralized = pd.Series(
+        [final_graph._node[_node]["Centralized"] for _node in final_graph._node],
+        index=final_nodes,
+    )
     final_lines = lines.loc[
         (lines["START"].isin(final_nodes)) & (lines["END"].isin(final_nodes))
     ]
     final_generation = init_quantities.loc[init_quantities["region"].isin(final_nodes)]
     final_cen_generation = final_generation.loc[
         final_generation["variable"] == "Centralized"
+    ].copy()
+    final_cen_generation["value"] = final_cen_generation["region"].map(
+        final_centralized
+    )
+
+    _removed_nodes = decode_regions(registry, _removed_nodes)
+    _population = pd.Series(population, dtype=float).reindex(_removed_nodes)
+    removed_population = pd.DataFrame(
+        {
+            "region": list(_removed_nodes),
+            "iteration": _removal_iterations,
+            "population": _population.to_numpy(),
+        }
+    )
+
+    return final_cen_generation, final_lines, benchmark_df, removed_population
+
+
+def _create_component_pool(graph=None, processes=None):
+    # The connected components are distributed over the workers (largest
+    # first to the worker with the fewest nodes). Each worker is a pool of
+    # one process, so that the state of its components stays in it.
+    _components = sorted(nx.connected_components(graph), key=len, reverse=True)
+    _groups = [set() for _ in range(min(processes, len(_components)))]
+    for _c in _components:
+        min(_groups, key=len).update(_c)
+    _graphs = [graph.subgraph(_g).copy() for _g in _groups]
+    logger.info(
+        "Graph consists of {} connected components ({} workers)".format(
+            len(_components), len(_graphs)
+        )
+    )
+
+    pool = {
+        "group": {_n: _i for _i, _g in enumerate(_groups) for _n in _g},
+        "states": None,
+        "executors": None,
+    }
+    if processes > 1 and len(_graphs) > 1:
+        pool["executors"] = [
+            ProcessPoolExecutor(
+                max_workers=1,
+                initializer=_set_component_state,
+                initargs=(_g,),
+            )
+            for _g in _graphs
+        ]
+    else:
+        pool["states"] = [_create_component_state(_g) for _g in _graphs]
+
+    return pool
+
+
+def _advance_component_pool(pool=None, removed=None, shift=None, max_quantity=None):
+    _removed = [list() for _ in pool["executors"] or pool["states"]]
+    for _node in removed:
+        _removed[pool["group"][_node]].append(_node)
+
+    if pool["executors"] is None:
+        return [
+            _advance_components(_state, _r, shift, max_quantity)
+            for _state, _r in zip(pool["states"], _removed)
+        ]
+    _futures = [
+        _executor.submit(_advance_component_worker, _r, shift, max_quantity)
+        for _executor, _r in zip(pool["executors"], _removed)
     ]
+    return [_future.result() for _future in _futures]
+
+
+def _shutdown_component_pool(pool=None):
+    for _executor in pool["executors"] or []:
+        _executor.shutdown()
+
+
+def _create_component_state(graph=None):
+    return {"graph": graph, "structure": calculate_cluster_structure(graph)}
+
+
+def _advance_components(state=None, removed=None, shift=None, max_quantity=None):
+
+    """
+
+    Parameters
+    ----------
+    state : dict, required
+        Includes the 'graph' of the components and their cluster 'structure'.
+        The default is None.
+    removed : list, required
+        Includes the nodes of the components, which were removed in the last
+        iteration. The default is None.
+    shift : float, optional
+        Share of the decentralized heat generation, which was shifted to the
+        centralized heat generation in the last iteration. The default is
+        None (first iteration).
+    max_quantity : float, required
+        Maximum centralized heat generation of the whole graph.
+        The default is None.
+
+    Returns
+    -------
+    cluster_coefficient : dict
+        Value of the cluster coefficient per node of the components.
+
+    """
+
+    graph = state["graph"]
+    structure = state["structure"]
+
+    # The structure is only updated for the neighbours of removed nodes
+    if len(removed) > 0:
+        _neighbours = set()
+        for _node in removed:
+            _neighbours.update(graph._adj[_node])
+        _neighbours.difference_update(removed)
+
+        graph.remove_nodes_from(removed)
+        for _node in removed:
+            del structure[_node]
+        structure.update(calculate_cluster_structure(graph, _neighbours))
+
+    # The same operations as on the whole graph (i.e., identical quantities)
+    if shift is not None:
+        for _node in graph._node.keys():
+            graph._node[_node]["Centralized"] += (
+                shift * graph._node[_node]["Decentralized"]
+            )
+            graph._node[_node]["Decentralized"] -= (
+                shift * graph._node[_node]["Decentralized"]
+            )
+
+    cluster_coefficient = calculate_cluster_coefficient(
+        graph, structure, max_quantity
+    )
+
+    return cluster_coefficient
+
+
+def _set_component_state(graph=None):
+    # The state of the components is kept per worker process
+    global _COMPONENT_STATE
+    _COMPONENT_STATE = _create_component_state(graph)
+
+
+def _advance_component_worker(removed=None, shift=None, max_quantity=None):
+    return _advance_components(_COMPONENT_STATE, removed, shift, max_quantity)
+
+
+def write_checkpoint(
+    path=None,
+    graph=None,
+    nodes=None,
+    benchmarks=None,
+    removed=None,
+    removal_iterations=None,
+    key=None,
+):
+
+    """
+
+    Parameters
+    ----------
+    path : String, required
+        Path of the checkpoint file. The default is None.
+    graph : Networkx, required
+        Includes the current graph with heat generation quantities.
+        The default is None.
+    nodes : list, required
+        Includes the names of the nodes of the initial graph, whose nodes are
+        labelled by their position in this list. The default is None.
+    benchmarks : ndarray, required
+        Includes the indicator values of the iterations so far.
+        The default is None.
+    removed : list, required
+        Includes the removed nodes (in order of removal). The default is None.
+    removal_iterations : list, required
+        Includes the iteration of the removal per removed node.
+        The default is None.
+    key : String, optional
+        Identifies the inputs and parameters of the run (see
+        'create_checkpoint_key'). The default is None.
+
+    Returns
+    -------
+    None.
+
+    """
+
+    _ids = np.fromiter(graph._node.keys(), dtype=np.int64)
+    _alive = np.zeros(len(nodes), dtype=bool)
+    _alive[_ids] = True
+    _centralized = np.full(len(nodes), np.nan)
+    _decentralized = np.full(len(nodes), np.nan)
+    _centralized[_ids] = [_data["Centralized"] for _data in graph._node.values()]
+    _decentralized[_ids] = [_data["Decentralized"] for _data in graph._node.values()]
+
+    # Write to a temporary file first, so that a crash while writing does not
+    # destroy the previous checkpoint.
+    with open(path + ".tmp", "wb") as _file:
+        np.savez(
+            _file,
+            nodes=np.array(nodes, dtype=str),
+            alive=_alive,
+            centralized=_centralized,
+            decentralized=_decentralized,
+            benchmarks=benchmarks,
+            removed=np.array(removed, dtype=np.int64),
+            removal_iterations=np.array(removal_iterations, dtype=np.int64),
+            iteration=len(benchmarks),
+            key=str(key),
+        )
+    os.replace(path + ".tmp", path)
+
+    return
+
+
+def read_checkpoint(path=None):
+
+    """
+
+    Parameters
+    ----------
+    path : String, required
+        Path of the checkpoint file. The default is None.
+
+    Returns
+    -------
+    state : dict
+        Includes the arrays of the checkpoint ('nodes', 'alive', 'centralized',
+        'decentralized', 'benchmarks', 'removed', 'removal_iterations',
+        'iteration' and 'key').
+
+    """
 
-    for item in final_cen_generation["region"]:
-        final_cen_generation.loc[
-            final_cen_generation["region"] == item, ["value"]
-        ] = final_graph._node[item]["Centralized"]
-    
-    df = pd.DataFrame(_removed_pop)
-    df.to_excel("Removed_population.xlsx")
+    with np.load(path) as _file:
+        state = {_key: _file[_key] for _key in _file.files}
 
-    return final_cen_generation, final_lines, benchmark_df
+    return state
 
 
-def files_to_results_folder(generation=None, lines=None, benchmark=None, folder=None, boundary=None):
+def create_checkpoint_key(init_quantities=None, lines=None, **parameters):
+
+    """
+
+    Parameters
+    ----------
+    init_quantities : Shapefile, required
+        Includes the quantities of centralized and decentralized heat
+        generation per region (see 'iterative_downscaling').
+        The default is None.
+    lines : Shapefile, required
+        Includes the connection lines between the nodes. The default is None.
+    **parameters
+        The parameters of the run, which affect the removal of nodes.
+
+    Returns
+    -------
+    key : String
+        SHA-256 hash of the quantities (without geometries), the ends of the
+        lines and the parameters. Thus, a checkpoint is only resumed by the
+        same run (e.g., not by another scenario with the same nodes).
+
+    """
+
+    _hash = hashlib.sha256()
+    _quantities = pd.DataFrame(init_quantities).drop(
+        columns="geometry", errors="ignore"
+    )
+    for _df in [_quantities, pd.DataFrame(lines)[["START", "END"]]]:
+        _hash.update(pd.util.hash_pandas_object(_df, index=False).to_numpy().tobytes())
+    _hash.update(json.dumps(parameters, sort_keys=True, default=str).encode())
+    key = _hash.hexdigest()
+
+    return key
+
+
+def select_nodes_to_drop(
+    graph=None, indicators=None, batch_size=None, batch_quantile=None
+):
+
+    """
+
+    Parameters
+    ----------
+    graph : Networkx, required
+        Includes the graph with heat generation quantities.
+        The default is None.
+    indicators : dict, required
+        Includes the total indicator value per node.
+        The default is None.
+    batch_size : int, optional
+        Maximum number of nodes that are selected. The default is None (one).
+    batch_quantile : float, optional
+        Alternatively, all nodes with indicator values up to this quantile are
+        selected. The default is None.
+
+    Returns
+    -------
+    nodes_to_drop : list
+        Includes the nodes with the lowest indicator values (at least one).
+        In case of equal values, later nodes of the graph are selected first.
+        Further nodes are only added as long as their centralized heat
+        generation is covered by the decentralized heat generation of the
+        remaining nodes. Whether the first node can be removed is left to the
+        stopping rule of the iterative downscaling.
+
+    """
+
+    _nodes = list(indicators.keys())
+    _values = np.fromiter(indicators.values(), dtype=float, count=len(_nodes))
+    _order = np.lexsort((-np.arange(len(_nodes)), _values))
+
+    if batch_quantile is not None:
+        _k = int(np.sum(_values <= np.quantile(_values, batch_quantile)))
+    elif batch_size is not None:
+        _k = batch_size
+    else:
+        _k = 1
+    _candidates = _order[: max(_k, 1)]
+
+    if len(_candidates) > 1:
+        _cen = np.array([graph._node[_nodes[_i]]["Centralized"] for _i in _candidates])
+        _dec = np.array([graph._node[_n]["Decentralized"] for _n in _nodes])
+        _remaining = _dec.sum() - np.cumsum(_dec[_candidates])
+        _feasible = np.cumsum(_cen) <= _remaining
+        _feasible[0] = True
+        if not _feasible.all():
+            _candidates = _candidates[: np.argmin(_feasible)]
+
+    nodes_to_drop = [_nodes[_i] for _i in _candidates]
+
+    return nodes_to_drop
+
+
+def compare_removal_traces(reference=None, trace=None):
+
+    """
+
+    Parameters
+    ----------
+    reference : DataFrame, required
+        Includes the removed nodes of a reference run (e.g., removal of single
+        nodes) as returned by 'iterative_downscaling'.
+        The default is None.
+    trace : DataFrame, required
+        Includes the removed nodes of a run that is compared with the
+        reference (e.g., batch removal).
+        The default is None.
+
+    Returns
+    -------
+    differences : dict
+        Includes the nodes that are only removed in the 'reference' or only in
+        the 'trace', whether the final networks are 'identical', the mean
+        absolute 'displacement' of the removal order of nodes removed in both
+        runs, and the number of 'iterations' with removals of both runs.
+
+    """
+
+    _reference = pd.Series(range(len(reference)), index=reference["region"])
+    _trace = pd.Series(range(len(trace)), index=trace["region"])
+    _common = _reference.index.intersection(_trace.index)
+
+    differences = {
+        "only_reference": list(_reference.index.difference(_trace.index)),
+        "only_trace": list(_trace.index.difference(_reference.index)),
+        "identical": set(_reference.index) == set(_trace.index),
+        "displacement": float(
+            np.abs(_reference[_common] - _trace[_common]).mean()
+            if len(_common) > 0
+            else 0
+        ),
+        "iterations": (
+            int(reference["iteration"].nunique()),
+            int(trace["iteration"].nunique()),
+        ),
+    }
+
+    return differences
+
+
+def beam_search_downscaling(
+    init_quantities=None,
+    lines=None,
+    population=None,
+    beam_width=4,
+    branching=None,
+    objective="population",
+    processes=None,
+):
+
+    """
+
+    Parameters
+    ----------
+    init_quantities : Shapefile, required
+        Includes the quantities of centralized and decentralized
+        heat generation per region on the local (LAU) level.
+        The quantities need to be from the same scenario and NUTS3 region.
+        The default is None.
+    lines : Shapefile, required
+        Includes the connection lines between the nodes on the local level (LAU).
+        The default is None.
+    population : dict, optional
+        Includes the population per node as created by
+        'create_population_index'. The default is None.
+    beam_width : int, optional
+        Number of partial networks that are kept per iteration.
+        The default is 4.
+    branching : int, optional
+        Number of nodes with the lowest indicator values that are tried to be
+        removed from each partial network. The default is None, which
+        corresponds to the beam width.
+    objective : string or function, optional
+        Ranks the partial networks. Either 'population' (removed population),
+        'length' (length of connection lines), 'centralized' (centralized heat
+        generation of connected nodes, which is maximized) or a function of
+        these metrics (dict) that is minimized. The default is 'population'.
+    processes : int, optional
+        Number of worker processes expanding the partial networks in parallel.
+        The default is None (no worker processes).
+
+    Returns
+    -------
+    pareto : DataFrame
+        Includes the Pareto-optimal final networks regarding the centralized
+        heat generation of connected nodes (maximized), the removed population
+        and the length of connection lines (both minimized). Each row includes
+        the metrics, the remaining 'nodes' and the 'removed' nodes (in order of
+        removal). The networks are sorted by the objective.
+
+    """
+
+    # The partial networks are stored as arrays over the nodes of the initial
+    # graph (alive mask, quantities, cluster structure) plus the removal trace.
+    # Expanding a network copies these arrays instead of the networkx graph.
+    graph = make_networkx_from_shapefile(lines)
+    graph = add_quantities_to_nodes(graph, init_quantities)
+
+    registry = create_region_registry(list(graph._node.keys()))
+    graph = nx.relabel_nodes(graph, dict(zip(registry.index, range(len(registry)))))
+    _nodes = list(graph._node.keys())
+    _structure = calculate_cluster_structure(graph)
+
+    static = {
+        "neighbours": [list(graph._adj[_node]) for _node in _nodes],
+        "start": encode_regions(registry, lines["START"]),
+        "end": encode_regions(registry, lines["END"]),
+        "length": lines.geometry.length.to_numpy(),
+        "population": pd.Series(population, dtype=float)
+        .reindex(registry.index)
+        .fillna(0)
+        .to_numpy(),
+    }
+    _initial = (
+        np.ones(len(_nodes), dtype=bool),
+        np.array([graph._node[_n]["Centralized"] for _n in _nodes], dtype=float),
+        np.array([graph._node[_n]["Decentralized"] for _n in _nodes], dtype=float),
+        np.array([_structure[_n] for _n in _nodes], dtype=float),
+        tuple(),
+    )
+
+    if branching is None:
+        branching = beam_width
+    if objective in ["population", "length"]:
+        _score = lambda metrics: metrics[objective]
+    elif objective == "centralized":
+        _score = lambda metrics: -metrics[objective]
+    else:
+        _score = objective
+
+    _executor = None
+    if processes is not None:
+        _executor = ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=_set_beam_search_data,
+            initargs=(static,),
+        )
+
+    beam = [_initial]
+    final_states = dict()
+    _iteration = 0
+
+    # The worker processes are shut down in any case (also on exceptions)
+    try:
+        while len(beam) > 0:
+            _iteration += 1
+            if _executor is not None:
+                _expansions = _executor.map(
+                    _expand_beam_state_worker, beam, [branching] * len(beam)
+                )
+            else:
+                _expansions = [
+                    _expand_beam_state(_state, branching, static) for _state in beam
+                ]
+
+            _children = dict()
+            for _state, _expansion in zip(beam, _expansions):
+                if _expansion is None:
+                    final_states[_state[0].tobytes()] = _state
+                    continue
+                for _child in _expansion:
+                    _key = _child[0].tobytes()
+                    _child_score = _score(_beam_state_metrics(_child, static))
+                    if _key not in _children or _child_score < _children[_key][0]:
+                        _children[_key] = (_child_score, _child)
+
+            beam = [
+                _child
+                for _child_score, _child in sorted(
+                    _children.values(), key=lambda _c: _c[0]
+                )[:beam_width]
+            ]
+    finally:
+        if _executor is not None:
+            _executor.shutdown()
+
+    logger.info(
+        "Beam search finished after {} iterations with {} final networks".format(
+            _iteration, len(final_states)
+        )
+    )
+
+    _rows = []
+    for _state in final_states.values():
+        _metrics = _beam_state_metrics(_state, static)
+        _metrics["score"] = _score(_metrics)
+        _metrics["nodes"] = list(decode_regions(registry, np.flatnonzero(_state[0])))
+        _metrics["removed"] = list(decode_regions(registry, _state[4]))
+        _rows.append(_metrics)
+    networks = pd.DataFrame(_rows)
+
+    _values = networks[["centralized", "population", "length"]].to_numpy()
+    _values[:, 0] *= -1
+    _dominated = [
+        bool(np.any(np.all(_values <= _v, axis=1) & np.any(_values < _v, axis=1)))
+        for _v in _values
+    ]
+    pareto = networks.loc[~np.array(_dominated)].sort_values("score")
+    pareto.insert(0, "NUTS3_CODE", init_quantities["NUTS3_CODE"].iloc[0])
+
+    return pareto.drop(columns="score").reset_index(drop=True)
+
+
+def _set_beam_search_data(static=None):
+    # The static data of the beam search is kept per worker process
+    global _BEAM_SEARCH_DATA
+    _BEAM_SEARCH_DATA = static
+
+
+def _expand_beam_state_worker(state=None, branching=None):
+    return _expand_beam_state(state, branching, _BEAM_SEARCH_DATA)
+
+
+def _node_structure(node=None, neighbours=None, alive=None):
+    _neighbours = [_n for _n in neighbours[node] if alive[_n]]
+    m = len(_neighbours)
+    if m < 2:
+        return 0
+    _set = set(_neighbours)
+    number = sum(1 for _n in _neighbours for _k in neighbours[_n] if _k in _set)
+    return number / (m * (m - 1))
+
+
+def _expand_beam_state(state=None, branching=None, static=None):
+
+    # Returns None for final networks (the node with the lowest indicator
+    # value cannot be removed), otherwise the partial networks without one of
+    # the nodes with the lowest indicator values.
+    neighbours = static["neighbours"]
+    alive, cen, dec, structure, trace = state
+
+    _idx = np.flatnonzero(alive)
+    if len(_idx) == 0:
+        return None
+    _max = cen[_idx].max()
+    if _max > 0:
+        _indicators = cen[_idx] / _max * structure[_idx]
+    else:
+        _indicators = np.zeros(len(_idx))
+    _order = _idx[np.lexsort((-_idx, _indicators))]
+
+    _total = dec[_idx].sum()
+    if _total - dec[_order[0]] < cen[_order[0]]:
+        return None
+
+    children = []
+    for _node in _order[:branching]:
+        _others = _total - dec[_node]
+        if _others < cen[_node]:
+            continue
+        shift = cen[_node] / _others
+
+        _alive = alive.copy()
+        _alive[_node] = False
+        _cen = cen.copy()
+        _dec = dec.copy()
+        _cen[_alive] += shift * dec[_alive]
+        _dec[_alive] -= shift * dec[_alive]
+
+        _structure = structure.copy()
+        _structure[_node] = 0
+        for _n in neighbours[_node]:
+            if _alive[_n]:
+                _structure[_n] = _node_structure(_n, neighbours, _alive)
+
+        children.append((_alive, _cen, _dec, _structure, trace + (int(_node),)))
+
+    return children
+
+
+def _beam_state_metrics(state=None, static=None):
+    alive, cen = state[0], state[1]
+    _start = static["start"]
+    _end = static["end"]
+
+    _lines = alive[_start] & alive[_end]
+    _connected = np.zeros(len(alive), dtype=bool)
+    _connected[_start[_lines]] = True
+    _connected[_end[_lines]] = True
+
+    return {
+        "centralized": float(cen[_connected].sum()),
+        "population": float(static["population"][~alive].sum()),
+        "length": float(static["length"][_lines].sum()),
+        "iterations": len(state[4]),
+    }
+
+
+def files_to_results_folder(
+    generation=None,
+    lines=None,
+    benchmark=None,
+    folder=None,
+    boundary=None,
+    removed_population=None,
+):
 
     """
 
@@ -156,9 +927,15 @@ def files_to_results_folder(generation=None, lines=None, benchmark=None, folder=
     lines : GeoDataFrame, required
         Includes the implemented connection lines. The default is None.
     benchmark : DataFrame, required
-        Includes the benchmark indicator values. The default is None.
+        Includes the benchmark indicator values, which are written as
+        compressed array ('indicators') together with the node labels
+        ('nodes'). The default is None.
     folder : string, required
         Includes the name of the result folder. The default is None.
+    boundary : GeoDataFrame, required
+        Includes the polygons of the nodes. The default is None.
+    removed_population : DataFrame, optional
+        Includes the population of the removed nodes. The default is None.
 
     -------
     results_directory : String
@@ -166,6 +943,8 @@ def files_to_results_folder(generation=None, lines=None, benchmark=None, folder=
 
     """
 
+    import geopandas as gpd
+
     time = datetime.now().strftime("%Y%m%dT%H%M")
     results_directory = os.path.join(
         "iterative-downscaling-results", "{}-{}".format(folder, time)
@@ -174,77 +953,365 @@ def files_to_results_folder(generation=None, lines=None, benchmark=None, folder=
         os.makedirs(results_directory)
 
     if not lines.empty:
-        lines.to_file(results_directory + "\lines.shp")
+        lines.to_file(os.path.join(results_directory, "lines.shp"))
     _values = gpd.GeoDataFrame(generation)
-    _values.to_file(results_directory + "\generation.shp")
-    
-    boundary.to_file(results_directory + "\polygons.shp")
+    _values.to_file(os.path.join(results_directory, "generation.shp"))
 
-    
-    benchmark.to_excel(excel_writer=results_directory + "\indicator_values.xlsx")
+    boundary.to_file(os.path.join(results_directory, "polygons.shp"))
+
+    np.savez_compressed(
+        os.path.join(results_directory, "indicator_values.npz"),
+        indicators=benchmark.to_numpy(),
+        nodes=benchmark.index.to_numpy(dtype=str),
+    )
+    if removed_population is not None:
+        removed_population.to_excel(
+            excel_writer=os.path.join(results_directory, "removed_population.xlsx"),
+            index=False,
+        )
 
     return results_directory
 
 
-def plot_final_network_graph(generation=None, lines=None, total_area=None, folder=None):
+def write_results(
+    path=None,
+    key=None,
+    generation=None,
+    lines=None,
+    benchmark=None,
+    boundary=None,
+    removed_population=None,
+):
+
+    """
+
+    Parameters
+    ----------
+    path : String, required
+        Includes the path of the results. If the path ends with '.gpkg', the
+        run is appended to the layers of a single GeoPackage. Otherwise, the
+        path is a GeoParquet dataset with one folder per layer and one file
+        per run. The default is None.
+    key : dict, required
+        Includes the values of 'RESULT_KEYS' of the run, which are added as
+        columns to every layer. The default is None.
+    generation : GeoDataFrame, required
+        Includes the centralized heat generation quantities. The default is None.
+    lines : GeoDataFrame, required
+        Includes the implemented connection lines. The default is None.
+    benchmark : DataFrame, required
+        Includes the benchmark indicator values, which are written in long
+        format (region, iteration, value). The default is None.
+    boundary : GeoDataFrame, required
+        Includes the polygons of the nodes. The default is None.
+    removed_population : DataFrame, optional
+        Includes the population of the removed nodes. The default is None.
+
+    Returns
+    -------
+    path : String
+        Includes the path of the results.
+
+    """
+
+    import geopandas as gpd
+    import pyogrio
+
+    _indicators = benchmark.rename_axis(index="region").reset_index()
+    _indicators = _indicators.melt(id_vars="region", var_name="iteration").dropna()
+
+    _layers = {
+        "generation": gpd.GeoDataFrame(generation),
+        "lines": lines,
+        "polygons": boundary,
+        "indicators": _indicators,
+        "removed_population": removed_population,
+    }
+
+    _name = "+".join(str(key[_key]) for _key in RESULT_KEYS)
+    if path.endswith(".gpkg"):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        _existing = (
+            set(pyogrio.list_layers(path)[:, 0]) if os.path.exists(path) else set()
+        )
+
+    for _layer, _df in _layers.items():
+        if _df is None or _df.empty:
+            continue
+        _df = _df.assign(**{_key: key[_key] for _key in RESULT_KEYS})
+        if path.endswith(".gpkg"):
+            pyogrio.write_dataframe(_df, path, layer=_layer, append=_layer in _existing)
+        else:
+            os.makedirs(os.path.join(path, _layer), exist_ok=True)
+            _df.to_parquet(os.path.join(path, _layer, _name + ".parquet"))
+
+    return path
+
+
+def read_results(path=None, layer=None):
 
     """
 
     Parameters
     ----------
-    generation : TYPE, optional
-        DESCRIPTION. The default is None.
-    lines : TYPE, optional
-        DESCRIPTION. The default is None.
-    total_area : TYPE, optional
-        DESCRIPTION. The default is None.
-    folder : TYPE, optional
-        DESCRIPTION. The default is None.
+    path : String, required
+        Includes the path of the results written by 'write_results'.
+        The default is None.
+    layer : String, required
+        Name of the layer (e.g., 'generation'). The default is None.
 
     Returns
     -------
-    None.
+    results : GeoDataFrame or None
+        Includes the layer of all runs or None, if no run wrote the layer.
 
     """
 
-    plt.style.use("science")
-    fig, ax = plt.subplots(nrows=1, ncols=1)
+    import geopandas as gpd
+    import pyogrio
 
-    ax.axis("off")
+    if path.endswith(".gpkg"):
+        if layer not in pyogrio.list_layers(path)[:, 0]:
+            return None
+        return pyogrio.read_dataframe(path, layer=layer)
 
-    _gen = gpd.GeoDataFrame(generation)
-    _a1 = sum(_gen.geometry.area)
+    if not os.path.exists(os.path.join(path, layer)):
+        return None
+    if layer in ["indicators", "removed_population"]:
+        return pd.read_parquet(os.path.join(path, layer))
+    return gpd.read_parquet(os.path.join(path, layer))
 
-    _area = gpd.GeoDataFrame(total_area)
-    
-    _a2 = sum(_area.geometry.area)
-    
-    print(_a2 / _a1 / 2)
 
-    
+def plot_final_network_graph(
+    generation=None,
+    lines=None,
+    total_area=None,
+    folder=None,
+    style="science",
+    derivatives=None,
+):
 
-    
-    _centroids = _gen.centroid.to_frame()
-    _area.boundary.plot(ax=ax, linewidth=0.5, color="#D1D9D9", linestyle="dashed")
-    _centroids["value"] = _gen.value
-    centroids = gpd.GeoDataFrame(_centroids)
-    centroids.rename(columns={0: "geometry"}, inplace=True)
-    centroids.plot(
-        ax=ax,
-        marker="o",
-        color="#053742",
-        markersize=1.5 * centroids["value"],
-        legend=True,
+    """
+
+    Parameters
+    ----------
+    generation : GeoDataFrame, required
+        Includes the centralized heat generation quantities (including the
+        polygons of the nodes). The default is None.
+    lines : GeoDataFrame, required
+        Includes the implemented connection lines. The default is None.
+    total_area : GeoDataFrame, required
+        Includes the polygons of all nodes of the sub-region. The default is None.
+    folder : String, required
+        Includes the folder of the figure. The default is None.
+    style : String, optional
+        Matplotlib style of the figure. The default is "science".
+    derivatives : GeoDataFrame, optional
+        Includes the centroids and simplified polygons of the nodes (see
+        'create_base_map'). The default is None.
+
+    Returns
+    -------
+    None.
+
+    """
+
+    boundary, centroids = create_base_map(total_area, derivatives=derivatives)
+    render_base_map(
+        boundary,
+        centroids,
+        [(os.path.join(folder, "centralized-heat-network.png"), generation, lines)],
+        style=style,
     )
-    lines.plot(ax=ax, color="#FBC7F7", linewidth=0.5)
-    fig.savefig(folder + "\centralized-heat-network.png", dpi=500)
     return
 
 
-def create_initial_network_topology(
+def create_base_map(total_area=None, tolerance=None, derivatives=None):
+
+    """
+
+    Parameters
+    ----------
+    total_area : GeoDataFrame, required
+        Includes the polygons of all nodes of a sub-region (duplicate regions
+        are dropped). The default is None.
+    tolerance : float, optional
+        Tolerance for the simplification of the boundaries (in units of the
+        coordinate reference system). The default is None (not simplified).
+    derivatives : GeoDataFrame, optional
+        Includes the centroids and simplified polygons of (at least) the nodes
+        of the sub-region (see 'read_geometry_derivatives'), which replace the
+        polygons of 'total_area' and the tolerance. The default is None.
+
+    Returns
+    -------
+    boundary : GeoSeries
+        Includes the (simplified) boundaries of the nodes.
+    centroids : GeoSeries
+        Includes the centroids of the nodes indexed by region.
+
+    """
+
+    import geopandas as gpd
+
+    _area = gpd.GeoDataFrame(total_area).drop_duplicates(subset="region")
+    if derivatives is not None:
+        centroids = get_centroids(derivatives, _area["region"])
+        boundary = derivatives.loc[_area["region"]].boundary
+        return boundary, centroids
+
+    _area = _area.set_index("region").geometry
+    centroids = _area.centroid
+
+    if tolerance is not None:
+        _area = _area.simplify(tolerance)
+    boundary = _area.boundary
+
+    return boundary, centroids
+
+
+def render_base_map(boundary=None, centroids=None, runs=None, style="science", dpi=500):
+
+    """
+
+    Parameters
+    ----------
+    boundary : GeoSeries, required
+        Includes the boundaries of the nodes, which are drawn once and shared
+        by all figures. The default is None.
+    centroids : GeoSeries, required
+        Includes the centroids of the nodes indexed by region. The default is None.
+    runs : list, required
+        Includes one tuple (file, generation, lines) per figure, whereby
+        generation includes the columns 'region' and 'value'.
+        The default is None.
+    style : String, optional
+        Matplotlib style of the figures. The default is "science".
+    dpi : int, optional
+        Resolution of the figures. The default is 500.
+
+    Returns
+    -------
+    files : list
+        Includes the files of the figures.
+
+    """
+
+    import geopandas as gpd
+    import matplotlib.pyplot as plt
+
+    files = list()
+    with plt.style.context(style):
+        fig, ax = plt.subplots(nrows=1, ncols=1)
+        ax.axis("off")
+        boundary.plot(ax=ax, linewidth=0.5, color="#D1D9D9", linestyle="dashed")
+        _base = len(ax.collections)
+
+        for _file, _generation, _lines in runs:
+            gpd.GeoSeries(centroids.loc[_generation["region"]].values).plot(
+                ax=ax,
+                marker="o",
+                color="#053742",
+                markersize=1.5 * _generation["value"].to_numpy(),
+            )
+            if _lines is not None and not _lines.empty:
+                _lines.plot(ax=ax, color="#FBC7F7", linewidth=0.5)
+            fig.savefig(_file, dpi=dpi)
+            files.append(_file)
+
+            # Remove the layers of this run, but keep the base map
+            for _collection in ax.collections[_base:]:
+                _collection.remove()
+
+        plt.close(fig)
+
+    return files
+
+
+def _use_agg_backend():
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+
+def render_results(
+    path=None,
+    folder=None,
+    processes=None,
+    tolerance=None,
+    style="science",
+    dpi=500,
+    derivatives=None,
+):
+
+    """
+
+    Parameters
+    ----------
+    path : String, required
+        Includes the path of the results written by 'write_results'.
+        The default is None.
+    folder : String, required
+        Includes the folder of the figures (one per run). The default is None.
+    processes : int, optional
+        Number of worker processes, which render with the Agg backend. The
+        figures are rendered sequentially if None. The default is None.
+    tolerance : float, optional
+        Tolerance for the simplification of the boundaries. The default is None.
+    style : String, optional
+        Matplotlib style of the figures. The default is "science".
+    dpi : int, optional
+        Resolution of the figures. The default is 500.
+    derivatives : GeoDataFrame, optional
+        Includes the centroids and simplified polygons of the nodes (see
+        'create_base_map'). The default is None.
+
+    Returns
+    -------
+    files : list
+        Includes the files of the figures.
+
+    """
+
+    os.makedirs(folder, exist_ok=True)
+    polygons = read_results(path, "polygons")
+    generation = read_results(path, "generation")
+    lines = read_results(path, "lines")
+
+    _lines = dict()
+    if lines is not None:
+        _lines = {_key: _l.geometry for _key, _l in lines.groupby(RESULT_KEYS)}
+
+    # One task per NUTS3 region, which draws the base map once for all runs
+    _tasks = list()
+    for _nuts3, _polygons in polygons.groupby("NUTS3_CODE"):
+        boundary, centroids = create_base_map(_polygons, tolerance, derivatives)
+        _runs = list()
+        _generation = generation.loc[generation["NUTS3_CODE"] == _nuts3]
+        for _key, _run in _generation.groupby(RESULT_KEYS):
+            _file = os.path.join(folder, "+".join(str(_k) for _k in _key) + ".png")
+            _runs.append((_file, _run[["region", "value"]], _lines.get(_key)))
+        _tasks.append((boundary, centroids, _runs, style, dpi))
+
+    files = list()
+    if processes is None:
+        for _task in _tasks:
+            files.extend(render_base_map(*_task))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=processes, initializer=_use_agg_backend
+        ) as _executor:
+            for _files in _executor.map(render_base_map, *zip(*_tasks)):
+                files.extend(_files)
+
+    return files
+
+
+def read_lau_shapefile(
     country="AT",
-    shapefile="shapefiles\LAU shapefile\LAU_RG_01M_2019_3035.shp",
-    matching="data\Allocating_LAU_to_NUTS3_1.1.2020.xlsx",
+    shapefile=os.path.join("shapefiles", "LAU shapefile", "LAU_RG_01M_2019_3035.shp"),
+    extract=None,
 ):
 
     """
@@ -254,21 +1321,96 @@ def create_initial_network_topology(
     country : String, optional
         Country code. The default is "AT".
     shapefile : String, optional
-        Includes the path to the shapefiles on the LAU level. The default is "shapefiles\LAU shapefile\LAU_RG_01M_2019_3035.shp".
+        Includes the path to the (EU-wide) shapefiles on the LAU level. Only
+        the LAUs of the country and their 'LAU_COLUMNS' are read, i.e., the
+        country filter and the columns are passed to the reading of the file.
+        The default is "shapefiles/LAU shapefile/LAU_RG_01M_2019_3035.shp".
+    extract : String, optional
+        Path of the GeoParquet file of the country, which is written at the
+        first reading of the shapefile. Later calls only read the extract as
+        long as it is newer than the shapefile (or the shapefile is not
+        available) and includes the 'LAU_COLUMNS'. The default is None, for
+        which the extract is stored next to the shapefile (e.g.,
+        'LAU_RG_01M_2019_3035.AT.parquet').
+
+    Returns
+    -------
+    laus : GeoDataFrame
+        Includes the 'LAU_COLUMNS' and geometries of the LAUs of the country.
+
+    """
+
+    import geopandas as gpd
+    import pyarrow.parquet as pq
+    import pyogrio
+
+    if extract is None:
+        extract = "{}.{}.parquet".format(os.path.splitext(shapefile)[0], country)
+
+    # Extracts of other columns (e.g., of an earlier version) are rebuilt
+    if (
+        os.path.exists(extract)
+        and (
+            not os.path.exists(shapefile)
+            or os.path.getmtime(extract) >= os.path.getmtime(shapefile)
+        )
+        and pq.read_schema(extract).names == LAU_COLUMNS + ["geometry"]
+    ):
+        return gpd.read_parquet(extract)
+
+    # The filtered attribute is read as well, since ignored attributes are
+    # empty within the filter
+    laus = pyogrio.read_dataframe(
+        shapefile,
+        columns=["CNTR_CODE"] + LAU_COLUMNS,
+        where="CNTR_CODE = '{}'".format(country),
+    ).drop(columns="CNTR_CODE")
+    laus.to_parquet(extract)
+
+    return laus
+
+
+def create_lau_geometries(
+    country="AT",
+    shapefile=os.path.join("shapefiles", "LAU shapefile", "LAU_RG_01M_2019_3035.shp"),
+    matching=os.path.join("data", "Allocating_LAU_to_NUTS3_1.1.2020.xlsx"),
+    districts=os.path.join(
+        "shapefiles", "Vienesse_districts", "ZAEHLBEZIRKOGDPolygon.shp"
+    ),
+    extract=None,
+):
+
+    """
+
+    Parameters
+    ----------
+    country : String, optional
+        Country code. The default is "AT".
+    shapefile : String, optional
+        Includes the path to the shapefiles on the LAU level, which are read
+        per country (see 'read_lau_shapefile'). The default is "shapefiles/LAU shapefile/LAU_RG_01M_2019_3035.shp".
     matching : String, optional
-        Includes the file that is used for the allocation of LAU level areas to the NUTS3 level. The default is "data\Allocating_LAU_to_NUTS3_1.1.2020.xlsx".
+        Includes the file that is used for the allocation of LAU level areas to the NUTS3 level. The default is "data/Allocating_LAU_to_NUTS3_1.1.2020.xlsx".
+    districts : String, optional
+        Includes the path to the shapefiles of the (counting) districts of
+        Vienna, which are dissolved to the districts.
+        The default is "shapefiles/Vienesse_districts/ZAEHLBEZIRKOGDPolygon.shp".
+    extract : String, optional
+        Path of the extract of the country (see 'read_lau_shapefile'), which
+        requires pyarrow. The default is None.
 
     Returns
     -------
-    Results : GeoDataFrame
-        Nodal centralized and decentralized heat generation (including geometry) on the LAU level. 
+    geometries : GeoDataFrame
+        Includes the 'region', its NUTS3 code, LAU_ID and geometry of the LAUs,
+        followed by the districts of Vienna (e.g., 'AT130|Wien|5').
 
     """
-    
-    eu_nuts3_regions = gpd.read_file(shapefile)
-    country_nuts3_regions = eu_nuts3_regions.loc[
-        eu_nuts3_regions["CNTR_CODE"] == country
-    ]
+
+    import geopandas as gpd
+    import pyogrio
+
+    country_nuts3_regions = read_lau_shapefile(country, shapefile, extract)
 
     mapping = pd.read_excel(matching)
     mapping.rename(columns={"Unnamed: 3": "LAU_NAME"}, inplace=True)
@@ -279,11 +1421,80 @@ def create_initial_network_topology(
         _lau_nuts3_at["Zuordnung NUTS 3 zu Gemeinden"] + "|" + _lau_nuts3_at["LAU_NAME"]
     )
 
-    _pop_small_sub_region = pd.read_excel("data\Population_on_LAU_level_in_2050.xlsx")
+    nuts3_at130 = pyogrio.read_dataframe(districts, columns=["BEZNR"])
+    _130 = nuts3_at130.dissolve(by="BEZNR").reset_index()
+    _130["region"] = "AT130|Wien|" + _130["BEZNR"].astype(int).apply(str)
+
+    _columns = ["region", "Zuordnung NUTS 3 zu Gemeinden", "LAU_ID", "geometry"]
+    geometries = gpd.GeoDataFrame(
+        pd.concat([_lau_nuts3_at, _130], ignore_index=True).reindex(
+            columns=_columns
+        ),
+        crs=country_nuts3_regions.crs,
+    )
+
+    return geometries
+
+
+def create_initial_network_topology(
+    country="AT",
+    shapefile=os.path.join("shapefiles", "LAU shapefile", "LAU_RG_01M_2019_3035.shp"),
+    matching=os.path.join("data", "Allocating_LAU_to_NUTS3_1.1.2020.xlsx"),
+    geometries=None,
+    generation=os.path.join(
+        "sequential-downscaling-results",
+        "results_centralized+decentralized_heat_generation.xlsx",
+    ),
+    population=os.path.join("data", "Population_on_LAU_level_in_2050.xlsx"),
+    districts_population=os.path.join("data", "Population_in_Vienesse_districts.xlsx"),
+):
+
+    """
+
+    Parameters
+    ----------
+    country : String, optional
+        Country code. The default is "AT".
+    shapefile : String, optional
+        Includes the path to the shapefiles on the LAU level. The default is "shapefiles/LAU shapefile/LAU_RG_01M_2019_3035.shp".
+    matching : String, optional
+        Includes the file that is used for the allocation of LAU level areas to the NUTS3 level. The default is "data/Allocating_LAU_to_NUTS3_1.1.2020.xlsx".
+    geometries : GeoDataFrame, optional
+        Includes the geometries as created by 'create_lau_geometries'. The
+        default is None, in which case they are created from the shapefiles.
+    generation : String, optional
+        Includes the path to the results of the sequential downscaling.
+        The default is "sequential-downscaling-results/results_centralized+decentralized_heat_generation.xlsx".
+    population : String, optional
+        Includes the path to the population per LAU code.
+        The default is "data/Population_on_LAU_level_in_2050.xlsx".
+    districts_population : String, optional
+        Includes the path to the relative share of the population of the
+        districts of Vienna.
+        The default is "data/Population_in_Vienesse_districts.xlsx".
+
+    Returns
+    -------
+    Results : GeoDataFrame
+        Nodal centralized and decentralized heat generation (including geometry) on the LAU level. 
+
+    """
+
+    import geopandas as gpd
+    import pyam
+
+    if geometries is None:
+        geometries = create_lau_geometries(country, shapefile, matching)
+
+    mapping = pd.read_excel(matching)
+    mapping.rename(columns={"Unnamed: 3": "LAU_NAME"}, inplace=True)
+    mapping.drop(labels=[0, 1, 2], axis=0, inplace=True)
+
+    _pop_small_sub_region = pd.read_excel(population)
     _pop_small_sub_region = _pop_small_sub_region.merge(
         mapping, left_on="region", right_on="Unnamed: 2"
     )
-    _val = _pop_small_sub_region.groupby(["Unnamed: 1"]).sum().reset_index()
+    _val = _pop_small_sub_region.groupby(["Unnamed: 1"])[[2050]].sum().reset_index()
 
     _val = _val.merge(mapping, on="Unnamed: 1")
     _val = _val[[2050, "Zuordnung NUTS 3 zu Gemeinden"]].drop_duplicates()
@@ -298,10 +1509,7 @@ def create_initial_network_topology(
     _population["Share"] = _population[2050] / _population["Total population"]
     _population.drop(labels=2050, axis=1, inplace=True)
 
-    RESULTS_FOLDER = Path("sequential-downscaling-results")  
-    _generation = pd.read_excel(
-        RESULTS_FOLDER / "results_centralized+decentralized_heat_generation.xlsx"
-    )
+    _generation = pd.read_excel(generation)
 
     full_data_set = _population.merge(
         _generation, left_on="Zuordnung NUTS 3 zu Gemeinden", right_on="Region"
@@ -318,7 +1526,7 @@ def create_initial_network_topology(
     _share = pyam.IamDataFrame(full_data_set)
     # _share.to_excel("lau_share_gen_pop.xlsx", iamc_index=False, include_meta=False)
 
-    _rel_at130 = pyam.IamDataFrame("data\Population_in_Vienesse_districts.xlsx")
+    _rel_at130 = pyam.IamDataFrame(districts_population)
     _share.append(_rel_at130, inplace=True)
     _130 = _share.downscale_region(
         variable=["Centralized", "Decentralized"],
@@ -327,41 +1535,71 @@ def create_initial_network_topology(
     )
     _share.append(_130, inplace=True)
 
-    values = _share.data.merge(_lau_nuts3_at, on="region")
-    nuts3_at130 = gpd.read_file("shapefiles\Vienesse_districts\ZAEHLBEZIRKOGDPolygon.shp")
-    _130 = nuts3_at130.dissolve(by="BEZNR", aggfunc="sum").reset_index()
-    _130["region"] = "AT130|Wien|" + _130["BEZNR"].astype(int).apply(str)
-    new_val = _share.data.merge(_130, on="region")
-    Results = values.append(new_val)
-    Results = gpd.GeoDataFrame(Results)
-    Results.drop(
-        [
-            "LAU_NAME",
-            "Unnamed: 1",
-            "Unnamed: 2",
-            "GISCO_ID",
-            "CNTR_CODE",
-            "POP_2019",
-            "POP_DENS_2",
-            "AREA_KM2",
-            "YEAR",
-            "FID",
-            "BEZNR",
-            "ZBEZNR",
-            "FLAECHE",
-            "UMFANG",
-            "SE_SDO_ROW",
-        ],
-        axis=1,
-        inplace=True,
-    )
+    # The LAUs are followed by the districts of Vienna (as in the geometries)
+    _districts = geometries["region"].str.count(r"\|") > 1
+    values = _share.data.merge(geometries.loc[~_districts], on="region")
+    new_val = _share.data.merge(geometries.loc[_districts], on="region")
+    Results = gpd.GeoDataFrame(pd.concat([values, new_val]), crs=geometries.crs)
     Results.rename(
         columns={"Zuordnung NUTS 3 zu Gemeinden": "NUTS3_CODE"}, inplace=True
     )
     return Results
 
 
-def create_connection_lines(shapefile=None, subregion=None, scenario=None):
+def create_population_index(
+    nodes=None,
+    population=os.path.join("data", "Population_on_LAU_level_in_2050.xlsx"),
+    matching=os.path.join("data", "Allocating_LAU_to_NUTS3_1.1.2020.xlsx"),
+):
+
+    """
+
+    Parameters
+    ----------
+    nodes : list, required
+        Includes the names of the nodes (e.g., 'AT127|Achau' or 'AT130|Wien|5').
+        The default is None.
+    population : String, optional
+        Includes the path to the population per LAU code.
+        The default is "data/Population_on_LAU_level_in_2050.xlsx".
+    matching : String, optional
+        Includes the file that is used for the allocation of LAU level areas to
+        the NUTS3 level and their LAU codes.
+        The default is "data/Allocating_LAU_to_NUTS3_1.1.2020.xlsx".
+
+    Returns
+    -------
+    population_index : dict
+        Population per node. Districts of Vienna are assigned the population
+        of Vienna, since the population is only available on the LAU level.
+
+    """
+
+    _population = pd.read_excel(population)
+    mapping = pd.read_excel(matching)
+    mapping = mapping.drop(labels=[0, 1, 2], axis=0).dropna()
+
+    # The LAU names are not unique in Austria (e.g., Krumbach), but they are
+    # together with the NUTS3 code, which is also part of the node name.
+    _lau_code = dict(
+        zip(
+            mapping["Zuordnung NUTS 3 zu Gemeinden"] + "|" + mapping["Unnamed: 3"],
+            mapping["Unnamed: 2"].astype(int),
+        )
+    )
+    registry = create_region_registry(nodes, lau_codes=_lau_code)
+    _pop = registry["LAU_CODE"].map(
+        _population.drop_duplicates("region", keep="last").set_index("region")[2050]
+    )
+
+    population_index = _pop.dropna().to_dict()
+
+    return population_index
+
+
+def create_connection_lines(
+    shapefile=None, subregion=None, scenario=None, derivatives=None
+):
 
     """
 
@@ -373,50 +1611,57 @@ def create_connection_lines(shapefile=None, subregion=None, scenario=None):
         Includes the name of the sub-region. The default is None.
     scenario : String, required
         Includes the name of the scenario. The default is None.
+    derivatives : GeoDataFrame, optional
+        Includes the centroids and bounding boxes of (at least) the nodes of
+        the sub-region (see 'read_geometry_derivatives'). The default is
+        None, in which case they are computed from the nodes.
 
     Returns
     -------
     all_lines : Shapefile
-        Includes the available connection lines.
+        Includes the available connection lines, i.e., the lines between the
+        centroids of nodes with a shared boundary.
 
     """
 
-    # shapefile["unit"] = "GWh"
-    # shapefile["value"] *= 1000
+    import geopandas as gpd
+    import shapely
 
     _var = shapefile.loc[
         (shapefile["NUTS3_CODE"] == subregion)
         & (shapefile["scenario"] == scenario)
         & (shapefile["variable"] == "Centralized")
     ]
+    if derivatives is None:
+        derivatives = create_geometry_derivatives(_var)
+
+    _regions = _var["region"].to_numpy()
+    _polygons = np.asarray(_var.geometry.values)
+    _centroids = derivatives.loc[_regions, ["x", "y"]].to_numpy()
+
+    # Only the polygons of nodes with overlapping bounding boxes are intersected
+    _start, _end = find_overlapping_bounds(derivatives, _regions).T
+    _shared = shapely.length(shapely.intersection(_polygons[_start], _polygons[_end]))
+    _start, _end = _start[_shared > 0], _end[_shared > 0]
+    if len(_start) == 0:
+        raise ValueError(
+            "No connection lines in {} ({})".format(subregion, scenario)
+        )
 
-    _centroids = _var.centroid.to_frame()
-    _centroids["value"] = _var.value
-    centroids = gpd.GeoDataFrame(_centroids)
-    centroids.rename(columns={0: "geometry"}, inplace=True)
-
-    _geo_series_lines = None
-
-    _comb = list(combinations(centroids.index, 2))
-
-    for _c in _comb:
-        _a1 = gpd.GeoSeries(_var.loc[_c[0]].geometry)
-        _a2 = gpd.GeoSeries(_var.loc[_c[1]].geometry)
-        _p = _a1.centroid
-        _p = _p.append(_a2.centroid)
-
-        _intersec = _a1.intersection(_a2).length
-        _con = gpd.GeoSeries(_p.unary_union.convex_hull)
-
-        if _intersec.values[0] > 0:
-            _con = gpd.GeoDataFrame(_con)
-            _con["START"] = _var.loc[_c[0]].region
-            _con["END"] = _var.loc[_c[1]].region
-            if _geo_series_lines is None:
-                _geo_series_lines = _con
-            else:
-                _geo_series_lines = _geo_series_lines.append(_con)
-
-    all_lines = _geo_series_lines.rename(columns={0: "geometry"})
+    # The lines run from the lower to the higher centroid (by x, then y), as
+    # the convex hull of both centroids
+    _points = np.stack([_centroids[_start], _centroids[_end]], axis=1)
+    _x, _y = _points[:, :, 0], _points[:, :, 1]
+    _swap = (_x[:, 0] > _x[:, 1]) | ((_x[:, 0] == _x[:, 1]) & (_y[:, 0] > _y[:, 1]))
+    _points[_swap] = _points[_swap, ::-1]
+    all_lines = gpd.GeoDataFrame(
+        {
+            "geometry": shapely.linestrings(_points),
+            "START": _regions[_start],
+            "END": _regions[_end],
+        },
+        geometry="geometry",
+        crs=shapefile.crs,
+    )
 
     return all_lines
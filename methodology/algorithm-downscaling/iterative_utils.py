@@ -0,0 +1,245 @@
+import networkx as nx
+import numpy as np
+
+
+def make_networkx_from_shapefile(connection=None):
+
+    """
+
+    Parameters
+    ----------
+    connection : Shapefile, required
+        Includes the available connection lines between nodes. Each line is
+        only needed once, since the graph is undirected.
+        The default is None.
+
+    Returns
+    -------
+    graph : Networkx
+        Initial graph with connection lines.
+
+    """
+
+    graph = nx.Graph()
+    graph.add_weighted_edges_from(
+        zip(connection["END"], connection["START"], connection.geometry.length)
+    )
+    return graph
+
+
+def add_quantities_to_nodes(graph=None, quantities=None):
+
+    """
+
+    Parameters
+    ----------
+    graph : Networkx, required
+        The default is None.
+    quantities : Shapefile, required
+        Includes the amount of centralized and decentralized heat generation.
+        Each node requires exactly one value per type; otherwise, all missing
+        and duplicated regions are reported in a ValueError.
+        The default is None.
+
+    Returns
+    -------
+    graph : Networkx
+        The graph with centralized and decentralized heat generation per node.
+
+    """
+
+    _types = ["Centralized", "Decentralized"]
+    _quantities = quantities.loc[
+        quantities.variable.isin(_types) & quantities.region.isin(graph.nodes)
+    ]
+
+    _duplicated = _quantities.duplicated(subset=["region", "variable"], keep=False)
+    _values = (
+        _quantities.loc[~_duplicated]
+        .pivot(index="region", columns="variable", values="value")
+        .reindex(index=list(graph.nodes), columns=_types)
+    )
+    _missing = _values.index[_values.isna().any(axis=1)]
+
+    if _duplicated.any() or len(_missing) > 0:
+        _duplicated_regions = list(_quantities.loc[_duplicated, "region"].unique())
+        raise ValueError(
+            "Quantities of nodes are missing ({}) or duplicated ({})".format(
+                list(_missing.difference(_duplicated_regions)), _duplicated_regions
+            )
+        )
+
+    for _type in _types:
+        nx.set_node_attributes(graph, _values[_type].astype(float).to_dict(), _type)
+
+    return graph
+
+
+def calculate_cluster_structure(graph=None, nodes=None):
+
+    """
+
+    Parameters
+    ----------
+    graph : Networkx, required
+        Includes the graph with connection lines.
+        The default is None.
+    nodes : list, optional
+        Includes the nodes for which the structure is calculated. Since the
+        structure of a node only depends on its neighbours, it only needs to
+        be updated for the neighbours of a removed node.
+        The default is None, which corresponds to all nodes of the graph.
+
+    Returns
+    -------
+    structure : dict
+        Share of the pairs of neighbours that are connected themselves per
+        node (zero for nodes with less than two neighbours).
+
+    """
+
+    structure = dict()
+    if nodes is None:
+        nodes = graph._node.keys()
+
+    for key in nodes:
+        # e.g., key = AT127|Achau
+        _alpha = dict()
+        for node1 in graph._adj[key]:
+            # e.g., node1 == AT127|Biedermannsdorf
+            # Biedermannsdorf, Hennersdorf, Himberg, Laxenburg, Leopoldsdorf, Maria-Lanzendorf, Münchendorf
+            for node2 in graph._adj[node1]:
+                # e.g., Achau, Guntramsdorf, Hennersdorf, Laxenburg, Vösendorf, Wiender Neudorf
+                if key in graph._adj[node2]:
+                    _alpha[node1, node2] = 1
+
+        number = len(_alpha.keys())
+        m = len(graph._adj[key])
+        if m > 1:
+            structure[key] = number / (m * (m - 1))
+        else:
+            structure[key] = 0
+
+    return structure
+
+
+def calculate_cluster_coefficient(graph=None, structure=None, max_quantity=None):
+
+    """
+
+    Parameters
+    ----------
+    graph : Networkx, required
+        Includes the graph with heat generation quantities (centralized and decentralized) and connection lines.
+        The default is None.
+    structure : dict, optional
+        Includes the structure per node as calculated by
+        'calculate_cluster_structure'.
+        The default is None, in which case it is calculated for all nodes.
+    max_quantity : float, optional
+        Maximum centralized heat generation, to which the quantities are
+        related (e.g., of the whole graph for one of its components).
+        The default is None, in which case the maximum of the graph is used.
+
+    Returns
+    -------
+    Results : dict
+        Value of the cluster coefficient per node.
+
+    """
+
+    results = dict()
+    if max_quantity is None:
+        max_quantity = max(
+            graph._node[key]["Centralized"] for key in graph._node.keys()
+        )
+    if structure is None:
+        structure = calculate_cluster_structure(graph)
+
+    for key in graph._node.keys():
+        m = len(graph._adj[key])
+        q = graph._node[key]["Centralized"]
+        if m > 1:
+            results[key] = (q / max_quantity) * structure[key]
+        else:
+            results[key] = 0
+
+    return results
+
+
+def calculate_distance_coefficient(graph=None):
+
+    """
+
+    Parameters
+    ----------
+    graph : Networkx, required
+        Includes a graph with nodes, lines and centralized/decentralized heat quantities.
+        The default is None.
+
+    Returns
+    -------
+    results : dict
+        Includes the value of the distance coefficient per node.
+
+    """
+
+    results = dict()
+    distances = dict()
+
+    for node1 in graph._node.keys():
+        distances[node1] = 0
+        for node2 in graph._node.keys():
+            if nx.has_path(graph, source=node1, target=node2):
+                _d = nx.single_source_dijkstra(
+                    graph, source=node1, target=node2, weight="weight"
+                )
+                if _d[0] > distances[node1]:
+                    distances[node1] = _d[0]
+                else:
+                    distances[node1] = np.inf
+
+        results[node1] = 1 / (2 * distances[node1])
+    min_distance = min(distances[node] for node in distances.keys())
+    max_quantity = max(
+        graph._node[node]["Decentralized"] for node in graph._node.keys()
+    )
+
+    for key in results.keys():
+        results[key] *= min_distance
+        results[key] *= graph._node[key]["Centralized"]
+        results[key] *= 1 / max_quantity
+
+    return
+
+
+def calculate_total_indicator_value(
+    cluster_coefficient=None, distance_coefficient=None
+):
+
+    """
+
+    Parameters
+    ----------
+    cluster_coefficient : dict, required
+        Includes the cluster coefficient value per node.
+        The default is None.
+    distance_coefficient : TYPE, optional
+        Includes the distance coefficient value per node.
+        The default is None.
+
+    Returns
+    -------
+    results : dict
+        Includes the calculated total indicator value per node.
+
+    """
+
+    results = dict()
+
+    for key in cluster_coefficient.keys():
+        results[key] = cluster_coefficient[key]
+        # results[key] = cluster_coefficient[key] + distance_coefficient[key]
+        # Only the cluster coefficient is used for the benchmark.
+        # The distance coefficient will be considered in future work.
+    return results
@@ -0,0 +1,343 @@
+import hashlib
+import importlib
+import inspect
+import json
+import logging
+import os
+
+import networkx as nx
+
+import profiling
+
+
+logger = logging.getLogger(__name__)
+
+# The content hashes of the stages (and a cache of the file hashes) are kept in
+# this file, so that a stage only reruns if its inputs or parameters changed.
+STATE_FILE = ".pipeline-state.json"
+
+# Excel files include the time of writing, so they are hashed by their values
+# (otherwise, each rerun of a stage would invalidate all following stages).
+VALUE_HASHED_FORMATS = [".xlsx", ".xls"]
+
+# Shapefiles are hashed together with their companion files
+SHAPEFILE_COMPANIONS = [".shx", ".dbf", ".prj", ".cpg"]
+
+
+def create_stage(
+    name=None,
+    function=None,
+    inputs=None,
+    outputs=None,
+    parameters=None,
+    modules=None,
+):
+
+    """
+
+    Parameters
+    ----------
+    name : String, required
+        Unique name of the stage. The default is None.
+    function : function, required
+        Function of the stage, which is called with the inputs, outputs and
+        parameters as keyword arguments. The default is None.
+    inputs : dict, optional
+        Includes the path per input file or folder (keyword argument).
+        Inputs, which are outputs of other stages, make the stage depend on
+        these stages. The default is None.
+    outputs : dict, optional
+        Includes the path per output file or folder (keyword argument).
+        The default is None.
+    parameters : dict, optional
+        Includes further (JSON serializable) keyword arguments.
+        The default is None.
+    modules : list, optional
+        Includes the names of the modules, on which the function depends
+        (e.g., the algorithm behind a thin wrapper). Their source code is
+        hashed with the function, so that a change of the algorithm reruns
+        the stage. The default is None.
+
+    Returns
+    -------
+    stage : dict
+        Includes the stage for 'run_pipeline'.
+
+    """
+
+    stage = {
+        "name": name,
+        "function": function,
+        "inputs": {_k: str(_v) for _k, _v in (inputs or {}).items()},
+        "outputs": {_k: str(_v) for _k, _v in (outputs or {}).items()},
+        "parameters": dict(parameters or {}),
+        "modules": sorted(modules or []),
+    }
+
+    return stage
+
+
+def hash_file(path=None, cache=None):
+
+    """
+
+    Parameters
+    ----------
+    path : String, required
+        Path of the file or folder. The default is None.
+    cache : dict, optional
+        Includes the size, modification time and hash of previously hashed
+        files, which is updated. Files with the same size and modification
+        time are not read again. The default is None.
+
+    Returns
+    -------
+    digest : String or None
+        SHA-256 hash of the content (None, if the path does not exist).
+        Folders are hashed by the relative paths and hashes of their files,
+        Excel files by the values of their sheets and shapefiles together
+        with their companion files.
+
+    """
+
+    if cache is None:
+        cache = dict()
+
+    if os.path.isdir(path):
+        _hash = hashlib.sha256()
+        for _root, _folders, _files in os.walk(path):
+            _folders.sort()
+            for _file in sorted(_files):
+                _path = os.path.join(_root, _file)
+                _hash.update(os.path.relpath(_path, path).encode())
+                _hash.update(hash_file(_path, cache).encode())
+        return _hash.hexdigest()
+
+    if not os.path.isfile(path):
+        return None
+
+    digest = _hash_content(path, cache)
+    if os.path.splitext(path)[1].lower() == ".shp":
+        _hash = hashlib.sha256(digest.encode())
+        for _suffix in SHAPEFILE_COMPANIONS:
+            _companion = os.path.splitext(path)[0] + _suffix
+            if os.path.isfile(_companion):
+                _hash.update(_suffix.encode())
+                _hash.update(_hash_content(_companion, cache).encode())
+        digest = _hash.hexdigest()
+
+    return digest
+
+
+def _hash_content(path=None, cache=None):
+    _stat = os.stat(path)
+    _key = os.path.abspath(path)
+    if _key in cache and cache[_key][:2] == [_stat.st_size, _stat.st_mtime_ns]:
+        return cache[_key][2]
+
+    _hash = hashlib.sha256()
+    if os.path.splitext(path)[1].lower() in VALUE_HASHED_FORMATS:
+        import pandas as pd
+
+        for _name, _sheet in pd.read_excel(path, sheet_name=None).items():
+            _hash.update(_name.encode())
+            _hash.update(_sheet.to_csv().encode())
+    else:
+        with open(path, "rb") as _file:
+            for _chunk in iter(lambda: _file.read(2**20), b""):
+                _hash.update(_chunk)
+
+    digest = _hash.hexdigest()
+    cache[_key] = [_stat.st_size, _stat.st_mtime_ns, digest]
+
+    return digest
+
+
+def order_stages(stages=None):
+
+    """
+
+    Parameters
+    ----------
+    stages : list, required
+        Includes the stages as created by 'create_stage'. The default is None.
+
+    Returns
+    -------
+    order : list
+        Includes the stages in the order of their dependencies. Stages
+        without dependencies between them keep the order of 'stages'.
+        Cyclic dependencies are reported in a ValueError.
+
+    """
+
+    _names = [_stage["name"] for _stage in stages]
+    if len(set(_names)) < len(_names):
+        raise ValueError("Names of stages are not unique ({})".format(_names))
+
+    _producers = [
+        (os.path.abspath(_path), _stage["name"])
+        for _stage in stages
+        for _path in _stage["outputs"].values()
+    ]
+
+    _graph = nx.DiGraph()
+    _graph.add_nodes_from(_names)
+    for _stage in stages:
+        for _path in map(os.path.abspath, _stage["inputs"].values()):
+            for _output, _name in _producers:
+                # Inputs can also be files within an output folder
+                if _path == _output or _path.startswith(_output + os.sep):
+                    _graph.add_edge(_name, _stage["name"])
+    _graph.remove_edges_from(nx.selfloop_edges(_graph))
+
+    try:
+        _generations = list(nx.topological_generations(_graph))
+    except nx.NetworkXUnfeasible:
+        raise ValueError(
+            "Stages depend on each other ({})".format(
+                [_edge[0] for _edge in nx.find_cycle(_graph)]
+            )
+        )
+
+    order = [
+        stages[_names.index(_name)]
+        for _generation in _generations
+        for _name in sorted(_generation, key=_names.index)
+    ]
+
+    return order
+
+
+def hash_stage(stage=None, cache=None):
+
+    """
+
+    Parameters
+    ----------
+    stage : dict, required
+        Includes the stage as created by 'create_stage'. The default is None.
+    cache : dict, optional
+        Includes the cache of the file hashes (see 'hash_file').
+        The default is None.
+
+    Returns
+    -------
+    digest : String
+        SHA-256 hash of the source code of the stage function and of its
+        declared modules, the parameters and the content of the inputs.
+        Code, which the function calls from other (not declared) modules,
+        is not part of the hash.
+
+    """
+
+    try:
+        _source = inspect.getsource(stage["function"])
+    except (OSError, TypeError):
+        _source = getattr(
+            stage["function"], "__qualname__", repr(stage["function"])
+        )
+
+    _content = {
+        "function": _source,
+        "modules": {
+            _module: hash_file(
+                inspect.getsourcefile(importlib.import_module(_module)), cache
+            )
+            for _module in stage.get("modules", [])
+        },
+        "parameters": stage["parameters"],
+        "inputs": {
+            _name: hash_file(_path, cache)
+            for _name, _path in sorted(stage["inputs"].items())
+        },
+    }
+    digest = hashlib.sha256(
+        json.dumps(_content, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+    return digest
+
+
+def run_pipeline(stages=None, state=STATE_FILE, force=None):
+
+    """
+
+    Parameters
+    ----------
+    stages : list, required
+        Includes the stages as created by 'create_stage'. The default is None.
+    state : String, optional
+        Path of the file with the hashes of the last runs.
+        The default is ".pipeline-state.json".
+    force : list, optional
+        Includes the names of stages that are run in any case.
+        The default is None.
+
+    Returns
+    -------
+    status : dict
+        Includes per stage (in the order of execution) whether it was 'run'
+        or 'skipped'. A stage is skipped if the hash of its function,
+        parameters and inputs equals the last run and its outputs are
+        unchanged. Stages, whose inputs were rewritten with the same content,
+        are skipped as well. Only the source of the function and of the
+        modules declared in the stage is hashed: a change of any other code
+        requires to 'force' the affected stages.
+
+    """
+
+    _state = {"files": dict(), "stages": dict()}
+    if state is not None and os.path.exists(state):
+        with open(state, "r", encoding="utf-8") as _file:
+            _state = json.load(_file)
+    _cache = _state["files"]
+
+    status = dict()
+    for _stage in order_stages(stages):
+        _name = _stage["name"]
+        _hash = hash_stage(_stage, _cache)
+        _last = _state["stages"].get(_name, dict())
+
+        _unchanged = _last.get("hash") == _hash and all(
+            hash_file(_path, _cache) == _last.get("outputs", dict()).get(_path)
+            for _path in _stage["outputs"].values()
+        )
+        if _unchanged and _name not in (force or []):
+            logger.info("Skip stage {} (unchanged)".format(_name))
+            status[_name] = "skipped"
+            continue
+
+        logger.info("Run stage {}".format(_name))
+        for _path in _stage["outputs"].values():
+            os.makedirs(os.path.dirname(os.path.abspath(_path)), exist_ok=True)
+        with profiling.stage(_name):
+            _stage["function"](
+                **_stage["inputs"], **_stage["outputs"], **_stage["parameters"]
+            )
+        status[_name] = "run"
+
+        _state["stages"][_name] = {
+            "hash": _hash,
+            "outputs": {
+                _path: hash_file(_path, _cache)
+                for _path in _stage["outputs"].values()
+            },
+        }
+        # The state is written after every stage, so that an interrupted
+        # pipeline does not repeat the completed stages
+        _write_state(state, _state)
+
+    # The hashes of skipped stages are cached as well
+    _write_state(state, _state)
+
+    return status
+
+
+def _write_state(path=None, state=None):
+    if path is None:
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as _file:
+        json.dump(state, _file, indent=2)
+    os.replace(path + ".tmp", path)
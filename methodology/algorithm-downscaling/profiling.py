@@ -0,0 +1,263 @@
+import argparse
+import atexit
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import count
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Profiling is switched on by setting DOWNSCALING_PROFILE to the path of the
+# JSON lines file (or by the '--profile' flag of the run scripts). If
+# DOWNSCALING_CPROFILE is set as well (or '--cprofile'), a cProfile of all
+# stages is written to this path (pstats format, e.g., for snakeviz).
+PROFILE_VARIABLE = "DOWNSCALING_PROFILE"
+CPROFILE_VARIABLE = "DOWNSCALING_CPROFILE"
+
+ENABLED = False
+
+# Interval (in s) of sampling the resident set size during the stages
+SAMPLE_INTERVAL = 0.01
+
+_file = None
+_profiler = None
+
+# The stages are nested per thread, whereas the file, the cProfile and the
+# memory peaks of the open stages are shared (and guarded by the lock)
+_local = threading.local()
+_lock = threading.Lock()
+_owner = None
+_peaks = dict()
+_keys = count()
+_sampler = None
+
+
+def configure(profile=None, cprofile=None, arguments=None):
+
+    """
+
+    Parameters
+    ----------
+    profile : String, optional
+        Path of the JSON lines file. The default is None, which corresponds
+        to the '--profile' argument or the environment variable
+        DOWNSCALING_PROFILE.
+    cprofile : String, optional
+        Path of the cProfile output. The default is None, which corresponds
+        to the '--cprofile' argument or the environment variable
+        DOWNSCALING_CPROFILE.
+    arguments : list, optional
+        Includes the command line arguments. The default is None (sys.argv).
+
+    Returns
+    -------
+    enabled : bool
+        Whether profiling is switched on.
+
+    """
+
+    global ENABLED, _file, _profiler
+
+    _parser = argparse.ArgumentParser(add_help=False)
+    _parser.add_argument("--profile", default=None)
+    _parser.add_argument("--cprofile", default=None)
+    _args, _ = _parser.parse_known_args(
+        sys.argv[1:] if arguments is None else arguments
+    )
+
+    profile = profile or _args.profile or os.environ.get(PROFILE_VARIABLE)
+    cprofile = cprofile or _args.cprofile or os.environ.get(CPROFILE_VARIABLE)
+
+    if profile and _file is None:
+        _file = open(profile, "a", encoding="utf-8")
+        atexit.register(_file.close)
+        ENABLED = True
+
+    if ENABLED and cprofile and _profiler is None:
+        _profiler = cProfile.Profile()
+        atexit.register(_profiler.dump_stats, cprofile)
+
+    return ENABLED
+
+
+def max_rss():
+
+    """
+
+    Returns
+    -------
+    high_water_mark : float or None
+        Includes the maximum resident set size of the process since its start
+        in MB (None, if not available on the platform). It is not reset
+        between stages.
+
+    """
+
+    if resource is None:
+        return None
+    _peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return _peak / 1024**2 if sys.platform == "darwin" else _peak / 1024
+
+
+def current_memory():
+
+    """
+
+    Returns
+    -------
+    memory : float or None
+        Includes the current resident set size of the process in MB (None,
+        if not available on the platform).
+
+    """
+
+    try:
+        with open("/proc/self/statm") as _statm:
+            _pages = int(_statm.read().split()[1])
+        return _pages * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except (OSError, AttributeError, IndexError, ValueError):
+        return None
+
+
+def _sample():
+
+    # Raises the memory peak of all open stages (of all threads)
+    while True:
+        time.sleep(SAMPLE_INTERVAL)
+        _memory = current_memory()
+        with _lock:
+            for _key, _peak in _peaks.items():
+                _peaks[_key] = max(_peak, _memory)
+
+
+def _stack():
+
+    if not hasattr(_local, "stages"):
+        _local.stages = list()
+    return _local.stages
+
+
+def record(stage=None, **values):
+
+    """
+
+    Parameters
+    ----------
+    stage : String, required
+        Name of the stage or event. The default is None.
+    **values
+        Includes further values (e.g., counts) of the record.
+
+    Returns
+    -------
+    None.
+
+    """
+
+    if not ENABLED:
+        return
+
+    _record = {"stage": "/".join(_stack() + [stage]), "pid": os.getpid()}
+    _record.update(values)
+    _line = json.dumps(_record) + "\n"
+    with _lock:
+        _file.write(_line)
+        _file.flush()
+
+    return
+
+
+@contextmanager
+def _measure(name=None, counts=None):
+
+    global _owner, _sampler
+
+    _stages = _stack()
+    _memory = current_memory()
+    _key = next(_keys)
+    with _lock:
+        # The cProfile is only switched on/off by the outermost stage of the
+        # first thread, which enters a stage (the others are not profiled)
+        _outermost = _profiler is not None and _owner is None and not _stages
+        if _outermost:
+            _owner = threading.get_ident()
+        if _memory is not None:
+            _peaks[_key] = _memory
+            if _sampler is None:
+                _sampler = threading.Thread(target=_sample, daemon=True)
+                _sampler.start()
+    _stages.append(name)
+    _start = datetime.now().isoformat(timespec="milliseconds")
+    _wall = time.perf_counter()
+    _cpu = time.process_time()
+    if _outermost:
+        _profiler.enable()
+    try:
+        yield counts
+    finally:
+        if _outermost:
+            _profiler.disable()
+        _wall = time.perf_counter() - _wall
+        _cpu = time.process_time() - _cpu
+        _memory = current_memory()
+        with _lock:
+            if _outermost:
+                _owner = None
+            _peak = _peaks.pop(_key, None)
+        _stages.pop()
+        record(
+            name,
+            start=_start,
+            wall=_wall,
+            cpu=_cpu,
+            peak_memory=None if _peak is None else max(_peak, _memory),
+            max_rss=max_rss(),
+            **counts
+        )
+
+
+@contextmanager
+def _disabled(counts=None):
+    yield counts
+
+
+def stage(name=None, **counts):
+
+    """
+
+    Parameters
+    ----------
+    name : String, required
+        Name of the stage. Nested stages are recorded as 'outer/inner'.
+        The default is None.
+    **counts
+        Includes item counts of the stage (e.g., regions=...). Counts, which
+        are only known at the end of the stage, can be added to the yielded
+        dict.
+
+    Returns
+    -------
+    context : context manager
+        Records wall time, CPU time, peak memory and the counts of the stage,
+        if profiling is switched on (otherwise, nothing is measured). The
+        peak memory is the largest resident set size (in MB) sampled during
+        the stage, 'max_rss' the high-water mark of the process.
+
+    """
+
+    if not ENABLED:
+        return _disabled(counts)
+    return _measure(name, counts)
+
+
+configure(arguments=[])
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+# Regions are named by their NUTS3 code and LAU name (e.g., 'AT127|Achau'),
+# the districts of Vienna additionally by their number (e.g., 'AT130|Wien|5').
+# These names are only used at the input/output of the algorithms, which
+# internally refer to the regions by the integer ids of a region registry.
+SEPARATOR = "|"
+
+
+def create_region_registry(regions=None, lau_codes=None):
+
+    """
+
+    Parameters
+    ----------
+    regions : list, required
+        Includes the names of the regions (e.g., 'AT127|Achau' or
+        'AT130|Wien|5'). Duplicates are only registered once.
+        The default is None.
+    lau_codes : dict, optional
+        Includes the LAU code per LAU ('NUTS3|LAU name'). The default is None.
+
+    Returns
+    -------
+    registry : DataFrame
+        One row per region, indexed by the name of the region. The position
+        of a row is the integer id of the region (in the order of the first
+        occurrence in 'regions'). The columns include the 'NUTS3_CODE', the
+        'LAU_NAME', the 'district' (None for regions other than districts)
+        and the 'LAU_CODE' (-1 if not available).
+
+    """
+
+    _regions = pd.Index(pd.unique(np.asarray(regions, dtype=object)), name="region")
+    _parts = (
+        pd.Series(_regions, index=_regions, dtype=object)
+        .str.split(SEPARATOR, n=2, expand=True)
+        .reindex(columns=range(3))
+    )
+
+    registry = pd.DataFrame(
+        {
+            "NUTS3_CODE": _parts[0],
+            "LAU_NAME": _parts[1],
+            "district": _parts[2].where(_parts[2].notna(), None),
+        },
+        index=_regions,
+    )
+
+    _lau = registry["NUTS3_CODE"] + SEPARATOR + registry["LAU_NAME"]
+    registry["LAU_CODE"] = (
+        _lau.map(lau_codes if lau_codes is not None else dict())
+        .fillna(-1)
+        .astype(np.int64)
+    )
+
+    return registry
+
+
+def encode_regions(registry=None, regions=None):
+
+    """
+
+    Parameters
+    ----------
+    registry : DataFrame, required
+        Region registry as created by 'create_region_registry'.
+        The default is None.
+    regions : list, required
+        Includes the names of the regions. The default is None.
+
+    Returns
+    -------
+    ids : ndarray
+        Includes the integer id per region. Regions, which are not part of
+        the registry, are reported in a ValueError.
+
+    """
+
+    ids = registry.index.get_indexer(regions)
+
+    if (ids < 0).any():
+        raise ValueError(
+            "Regions are not part of the registry ({})".format(
+                list(pd.unique(np.asarray(regions, dtype=object)[ids < 0]))
+            )
+        )
+
+    return ids.astype(np.int64)
+
+
+def decode_regions(registry=None, ids=None):
+
+    """
+
+    Parameters
+    ----------
+    registry : DataFrame, required
+        Region registry as created by 'create_region_registry'.
+        The default is None.
+    ids : list, required
+        Includes the integer ids of the regions. The default is None.
+
+    Returns
+    -------
+    regions : Index
+        Includes the name per region id.
+
+    """
+
+    return registry.index[np.asarray(ids, dtype=np.int64)]
@@ -1,7 +1,22 @@
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
 from iterative_downscaling import *
 
+import profiling
+
 
-def run_iterative_downscaling(country=None, NUTS3=None, scenario=None):
+def run_iterative_downscaling(
+    country=None,
+    NUTS3=None,
+    scenario=None,
+    population_index=None,
+    results=None,
+    writer=None,
+    network=None,
+    derivatives=None,
+    run_id=None,
+):
 
     """
 
@@ -11,37 +26,145 @@ def run_iterative_downscaling(country=None, NUTS3=None, scenario=None):
         NUTS0 country code (e.g., AT for Austria). The default is 'AT'.
     NUTS3 : String, required
         NUTS3 sub-region code. The default is None.
+    scenario : String, required
+        Name of the scenario. The default is None.
+    population_index : dict, optional
+        Population per node as created by 'create_population_index'. If not
+        passed, the index is created for all nodes of the country.
+        The default is None.
+    results : String, optional
+        Path of a GeoPackage ('.gpkg') or GeoParquet dataset, to which the run
+        is appended (see 'write_results'). If not passed, the results are
+        written to a separate results folder. The default is None.
+    writer : ThreadPoolExecutor, optional
+        Executor on which the results are written, so that writing overlaps
+        with the next run. The default is None (written directly).
+    network : GeoDataFrame, optional
+        Includes the initial network topology as created by
+        'create_initial_network_topology' (at least of the NUTS3 sub-region).
+        The default is None, in which case it is created for the country.
+    derivatives : GeoDataFrame, optional
+        Includes the derivatives of the geometries of (at least) the nodes of
+        the sub-region (see 'read_geometry_derivatives'). The default is None,
+        in which case they are computed from the network topology.
+    run_id : String, optional
+        Identifies the run in the 'results' (see 'write_results'). The default
+        is None, in which case the time of the run (in seconds) and a random
+        suffix are used, so that runs within the same second do not collide.
 
     Returns
     -------
-    None.
+    future : Future or None
+        Includes the pending write of the results, if a writer is passed.
 
     """
 
-    european_network = create_initial_network_topology(country=country)
+    if network is None:
+        with profiling.stage("create_initial_network_topology") as _counts:
+            network = create_initial_network_topology(country=country)
+            _counts["regions"] = network["region"].nunique()
+    european_network = network
     select_subregion = european_network.loc[
         (european_network["NUTS3_CODE"] == NUTS3)
         & (european_network["scenario"] == scenario)
     ]
-    connections = create_connection_lines(
-        select_subregion, subregion=NUTS3, scenario=scenario
+    if population_index is None:
+        with profiling.stage("create_population_index"):
+            population_index = create_population_index(european_network["region"])
+    with profiling.stage(
+        "create_connection_lines", regions=select_subregion["region"].nunique()
+    ) as _counts:
+        connections = create_connection_lines(
+            select_subregion,
+            subregion=NUTS3,
+            scenario=scenario,
+            derivatives=derivatives,
+        )
+        _counts["edges"] = len(connections)
+    with profiling.stage(
+        "iterative_downscaling", NUTS3=NUTS3, scenario=scenario, edges=len(connections)
+    ) as _counts:
+        generation, lines, indicators, removed_population = iterative_downscaling(
+            select_subregion, connections, population_index
+        )
+        _counts["iterations"] = indicators.shape[1]
+        _counts["removed"] = len(removed_population)
+    if results is None:
+        with profiling.stage("files_to_results_folder"):
+            string = files_to_results_folder(
+                generation=generation,
+                lines=lines,
+                benchmark=indicators,
+                folder=country + "+" + NUTS3 + "+" + scenario,
+                boundary=select_subregion,
+                removed_population=removed_population,
+            )
+        with profiling.stage("plot_final_network_graph"):
+            plot_final_network_graph(
+                generation, lines, select_subregion, string, derivatives=derivatives
+            )
+        return
+
+    if run_id is None:
+        run_id = "{}-{}".format(
+            datetime.now().strftime("%Y%m%dT%H%M%S"), uuid4().hex[:8]
+        )
+    key = dict(
+        country=country,
+        NUTS3_CODE=NUTS3,
+        scenario=scenario,
+        run_id=run_id,
     )
-    generation, lines, indicators = iterative_downscaling(select_subregion, connections)
-    string = files_to_results_folder(
+    _results = dict(
+        path=results,
+        key=key,
         generation=generation,
         lines=lines,
         benchmark=indicators,
-        folder=country + "+" + NUTS3 + "+" + scenario,
-        boundary=select_subregion
+        boundary=select_subregion,
+        removed_population=removed_population,
     )
-    plot_final_network_graph(generation, lines, select_subregion, string)
-    return
+    if writer is None:
+        with profiling.stage("write_results"):
+            write_results(**_results)
+        return
+    return writer.submit(write_results, **_results)
 
 
 # run_iterative_downscaling(country="AT", NUTS3="AT127", scenario="Gradual Development")
 
-for reg in ["AT312"]:
-    print(reg)
-    for sce in ["Directed Transition"]:
-        print(sce)
-        run_iterative_downscaling(country="AT", NUTS3=reg, scenario=sce)
+if __name__ == "__main__":
+    # Opt-in profiling (--profile/--cprofile or DOWNSCALING_PROFILE/_CPROFILE)
+    profiling.configure()
+
+    # Results of all runs are appended to one GeoPackage on a background thread
+    RESULTS = os.path.join("iterative-downscaling-results", "results.gpkg")
+    RENDER_FIGURES = True
+
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        futures = list()
+        for reg in ["AT312"]:
+            print(reg)
+            for sce in ["Directed Transition"]:
+                print(sce)
+                futures.append(
+                    run_iterative_downscaling(
+                        country="AT",
+                        NUTS3=reg,
+                        scenario=sce,
+                        results=RESULTS,
+                        writer=writer,
+                    )
+                )
+    for future in futures:
+        future.result()
+
+    # Figures are rendered afterwards from the results, so that the downscaling
+    # does not wait for matplotlib
+    if RENDER_FIGURES:
+        with profiling.stage("render_results"):
+            render_results(
+                RESULTS,
+                os.path.join("iterative-downscaling-results", "figures"),
+                processes=4,
+            )
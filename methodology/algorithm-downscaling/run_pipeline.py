@@ -0,0 +1,367 @@
+import logging
+import os
+import shutil
+
+from geometries import create_geometry_derivatives
+from pipeline import create_stage
+from pipeline import run_pipeline
+from run_iter_downscaling import *
+from run_seq_downscaling import DATA_FOLDER
+from run_seq_downscaling import run_sequential_downscaling
+
+import profiling
+
+# Intermediate results (geometries, network topology per NUTS3 sub-region and
+# scenario) and the results of the iterative downscaling per sub-region
+PIPELINE_FOLDER = "pipeline-results"
+
+# Modules, on which the stages depend (their source is part of the hashes)
+SEQUENTIAL_MODULES = ["sequential_downscaling", "utils", "columnar"]
+ITERATIVE_MODULES = [
+    "iterative_downscaling",
+    "iterative_utils",
+    "geometries",
+    "regions",
+]
+
+
+def write_lau_geometries(
+    shapefile=None,
+    matching=None,
+    districts=None,
+    geometries=None,
+    extract=None,
+    country="AT",
+):
+
+    """
+
+    Parameters
+    ----------
+    shapefile : String, required
+        Includes the path to the shapefiles on the LAU level. The default is None.
+    matching : String, required
+        Includes the file that is used for the allocation of LAU level areas to
+        the NUTS3 level. The default is None.
+    districts : String, required
+        Includes the path to the shapefiles of the districts of Vienna.
+        The default is None.
+    geometries : String, required
+        Path of the GeoParquet file, to which the geometries (see
+        'create_lau_geometries') are written. The default is None.
+    extract : String, optional
+        Path of the extract of the LAU shapefile of the country (see
+        'read_lau_shapefile'). The default is None (next to the shapefile).
+    country : String, optional
+        Country code. The default is "AT".
+
+    Returns
+    -------
+    None.
+
+    """
+
+    _geometries = create_lau_geometries(
+        country, shapefile, matching, districts, extract
+    )
+    _geometries.to_parquet(geometries)
+
+    return
+
+
+def write_geometry_derivatives(geometries=None, derivatives=None):
+
+    """
+
+    Parameters
+    ----------
+    geometries : String, required
+        Path of the geometries as written by 'write_lau_geometries'.
+        The default is None.
+    derivatives : String, required
+        Path of the GeoParquet file, to which the derivatives of the
+        geometries (see 'create_geometry_derivatives') are written.
+        The default is None.
+
+    Returns
+    -------
+    None.
+
+    """
+
+    import geopandas as gpd
+
+    create_geometry_derivatives(gpd.read_parquet(geometries)).to_parquet(derivatives)
+
+    return
+
+
+def write_network_topology(
+    geometries=None,
+    generation=None,
+    matching=None,
+    population=None,
+    districts_population=None,
+    network=None,
+    country="AT",
+):
+
+    """
+
+    Parameters
+    ----------
+    geometries : String, required
+        Path of the geometries as written by 'write_lau_geometries'.
+        The default is None.
+    generation : String, required
+        Includes the path to the results of the sequential downscaling.
+        The default is None.
+    matching : String, required
+        Includes the file that is used for the allocation of LAU level areas to
+        the NUTS3 level. The default is None.
+    population : String, required
+        Includes the path to the population per LAU code. The default is None.
+    districts_population : String, required
+        Includes the path to the relative share of the population of the
+        districts of Vienna. The default is None.
+    network : String, required
+        Folder, to which the network topology (see
+        'create_initial_network_topology') is written as one GeoParquet file
+        per NUTS3 sub-region and scenario ('NUTS3+scenario.parquet'). Thus,
+        the downscaling of a sub-region only reruns if its file changed.
+        The default is None.
+    country : String, optional
+        Country code. The default is "AT".
+
+    Returns
+    -------
+    None.
+
+    """
+
+    import geopandas as gpd
+
+    _network = create_initial_network_topology(
+        country=country,
+        matching=matching,
+        geometries=gpd.read_parquet(geometries),
+        generation=generation,
+        population=population,
+        districts_population=districts_population,
+    )
+
+    shutil.rmtree(network, ignore_errors=True)
+    os.makedirs(network)
+    for (_nuts3, _sce), _slice in _network.groupby(["NUTS3_CODE", "scenario"]):
+        _slice.to_parquet(os.path.join(network, "{}+{}.parquet".format(_nuts3, _sce)))
+
+    return
+
+
+def downscale_subregion(
+    network=None,
+    population=None,
+    matching=None,
+    derivatives=None,
+    results=None,
+    country="AT",
+    NUTS3=None,
+    scenario=None,
+):
+
+    """
+
+    Parameters
+    ----------
+    network : String, required
+        Path of the network topology of the sub-region and scenario as
+        written by 'write_network_topology'. The default is None.
+    population : String, required
+        Includes the path to the population per LAU code. The default is None.
+    matching : String, required
+        Includes the file that is used for the allocation of LAU level areas to
+        the NUTS3 level and their LAU codes. The default is None.
+    derivatives : String, optional
+        Path of the derivatives of the geometries as written by
+        'write_geometry_derivatives'. The default is None.
+    results : String, required
+        Path of the GeoPackage, to which the results are written (see
+        'write_results'). The default is None.
+    country : String, optional
+        Country code. The default is "AT".
+    NUTS3 : String, required
+        NUTS3 sub-region code. The default is None.
+    scenario : String, required
+        Name of the scenario. The default is None.
+
+    Returns
+    -------
+    None.
+
+    """
+
+    import geopandas as gpd
+
+    _network = gpd.read_parquet(network)
+    _derivatives = None
+    if derivatives is not None:
+        _derivatives = gpd.read_parquet(derivatives)
+
+    # The results of a rerun replace the previous ones
+    if os.path.exists(results):
+        os.remove(results)
+    os.makedirs(os.path.dirname(results), exist_ok=True)
+
+    run_iterative_downscaling(
+        country=country,
+        NUTS3=NUTS3,
+        scenario=scenario,
+        population_index=create_population_index(
+            _network["region"], population, matching
+        ),
+        results=results,
+        network=_network,
+        derivatives=_derivatives,
+    )
+
+    return
+
+
+def create_stages(
+    country="AT", regions=None, scenarios=None, folder=PIPELINE_FOLDER
+):
+
+    """
+
+    Parameters
+    ----------
+    country : String, optional
+        Country code. The default is "AT".
+    regions : list, required
+        Includes the NUTS3 sub-regions, which are downscaled iteratively.
+        The default is None.
+    scenarios : list, required
+        Includes the scenarios, which are downscaled iteratively.
+        The default is None.
+    folder : String, optional
+        Includes the folder of the intermediate results and the results of the
+        iterative downscaling. The default is "pipeline-results".
+
+    Returns
+    -------
+    stages : list
+        Includes the stages (sequential downscaling, geometries and their
+        derivatives, network topology and the iterative downscaling per
+        sub-region and scenario) for 'run_pipeline'.
+
+    """
+
+    _matching = os.path.join("data", "Allocating_LAU_to_NUTS3_1.1.2020.xlsx")
+    _population = os.path.join("data", "Population_on_LAU_level_in_2050.xlsx")
+    _sequential = "sequential-downscaling-results"
+    _geometries = os.path.join(folder, "lau-geometries.parquet")
+    _derivatives = os.path.join(folder, "lau-geometries.derivatives.parquet")
+    _network = os.path.join(folder, "network")
+
+    stages = [
+        create_stage(
+            "sequential_downscaling",
+            run_sequential_downscaling,
+            inputs=dict(
+                heat=DATA_FOLDER
+                / "GeneSys-Mod_Residential_heat_production_IAMC_format.xlsx",
+                population_density=DATA_FOLDER / "Population_density.xlsx",
+                population_area=DATA_FOLDER / "Population+Area.xlsx",
+                requirements=DATA_FOLDER / "Requirements.xlsx",
+            ),
+            outputs=dict(results=_sequential),
+            modules=SEQUENTIAL_MODULES,
+        ),
+        create_stage(
+            "lau_geometries",
+            write_lau_geometries,
+            inputs=dict(
+                shapefile=os.path.join(
+                    "shapefiles", "LAU shapefile", "LAU_RG_01M_2019_3035.shp"
+                ),
+                matching=_matching,
+                districts=os.path.join(
+                    "shapefiles", "Vienesse_districts", "ZAEHLBEZIRKOGDPolygon.shp"
+                ),
+            ),
+            # The extract of the shapefile is kept with the intermediate
+            # results instead of the input folder
+            outputs=dict(
+                geometries=_geometries,
+                extract=os.path.join(folder, "lau-extract.{}.parquet".format(country)),
+            ),
+            parameters=dict(country=country),
+            modules=ITERATIVE_MODULES,
+        ),
+        create_stage(
+            "geometry_derivatives",
+            write_geometry_derivatives,
+            inputs=dict(geometries=_geometries),
+            outputs=dict(derivatives=_derivatives),
+            modules=["geometries"],
+        ),
+        create_stage(
+            "network_topology",
+            write_network_topology,
+            inputs=dict(
+                geometries=_geometries,
+                generation=os.path.join(
+                    _sequential,
+                    "results_centralized+decentralized_heat_generation.xlsx",
+                ),
+                matching=_matching,
+                population=_population,
+                districts_population=os.path.join(
+                    "data", "Population_in_Vienesse_districts.xlsx"
+                ),
+            ),
+            outputs=dict(network=_network),
+            parameters=dict(country=country),
+            modules=ITERATIVE_MODULES,
+        ),
+    ]
+
+    for _reg in regions:
+        for _sce in scenarios:
+            _name = "{}+{}".format(_reg, _sce)
+            stages.append(
+                create_stage(
+                    "iterative_downscaling|" + _name,
+                    downscale_subregion,
+                    inputs=dict(
+                        network=os.path.join(_network, _name + ".parquet"),
+                        population=_population,
+                        matching=_matching,
+                        derivatives=_derivatives,
+                    ),
+                    outputs=dict(
+                        results=os.path.join(folder, "iterative", _name + ".gpkg")
+                    ),
+                    parameters=dict(country=country, NUTS3=_reg, scenario=_sce),
+                    modules=ITERATIVE_MODULES,
+                )
+            )
+
+    return stages
+
+
+if __name__ == "__main__":
+    # Opt-in profiling (--profile/--cprofile or DOWNSCALING_PROFILE/_CPROFILE)
+    profiling.configure()
+    logging.basicConfig(level=logging.INFO)
+
+    status = run_pipeline(
+        create_stages(
+            country="AT",
+            regions=["AT312"],
+            scenarios=["Directed Transition"],
+        ),
+        state=os.path.join(PIPELINE_FOLDER, "state.json"),
+    )
+    for _name, _status in status.items():
+        print("{}: {}".format(_name, _status))
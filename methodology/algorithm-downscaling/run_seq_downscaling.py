@@ -6,68 +6,126 @@ from sequential_downscaling import *
 from utils import iamdf_to_dict
 from utils import calculate_heat_density
 
+import columnar
+import profiling
+
 DATA_FOLDER = Path("data")
 
-heat = py.IamDataFrame(DATA_FOLDER / "GeneSys-Mod_Residential_heat_production_IAMC_format.xlsx").filter(year=2050)
 
-population_density = py.IamDataFrame(DATA_FOLDER / "Population_density.xlsx")
+def run_sequential_downscaling(
+    heat=DATA_FOLDER / "GeneSys-Mod_Residential_heat_production_IAMC_format.xlsx",
+    population_density=DATA_FOLDER / "Population_density.xlsx",
+    population_area=DATA_FOLDER / "Population+Area.xlsx",
+    requirements=DATA_FOLDER / "Requirements.xlsx",
+    results="sequential-downscaling-results",
+):
+
+    """
+
+    Parameters
+    ----------
+    heat : String, optional
+        Includes the path to the heat generation by technology/source
+        (NUTS0). The default is
+        "data/GeneSys-Mod_Residential_heat_production_IAMC_format.xlsx".
+    population_density : String, optional
+        Includes the path to the population density per region.
+        The default is "data/Population_density.xlsx".
+    population_area : String, optional
+        Includes the path to the population and total area per region.
+        The default is "data/Population+Area.xlsx".
+    requirements : String, optional
+        Includes the path to the heat network infrastructure requirements per
+        technology/source. The default is "data/Requirements.xlsx".
+    results : String, optional
+        Includes the name of the results folder.
+        The default is "sequential-downscaling-results".
+
+    Returns
+    -------
+    results_directory : String
+        Includes the name of the results folder.
+
+    """
+
+    # The input data is only read as IamDataFrame, but processed (and written)
+    # as columnar data (see 'columnar')
+    with profiling.stage("read_input_data") as _counts:
+        _heat = columnar.select(
+            columnar.from_iamdf(py.IamDataFrame(heat)), year=2050
+        )
 
-_population_area = py.IamDataFrame(DATA_FOLDER / "Population+Area.xlsx").filter(year=2050)
+        _population_density = columnar.from_iamdf(
+            py.IamDataFrame(population_density)
+        )
 
-population = _population_area.filter(variable="Population", year=2050)
-area = _population_area.filter(variable="Total area", year=2050)
+        _population_area = columnar.select(
+            columnar.from_iamdf(py.IamDataFrame(population_area)), year=2050
+        )
 
-requirements = iamdf_to_dict(py.IamDataFrame(DATA_FOLDER / "Requirements.xlsx"), ["variable"])
+        population = columnar.select(_population_area, variable="Population")
+        area = columnar.select(_population_area, variable="Total area")
 
-_scenarios = heat.scenario
-_results = None
+        _requirements = iamdf_to_dict(py.IamDataFrame(requirements), ["variable"])
+        _counts["regions"] = len(columnar.get_values(population, "region"))
 
-for _sce in _scenarios:
+    _scenarios = columnar.get_values(_heat, "scenario")
+    _results = []
 
-    _heat_temp = heat.filter(scenario=_sce).convert_unit("PJ", to="TWh")
-    _pop_temp = population.rename(scenario={"Baseline": _sce})
-    _pop_den_temp = population_density.rename(scenario={"Baseline": _sce})
+    for _sce in _scenarios:
 
-    if _results == None:
-        _results = sequential_downscaling(
-            _heat_temp, requirements, _pop_den_temp, _pop_temp
+        _heat_temp = columnar.convert_unit(
+            columnar.select(_heat, scenario=_sce), "PJ", to="TWh"
         )
-    else:
-        _results.append(
-            sequential_downscaling(_heat_temp, requirements, _pop_den_temp, _pop_temp),
-            inplace=True,
+        _pop_temp = columnar.rename(population, "scenario", {"Baseline": _sce})
+        _pop_den_temp = columnar.rename(
+            _population_density, "scenario", {"Baseline": _sce}
         )
 
-    _network = [key for key, value in requirements.items() if value >= 150]
-    for _t in heat.variable:
-        if _t in _network:
-            _results.rename(variable={_t: "Centralized|" + _t}, inplace=True)
-        else:
-            _results.rename(variable={_t: "Decentralized|" + _t}, inplace=True)
+        with profiling.stage(
+            "sequential_downscaling",
+            scenario=_sce,
+            regions=len(columnar.get_values(_pop_temp, "region")),
+            variables=len(columnar.get_values(_heat_temp, "variable")),
+        ):
+            _results.append(
+                sequential_downscaling(
+                    _heat_temp, _requirements, _pop_den_temp, _pop_temp
+                )
+            )
+
+    with profiling.stage("classify_heat_generation"):
+        _results, _results_to_excel = classify_heat_generation(
+            columnar.concat(_results), _requirements
+        )
+
+    results_directory = results
+    if not os.path.exists(results_directory):
+        os.makedirs(results_directory)
 
+    RESULTS_FOLDER = Path(results_directory)
 
-results_directory = os.path.join(
-        "sequential-downscaling-results")
-if not os.path.exists(results_directory):
-    os.makedirs(results_directory)
+    with profiling.stage("write_results"):
+        columnar.to_iamdf(_results_to_excel).to_excel(
+            RESULTS_FOLDER / "results_centralized+decentralized_heat_generation.xlsx",
+            include_meta=False,
+        )
 
-RESULTS_FOLDER = Path(results_directory)    
+        with profiling.stage("calculate_heat_density"):
+            _Heat_density = calculate_heat_density(_results_to_excel, area)
+        columnar.to_iamdf(_Heat_density).to_excel(
+            RESULTS_FOLDER / "results_heat_density.xlsx", include_meta=False
+        )
 
-_results_to_excel = _results.aggregate(
-    variable=["Centralized", "Decentralized"], method="sum", append=False
-)
-_results_to_excel.to_excel(
-    RESULTS_FOLDER / "results_centralized+decentralized_heat_generation.xlsx",
-    include_meta=False,
-)
+        columnar.to_iamdf(
+            columnar.select(_results, region=["AT221", "AT312", "AT342", "AT130"])
+        ).to_excel(RESULTS_FOLDER / "full_results.xlsx", include_meta=False)
 
-_Heat_density = calculate_heat_density(_results_to_excel, area)
-_Heat_density.to_excel(
-    RESULTS_FOLDER / "results_heat_density.xlsx", include_meta=False
-)
+    return results_directory
 
-_results.filter(region=["AT221", "AT312", "AT342", "AT130"]).to_excel(
-    RESULTS_FOLDER / "full_results.xlsx", include_meta=False
-)
 
+if __name__ == "__main__":
+    # Opt-in profiling (--profile/--cprofile or DOWNSCALING_PROFILE/_CPROFILE)
+    profiling.configure()
 
+    run_sequential_downscaling()
@@ -1,9 +1,13 @@
+import logging
+import columnar
 import utils
-from pyam import IamDataFrame
+
+
+logger = logging.getLogger(__name__)
 
 
 def sequential_downscaling(
-    generation=None, needs=None, pop_density=None, population=None
+    generation=None, needs=None, pop_density=None, population=None, method=None
 ):
 
     """
@@ -16,8 +20,9 @@ def sequential_downscaling(
 
     Parameters
     ----------
-    generation : IamDataFrame, required
-        Includes the heat generation by technology/source.
+    generation : IamDataFrame or dict, required
+        Includes the heat generation by technology/source (IamDataFrame or
+        columnar data, see 'columnar').
         So far, it is necessary to include values of one scenario here.
         This will be updated in further extensions.
         The default is None.
@@ -26,29 +31,41 @@ def sequential_downscaling(
         heat generation technologies. This dictionary should include a specific
         value for each technology/source.
         The default is None.
-    pop_density : IamDataFrame, required
+    pop_density : IamDataFrame or dict, required
         Includes the population density of the regions (areas to be downscaled).
         The scenario should be the same as the one of the generation parameter.
         The default is None.
-    population : IamDataFrame, required
+    population : IamDataFrame or dict, required
         Includes the population per region.
         The scenario should be the same as the one of the 'generation' parameter.
         The default is None.
+    method : string, optional
+        Sets the allocation of the heat generation to the regions. Either
+        'sequential' (technologies/sources in order of their requirements) or
+        'ipf' (iterative proportional fitting of all technologies/sources
+        at once, which avoids negative remaining heat demand).
+        The default is None, which corresponds to 'sequential'.
 
     Returns
     -------
-    local_heat_generation : IamDataFrame
-        Heat generation per technology/source at the local level.
+    local_heat_generation : IamDataFrame or dict
+        Heat generation per technology/source at the local level (columnar
+        data, if the heat generation is columnar data).
 
     """
 
     if utils.validate_input_data(generation, pop_density, population):
 
-        _model = generation.model
-        _unit = generation.unit
-        _year = generation.year
+        _iamdf = not columnar.is_columnar(generation)
+        generation = columnar.from_iamdf(generation)
+        pop_density = columnar.from_iamdf(pop_density)
+        population = columnar.from_iamdf(population)
+
+        _model = columnar.get_values(generation, "model")
+        _unit = columnar.get_values(generation, "unit")
+        _year = columnar.get_values(generation, "year")
 
-        technologies = generation.variable
+        technologies = columnar.get_values(generation, "variable")
         requirements = utils.initialization(technologies, needs)
         loc_demand = utils.pop_based_downscaling(generation, population)
 
@@ -56,22 +73,103 @@ def sequential_downscaling(
         _dict_pot = utils.iamdf_to_dict(df=pop_density, keys=["region"])
 
         _res = dict()
-
-        for _sce in generation.scenario:
-            _loc_gen = utils.sequential_algorithm(
-                _dict_gen, loc_demand, requirements, _dict_pot, _sce
-            )
+        _init_demand = dict(loc_demand)
+
+        for _sce in columnar.get_values(generation, "scenario"):
+            if method in [None, "sequential"]:
+                _loc_gen = utils.sequential_algorithm(
+                    _dict_gen, loc_demand, requirements, _dict_pot, _sce
+                )
+            elif method == "ipf":
+                _loc_gen, _diagnostics = utils.ipf_algorithm(
+                    _dict_gen, loc_demand, requirements, _dict_pot, _sce
+                )
+                _msg = (
+                    "Iterative proportional fitting of scenario {} {} after "
+                    "{iterations} iterations (demand residual: {demand_residual})"
+                )
+                if _diagnostics["converged"]:
+                    logger.info(_msg.format(_sce, "converged", **_diagnostics))
+                else:
+                    _status = "did not converge"
+                    logger.warning(_msg.format(_sce, _status, **_diagnostics))
+            else:
+                raise ValueError("Unknown allocation method: {}".format(method))
             _res = {**_res, **_loc_gen}
 
-        col_names = ["Scenario", "Variable", "Region", "Value"]
-        df = utils.dict_to_df(_res, col_names)
-
-        df.insert(1, "model", _model[0])
-        df.insert(1, "unit", _unit[0])
-        df.insert(1, "year", _year[0])
-
-        local_heat_generation = IamDataFrame(df)
+            _report = utils.validate_allocation(
+                _loc_gen, _dict_gen, _init_demand, _sce
+            )
+            if not _report.empty:
+                logger.warning(
+                    "Heat demand/generation mismatch in scenario {}: {} violated "
+                    "mass balances (largest mismatch: {})".format(
+                        _sce, len(_report), _report["mismatch"].abs().max()
+                    )
+                )
+                logger.debug(_report.to_string())
+
+        local_heat_generation = columnar.from_dict(
+            _res,
+            ["scenario", "variable", "region"],
+            model=_model[0],
+            unit=_unit[0],
+            year=_year[0],
+        )
+        if _iamdf:
+            return columnar.to_iamdf(local_heat_generation)
         return local_heat_generation
 
     else:
         return None
+
+
+def classify_heat_generation(local_heat_generation=None, requirements=None):
+
+    """
+
+    Parameters
+    ----------
+    local_heat_generation : IamDataFrame or dict, required
+        Heat generation per technology/source at the local level, e.g., the
+        results of all scenarios of the sequential downscaling (IamDataFrame
+        or columnar data, see 'columnar').
+        The default is None.
+    requirements : dict, required
+        Includes the heat network infrastructure requirements of the different
+        heat generation technologies. Technologies/sources without requirements
+        are considered decentralized.
+        The default is None.
+
+    Returns
+    -------
+    classified_heat_generation : IamDataFrame or dict
+        Heat generation per technology/source with variables prefixed by
+        'Centralized|' or 'Decentralized|'.
+    aggregated_heat_generation : IamDataFrame or dict
+        Total centralized and decentralized heat generation per region.
+        Both are columnar data, if the heat generation is columnar data.
+
+    """
+
+    categories = utils.classify_technologies(requirements)
+
+    _data = columnar.from_iamdf(local_heat_generation)
+    _category = {
+        _v: categories.get(_v, "Decentralized")
+        for _v in _data["variable"].categories
+    }
+
+    classified_heat_generation = columnar.rename(
+        _data, "variable", {_v: _c + "|" + _v for _v, _c in _category.items()}
+    )
+    aggregated_heat_generation = columnar.sum_duplicates(
+        columnar.rename(_data, "variable", _category)
+    )
+
+    if columnar.is_columnar(local_heat_generation):
+        return classified_heat_generation, aggregated_heat_generation
+    return (
+        columnar.to_iamdf(classified_heat_generation),
+        columnar.to_iamdf(aggregated_heat_generation),
+    )
@@ -0,0 +1,635 @@
+import argparse
+import http.server
+import json
+import logging
+import multiprocessing
+import os
+import socketserver
+import sys
+import threading
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import sequential_downscaling
+import iterative_downscaling
+
+import columnar
+import profiling
+
+from geometries import create_geometry_derivatives
+
+
+logger = logging.getLogger(__name__)
+
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+MODEL_FOLDER = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "optimization model"
+)
+
+# Responses are JSON, or an Arrow IPC stream of one table if requested by the
+# 'Accept' header (pyarrow is only needed for these responses)
+JSON_TYPE = "application/json"
+ARROW_TYPE = "application/vnd.apache.arrow.stream"
+
+# The inputs are loaded once per process (see 'load_service')
+_SERVICE = None
+
+
+class RequestError(ValueError):
+    """Invalid request (answered with status 400, other errors with 500)."""
+
+
+def load_service(
+    data=DATA_FOLDER,
+    network=None,
+    regions=None,
+    population=None,
+    matching=None,
+    model_data=None,
+    solver="gurobi",
+    derivatives=None,
+):
+
+    """
+
+    Parameters
+    ----------
+    data : String, optional
+        Includes the folder of the input data of the sequential downscaling.
+        The default is the 'data' folder next to this file.
+    network : String or GeoDataFrame, optional
+        Includes the initial network topology as created by
+        'create_initial_network_topology', or the path to a GeoParquet file
+        or GeoPackage of it, or to the folder of the files per NUTS3
+        sub-region and scenario of the pipeline ('run_pipeline.py').
+        The default is None (no iterative downscaling).
+    regions : list, optional
+        Includes the NUTS3 sub-regions, whose connection lines are already
+        created at loading. The lines of further sub-regions are created with
+        their first request. The default is None.
+    population : String, optional
+        Includes the path to the population per LAU code. The default is
+        'Population_on_LAU_level_in_2050.xlsx' in the 'data' folder.
+    matching : String, optional
+        Includes the file that is used for the allocation of LAU level areas to
+        the NUTS3 level and their LAU codes. The default is
+        'Allocating_LAU_to_NUTS3_1.1.2020.xlsx' in the 'data' folder.
+    model_data : String, optional
+        Includes the folder of the input data of the optimization model.
+        The default is None (no optimization).
+    solver : String, optional
+        Solver of the optimization model. The default is "gurobi".
+    derivatives : String, optional
+        Includes the path to the derivatives of the geometries (see
+        'read_geometry_derivatives'). The default is None, in which case they
+        are computed once from the network topology.
+
+    Returns
+    -------
+    service : dict
+        Includes the loaded inputs and the caches of the requests.
+
+    """
+
+    import pyam
+
+    from utils import iamdf_to_dict
+
+    global _SERVICE
+
+    _start = time.perf_counter()
+    # The input data is kept as columnar data (see 'columnar')
+    _read = lambda _file: columnar.from_iamdf(
+        pyam.IamDataFrame(os.path.join(data, _file))
+    )
+    _population_area = columnar.select(_read("Population+Area.xlsx"), year=2050)
+
+    service = {
+        "heat": columnar.select(
+            _read("GeneSys-Mod_Residential_heat_production_IAMC_format.xlsx"),
+            year=2050,
+        ),
+        "population_density": _read("Population_density.xlsx"),
+        "population": columnar.select(_population_area, variable="Population"),
+        "requirements": iamdf_to_dict(
+            pyam.IamDataFrame(os.path.join(data, "Requirements.xlsx")), ["variable"]
+        ),
+        "scenarios": dict(),
+        "network": dict(),
+        "derivatives": None,
+        "lines": dict(),
+        "population_index": dict(),
+        "model_inputs": None,
+        "models": dict(),
+        "solver": solver,
+        # The models are not solved concurrently (if served without workers)
+        "lock": threading.Lock(),
+    }
+
+    if network is not None:
+        import geopandas as gpd
+        import pandas as pd
+
+        if isinstance(network, str) and os.path.isdir(network):
+            network = pd.concat(
+                [
+                    gpd.read_parquet(os.path.join(network, _file))
+                    for _file in sorted(os.listdir(network))
+                    if _file.endswith(".parquet")
+                ]
+            )
+        elif isinstance(network, str) and network.endswith(".parquet"):
+            network = gpd.read_parquet(network)
+        elif isinstance(network, str):
+            network = gpd.read_file(network)
+
+        service["network"] = {
+            _key: _slice
+            for _key, _slice in network.groupby(["NUTS3_CODE", "scenario"])
+        }
+        # The derivatives of the geometries are shared by all sub-regions
+        if derivatives is not None:
+            service["derivatives"] = gpd.read_parquet(derivatives)
+        else:
+            service["derivatives"] = create_geometry_derivatives(network)
+        service["population_index"] = iterative_downscaling.create_population_index(
+            network["region"].unique(),
+            population or os.path.join(data, "Population_on_LAU_level_in_2050.xlsx"),
+            matching or os.path.join(data, "Allocating_LAU_to_NUTS3_1.1.2020.xlsx"),
+        )
+        for _nuts3, _sce in service["network"].keys():
+            if _nuts3 in (regions or []):
+                _connection_lines(service, _nuts3, _sce)
+
+    if model_data is not None:
+        _model = _import_optimization_model()
+        service["model_inputs"] = _model.read_input_data(model_data)
+
+    logger.info(
+        "Service loaded in {:.1f} seconds (process {})".format(
+            time.perf_counter() - _start, os.getpid()
+        )
+    )
+    _SERVICE = service
+
+    return service
+
+
+def _import_optimization_model():
+
+    # The optimization model imports its own 'utils' module, which has the
+    # same name as the one of the downscaling algorithms. It is imported with
+    # its folder first on the path and the module of the algorithms restored.
+    if "model" in sys.modules:
+        return sys.modules["model"]
+
+    _utils = sys.modules.pop("utils", None)
+    sys.path.insert(0, MODEL_FOLDER)
+    try:
+        import model
+    finally:
+        sys.path.remove(MODEL_FOLDER)
+        if _utils is not None:
+            sys.modules["utils"] = _utils
+
+    return model
+
+
+def _connection_lines(service=None, NUTS3=None, scenario=None):
+    if (NUTS3, scenario) not in service["lines"]:
+        service["lines"][NUTS3, scenario] = (
+            iterative_downscaling.create_connection_lines(
+                service["network"][NUTS3, scenario],
+                subregion=NUTS3,
+                scenario=scenario,
+                derivatives=service["derivatives"],
+            )
+        )
+    return service["lines"][NUTS3, scenario]
+
+
+def downscale_sequential(service=None, request=None):
+
+    """
+
+    Parameters
+    ----------
+    service : dict, required
+        Includes the inputs as loaded by 'load_service'. The default is None.
+    request : dict, required
+        Includes the 'scenario' and optionally the 'requirements' that replace
+        the ones of the input data (per technology/source), the allocation
+        'method' (see 'sequential_downscaling') and the 'regions' (NUTS3),
+        which are returned. The default is None.
+
+    Returns
+    -------
+    tables : dict
+        Includes the classified heat generation per technology/source
+        ('generation') and the aggregated centralized and decentralized heat
+        generation ('aggregated') per region in the IAMC format.
+
+    """
+
+    _sce = request["scenario"]
+    if _sce not in service["scenarios"]:
+        if _sce not in columnar.get_values(service["heat"], "scenario"):
+            raise RequestError("Unknown scenario: {}".format(_sce))
+        _rename = lambda _data: columnar.rename(
+            _data, "scenario", {"Baseline": _sce}
+        )
+        service["scenarios"][_sce] = (
+            columnar.convert_unit(
+                columnar.select(service["heat"], scenario=_sce), "PJ", to="TWh"
+            ),
+            _rename(service["population_density"]),
+            _rename(service["population"]),
+        )
+    _heat, _density, _population = service["scenarios"][_sce]
+
+    _requirements = dict(service["requirements"])
+    _requirements.update(request.get("requirements", dict()))
+
+    _local = sequential_downscaling.sequential_downscaling(
+        _heat, _requirements, _density, _population, method=request.get("method")
+    )
+    _classified, _aggregated = sequential_downscaling.classify_heat_generation(
+        _local, _requirements
+    )
+
+    tables = dict()
+    for _name, _data in [("generation", _classified), ("aggregated", _aggregated)]:
+        if request.get("regions") is not None:
+            _data = columnar.select(_data, region=request["regions"])
+        tables[_name] = columnar.to_frame(_data).sort_values(
+            columnar.IAMC_COLUMNS, ignore_index=True
+        )
+
+    return tables
+
+
+def downscale_iterative(service=None, request=None):
+
+    """
+
+    Parameters
+    ----------
+    service : dict, required
+        Includes the inputs as loaded by 'load_service'. The default is None.
+    request : dict, required
+        Includes the 'NUTS3' sub-region and the 'scenario' and optionally the
+        'batch_size' or 'batch_quantile' (see 'iterative_downscaling').
+        The default is None.
+
+    Returns
+    -------
+    tables : dict
+        Includes the final centralized heat generation ('generation'), the
+        connection lines ('lines') and the removed nodes ('removed_population')
+        without geometries.
+
+    """
+
+    _key = (request["NUTS3"], request["scenario"])
+    if _key not in service["network"]:
+        raise RequestError("No network topology of {} ({})".format(*_key))
+
+    # The cluster structure is only updated for the neighbours of removed
+    # nodes (processes=1), which gives the same results as the default
+    generation, lines, _, removed_population = (
+        iterative_downscaling.iterative_downscaling(
+            service["network"][_key],
+            _connection_lines(service, *_key),
+            service["population_index"],
+            processes=1,
+            batch_size=request.get("batch_size"),
+            batch_quantile=request.get("batch_quantile"),
+        )
+    )
+
+    _lines = lines[["START", "END"]].assign(length=lines.geometry.length)
+    tables = {
+        "generation": generation[["region", "variable", "unit", "value"]],
+        "lines": _lines,
+        "removed_population": removed_population,
+    }
+
+    return tables
+
+
+def downscale_optimization(service=None, request=None):
+
+    """
+
+    Parameters
+    ----------
+    service : dict, required
+        Includes the inputs as loaded by 'load_service'. The default is None.
+    request : dict, required
+        Includes the 'scenario'. The default is None.
+
+    Returns
+    -------
+    tables : dict
+        Includes the district heating ('district_heating', TWh), on-site heat
+        generation ('on_site', TWh) and heat density of the district heating
+        ('heat_density', GWh / km ** 2) per LAU ('heat_density').
+
+    """
+
+    import pandas as pd
+
+    if service["model_inputs"] is None:
+        raise RequestError("No input data of the optimization model loaded")
+
+    _model = _import_optimization_model()
+    _sce = request["scenario"]
+
+    with service["lock"]:
+        if _sce not in service["models"]:
+            service["models"][_sce] = _model.build_model(
+                *service["model_inputs"], scenario=_sce
+            )
+        model = service["models"][_sce]
+        _model.solve_model(model, solver=service["solver"], tee=False)
+
+        _laus = list(model.set_laus)
+        _dh = [model.v_q_dh_l[_l].value for _l in _laus]
+        _area = [model.p_phi_l[_l] * model.p_per_area_l[_l] for _l in _laus]
+        heat_density = pd.DataFrame(
+            {
+                "region": [str(_l) for _l in _laus],
+                "district_heating": _dh,
+                "on_site": [model.v_q_ons_l[_l].value for _l in _laus],
+                "heat_density": [_d * 1000 / _a for _d, _a in zip(_dh, _area)],
+            }
+        )
+
+    return {"heat_density": heat_density}
+
+
+ENDPOINTS = {
+    "/sequential": downscale_sequential,
+    "/iterative": downscale_iterative,
+    "/optimization": downscale_optimization,
+}
+
+# Parameters, which are required per endpoint
+REQUIRED_PARAMETERS = {
+    "/sequential": ["scenario"],
+    "/iterative": ["NUTS3", "scenario"],
+    "/optimization": ["scenario"],
+}
+
+
+def handle_request(endpoint=None, request=None, content_type=JSON_TYPE):
+
+    """
+
+    Parameters
+    ----------
+    endpoint : String, required
+        Path of the request (e.g., '/sequential'). The default is None.
+    request : dict, required
+        Includes the parameters of the request. The default is None.
+    content_type : String, optional
+        Type of the response, either JSON (all tables) or Arrow (the table
+        named by the 'table' parameter, by default the first one).
+        The default is "application/json".
+
+    Returns
+    -------
+    status : int
+        HTTP status code of the response: 400 for invalid requests (missing
+        parameters, unknown scenarios, sub-regions or tables) and 500 for
+        all other errors, which are logged.
+    body : bytes
+        Includes the response.
+
+    """
+
+    _start = time.perf_counter()
+    try:
+        _validate_request(endpoint, request)
+        _counts = {_k: request[_k] for _k in ["NUTS3", "scenario"] if _k in request}
+        with profiling.stage(endpoint.strip("/"), **_counts):
+            tables = ENDPOINTS[endpoint](_SERVICE, request)
+
+        if content_type == ARROW_TYPE:
+            return 200, _to_arrow(tables, request.get("table"))
+
+        _response = {
+            _name: json.loads(_df.to_json(orient="records"))
+            for _name, _df in tables.items()
+        }
+        _response["seconds"] = time.perf_counter() - _start
+        return 200, json.dumps(_response).encode()
+    except RequestError as _error:
+        return 400, json.dumps({"error": str(_error)}).encode()
+    except Exception as _error:
+        logger.exception("Request to {} failed".format(endpoint))
+        _message = "{}: {}".format(type(_error).__name__, _error)
+        return 500, json.dumps({"error": _message}).encode()
+
+
+def _validate_request(endpoint=None, request=None):
+    if endpoint not in ENDPOINTS:
+        raise RequestError("Unknown path: {}".format(endpoint))
+    if not isinstance(request, dict):
+        raise RequestError("Request is not a JSON object")
+    _missing = [_k for _k in REQUIRED_PARAMETERS[endpoint] if _k not in request]
+    if len(_missing) > 0:
+        raise RequestError("Missing parameters: {}".format(", ".join(_missing)))
+
+
+def _to_arrow(tables=None, table=None):
+    import pyarrow as pa
+
+    _name = next(iter(tables)) if table is None else table
+    if _name not in tables:
+        raise RequestError(
+            "Unknown table: {} (one of {})".format(_name, ", ".join(tables))
+        )
+    _table = pa.Table.from_pandas(tables[_name], preserve_index=False)
+    _sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(_sink, _table.schema) as _writer:
+        _writer.write_table(_table)
+
+    return _sink.getvalue().to_pybytes()
+
+
+class ServiceHandler(http.server.BaseHTTPRequestHandler):
+
+    # Set by 'create_server' (None, if the requests are handled in the thread
+    # of the connection)
+    executor = None
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._respond(404, {"error": "Unknown path: " + self.path})
+        self._respond(
+            200,
+            {
+                "endpoints": list(ENDPOINTS),
+                "workers": getattr(self.executor, "_max_workers", 0),
+            },
+        )
+
+    def do_POST(self):
+        if self.path not in ENDPOINTS:
+            return self._respond(404, {"error": "Unknown path: " + self.path})
+        try:
+            _length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(_length) or b"{}")
+        except ValueError as _error:
+            return self._respond(400, {"error": "Invalid JSON: {}".format(_error)})
+
+        _type = ARROW_TYPE if self.headers.get("Accept") == ARROW_TYPE else JSON_TYPE
+        if self.executor is None:
+            status, body = handle_request(self.path, request, _type)
+        else:
+            try:
+                status, body = self.executor.submit(
+                    handle_request, self.path, request, _type
+                ).result()
+            except Exception as _error:
+                # e.g., a worker process terminated abruptly
+                logger.exception("Worker failed on {}".format(self.path))
+                return self._respond(500, {"error": "Worker failed: {}".format(_error)})
+
+        self.send_response(status)
+        self.send_header("Content-Type", _type if status == 200 else JSON_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _respond(self, status=None, response=None):
+        _body = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", JSON_TYPE)
+        self.send_header("Content-Length", str(len(_body)))
+        self.end_headers()
+        self.wfile.write(_body)
+
+    def address_string(self):
+        # Unix sockets have no client address
+        return str(self.client_address[0]) if self.client_address else "local"
+
+    def log_message(self, format, *args):
+        logger.info("%s %s", self.address_string(), format % args)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(host="127.0.0.1", port=8765, socket=None, workers=None, **inputs):
+
+    """
+
+    Parameters
+    ----------
+    host : String, optional
+        Host of the HTTP server. The default is "127.0.0.1".
+    port : int, optional
+        Port of the HTTP server (0 for any free port). The default is 8765.
+    socket : String, optional
+        Path of a Unix socket, which is used instead of host and port.
+        The default is None.
+    workers : int, optional
+        Number of worker processes, each of which loads the inputs once and
+        handles one request at a time. The default is None, in which case the
+        inputs are loaded in this process and the requests are handled in the
+        threads of the connections (their profiling stages are kept apart).
+    **inputs
+        Includes the inputs of the service (see 'load_service').
+
+    Returns
+    -------
+    server : HTTPServer
+        Includes the server (see 'serve_forever' and 'shutdown'). The worker
+        pool (if any) is shut down with the server ('server_close').
+
+    """
+
+    _executor = None
+    if workers is None:
+        load_service(**inputs)
+    else:
+        _executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_load_worker,
+            initargs=(inputs,),
+        )
+        # All workers load the inputs before the server accepts requests. Each
+        # worker blocks at the barrier, until the other workers (which have
+        # loaded the inputs as well) arrive, so that each one gets one task.
+        with multiprocessing.Manager() as _manager:
+            _barrier = _manager.Barrier(workers)
+            list(_executor.map(_wait_for_workers, [_barrier] * workers))
+
+    _handler = type("Handler", (ServiceHandler,), {"executor": _executor})
+    if socket is not None:
+        if os.path.exists(socket):
+            os.remove(socket)
+        server = _UnixHTTPServer(socket, _handler)
+    else:
+        server = http.server.ThreadingHTTPServer((host, port), _handler)
+
+    _close = server.server_close
+
+    def server_close():
+        _close()
+        if _executor is not None:
+            _executor.shutdown()
+
+    server.server_close = server_close
+
+    return server
+
+
+def _load_worker(inputs=None):
+    load_service(**inputs)
+
+
+def _wait_for_workers(barrier=None):
+    barrier.wait()
+    return os.getpid()
+
+
+if __name__ == "__main__":
+    _parser = argparse.ArgumentParser(description="Local downscaling service")
+    _parser.add_argument("--host", default="127.0.0.1")
+    _parser.add_argument("--port", type=int, default=8765)
+    _parser.add_argument("--socket", default=None)
+    _parser.add_argument("--workers", type=int, default=None)
+    _parser.add_argument("--network", default=None)
+    _parser.add_argument("--regions", nargs="*", default=None)
+    _parser.add_argument("--model-data", default=None)
+    _parser.add_argument("--solver", default="gurobi")
+    _parser.add_argument("--derivatives", default=None)
+    _args, _ = _parser.parse_known_args()
+
+    # Opt-in profiling (--profile/--cprofile or DOWNSCALING_PROFILE/_CPROFILE)
+    profiling.configure()
+    logging.basicConfig(level=logging.INFO)
+
+    server = create_server(
+        host=_args.host,
+        port=_args.port,
+        socket=_args.socket,
+        workers=_args.workers,
+        network=_args.network,
+        regions=_args.regions,
+        model_data=_args.model_data,
+        solver=_args.solver,
+        derivatives=_args.derivatives,
+    )
+    logger.info("Serving on {}".format(_args.socket or server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
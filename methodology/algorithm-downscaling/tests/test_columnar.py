@@ -0,0 +1,76 @@
+import pyam
+from types import SimpleNamespace
+import pandas as pd
+import columnar
+from sequential_downscaling import classify_heat_generation
+
+
+def _create_iamdf():
+    return pyam.IamDataFrame(
+        pd.DataFrame(
+            [
+                ["model_a", "scen_b", "Region A", "Hydrogen", "PJ", 36.0],
+                ["model_a", "scen_a", "Region B", "Biomass", "PJ", 18.0],
+                ["model_a", "scen_a", "Region A", "Biomass", "TWh", 2.0],
+            ],
+            columns=["model", "scenario", "region", "variable", "unit", 2050],
+        )
+    )
+
+
+def test_columnar_conversion():
+    _df = _create_iamdf()
+    _data = columnar.from_iamdf(_df)
+
+    # the rows are sorted by the columns (independent of the order of the file)
+    pd.testing.assert_frame_equal(
+        columnar.to_frame(_data),
+        _df.data.sort_values(columnar.IAMC_COLUMNS, ignore_index=True),
+    )
+    assert columnar.get_values(_data, "scenario") == ["scen_a", "scen_b"]
+    assert pyam.compare(columnar.to_iamdf(_data), _df).empty
+
+    # other layouts of the internal data of pyam fall back to the long table
+    _public = SimpleNamespace(data=_df.data, _data=None)
+    pd.testing.assert_frame_equal(
+        columnar.to_frame(columnar.from_iamdf(_public)), columnar.to_frame(_data)
+    )
+
+    _dict = {("scen_a", "Biomass"): 1.0, ("scen_b", "Biomass"): 2.0}
+    _data = columnar.from_dict(
+        _dict, ["scenario", "variable"], model="m", region="R", unit="TWh", year=2050
+    )
+    assert columnar.to_frame(_data)["value"].tolist() == [1.0, 2.0]
+    assert set(columnar.to_frame(_data)["model"]) == {"m"}
+
+
+def test_columnar_operations():
+    _data = columnar.from_iamdf(_create_iamdf())
+
+    _selection = columnar.select(_data, scenario="scen_a", region=["Region B", "X"])
+    assert columnar.to_frame(_selection)["value"].tolist() == [18]
+
+    _converted = columnar.convert_unit(_data, "PJ", to="TWh", factor=1 / 3.6)
+    assert columnar.get_values(_converted, "unit") == ["TWh"]
+    assert columnar.to_frame(_converted)["value"].tolist() == [2, 5, 10]
+
+    _renamed = columnar.rename(_converted, "region", {"Region B": "Region A"})
+    _aggregated = columnar.to_frame(
+        columnar.sum_duplicates(columnar.concat([_renamed, _renamed]))
+    )
+    assert _aggregated["region"].tolist() == ["Region A", "Region A"]
+    assert _aggregated["value"].tolist() == [14, 20]
+
+
+def test_classify_heat_generation_columnar():
+    _df = _create_iamdf()
+    _needs = {"Biomass": 5, "Hydrogen": 800}
+
+    _classified, _aggregated = classify_heat_generation(
+        columnar.from_iamdf(_df), _needs
+    )
+    _classified_iamdf, _aggregated_iamdf = classify_heat_generation(_df, _needs)
+
+    assert columnar.is_columnar(_aggregated)
+    assert pyam.compare(columnar.to_iamdf(_classified), _classified_iamdf).empty
+    assert pyam.compare(columnar.to_iamdf(_aggregated), _aggregated_iamdf).empty
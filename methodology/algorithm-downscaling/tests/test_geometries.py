@@ -0,0 +1,101 @@
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import box
+from geometries import create_geometry_derivatives
+from geometries import find_overlapping_bounds
+from geometries import get_centroids
+from geometries import read_geometry_derivatives
+from iterative_downscaling import create_connection_lines
+
+
+def _create_geometries():
+    # 'C' only shares a corner with 'B', 'D' is separated from the others
+    return gpd.GeoDataFrame(
+        {"region": ["A", "B", "C", "D", "A"]},
+        geometry=[
+            box(0, 0, 2, 1),
+            box(2, 0, 4, 1),
+            box(4, 1, 5, 2),
+            box(7, 0, 8, 1),
+            box(0, 0, 1, 1),
+        ],
+        crs="EPSG:3035",
+    )
+
+
+def test_create_geometry_derivatives():
+    _derivatives = create_geometry_derivatives(_create_geometries())
+
+    assert list(_derivatives.index) == ["A", "B", "C", "D"]
+    assert _derivatives.loc["A", ["x", "y", "area", "perimeter"]].tolist() == [
+        1,
+        0.5,
+        2,
+        6,
+    ]
+    assert _derivatives.loc["C", ["minx", "miny", "maxx", "maxy"]].tolist() == [
+        4,
+        1,
+        5,
+        2,
+    ]
+    assert get_centroids(_derivatives, ["B"]).iloc[0].coords[0] == (3, 0.5)
+    assert find_overlapping_bounds(_derivatives, ["A", "B", "C", "D"]).tolist() == [
+        [0, 1],
+        [1, 2],
+    ]
+
+
+def test_find_overlapping_bounds():
+    _random = np.random.default_rng(1)
+    _min = _random.uniform(0, 100, size=(300, 2))
+    _max = _min + _random.uniform(0, 5, size=(300, 2))
+    # Touching boxes are included
+    _max[1] = _min[0]
+    _derivatives = pd.DataFrame(
+        np.hstack([_min, _max]),
+        columns=["minx", "miny", "maxx", "maxy"],
+        index=[f"R{_i}" for _i in range(300)],
+    )
+
+    _overlap = (
+        (_min[:, None, 0] <= _max[None, :, 0])
+        & (_min[None, :, 0] <= _max[:, None, 0])
+        & (_min[:, None, 1] <= _max[None, :, 1])
+        & (_min[None, :, 1] <= _max[:, None, 1])
+    )
+    _pairs = find_overlapping_bounds(_derivatives, list(_derivatives.index))
+    assert [0, 1] in _pairs.tolist()
+    assert _pairs.tolist() == np.argwhere(np.triu(_overlap, k=1)).tolist()
+
+
+def test_read_geometry_derivatives(tmp_path):
+    _geometries = str(tmp_path / "geometries.parquet")
+    _create_geometries().to_parquet(_geometries)
+
+    _derivatives = read_geometry_derivatives(_geometries)
+    assert os.path.exists(tmp_path / "geometries.derivatives.parquet")
+
+    # the derivatives are read instead of the geometries
+    os.remove(_geometries)
+    assert read_geometry_derivatives(_geometries).equals(_derivatives)
+
+
+def test_create_connection_lines():
+    _network = _create_geometries().iloc[:4]
+    _network = _network.assign(
+        NUTS3_CODE="AT127", scenario="S", variable="Centralized", value=1
+    )
+
+    _lines = create_connection_lines(_network, subregion="AT127", scenario="S")
+    assert _lines[["START", "END"]].values.tolist() == [["A", "B"]]
+    assert list(_lines.geometry.iloc[0].coords) == [(1, 0.5), (3, 0.5)]
+
+    _derivatives = create_geometry_derivatives(_create_geometries())
+    assert _lines.equals(
+        create_connection_lines(
+            _network, subregion="AT127", scenario="S", derivatives=_derivatives
+        )
+    )
@@ -0,0 +1,247 @@
+import os
+import pytest
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import box
+from shapely.geometry import LineString
+
+from iterative_downscaling import *
+
+
+def _create_quantities(n=4):
+    _rows = []
+    _geometry = []
+    for i in range(n):
+        for j in range(n):
+            _region = "AT127|LAU {}-{}".format(i, j)
+            _rows.append([_region, "Centralized", 0.5 + (3 * i + 5 * j) % 7 / 3])
+            _rows.append([_region, "Decentralized", 1.25 + (2 * i + j) % 5 / 7])
+            _geometry.extend([box(i, j, i + 1, j + 1)] * 2)
+
+    _df = gpd.GeoDataFrame(
+        pd.DataFrame(_rows, columns=["region", "variable", "value"]),
+        geometry=_geometry,
+    )
+    _df["NUTS3_CODE"] = "AT127"
+    return _df
+
+
+def _create_lines(n=4, components=False):
+    _lines = []
+    for i in range(n):
+        for j in range(n):
+            for di, dj in [(1, 0), (0, 1), (1, 1)]:
+                # Optionally, split the grid into two components along i = 1|2
+                if components and i == 1 and di == 1:
+                    continue
+                if i + di < n and j + dj < n:
+                    _lines.append(
+                        [
+                            "AT127|LAU {}-{}".format(i, j),
+                            "AT127|LAU {}-{}".format(i + di, j + dj),
+                            LineString([(i, j), (i + di, j + dj)]),
+                        ]
+                    )
+
+    _df = pd.DataFrame(_lines, columns=["START", "END", "geometry"])
+    return gpd.GeoDataFrame(_df, geometry="geometry")
+
+
+def test_iterative_downscaling():
+
+    quantities = _create_quantities()
+    lines = _create_lines()
+
+    generation, final_lines, benchmark, removed = iterative_downscaling(
+        quantities, lines
+    )
+
+    _total = quantities.loc[quantities["variable"] == "Centralized", "value"].sum()
+    assert abs(generation["value"].sum() - _total) < 1e-9
+    assert len(generation) + len(removed) == 16
+    assert benchmark.shape == (16, len(removed) + 1)
+    assert benchmark.loc[removed["region"]].iloc[:, -1].isna().all()
+    assert set(final_lines["START"]) <= set(generation["region"])
+
+    # Nodes removed in iteration k have the lowest indicator value in column k
+    assert removed["iteration"].tolist() == list(range(len(removed)))
+    for _region, _k in zip(removed["region"], removed["iteration"]):
+        assert benchmark.loc[_region, _k] == benchmark[_k].min()
+        assert pd.isna(benchmark.loc[_region, _k + 1])
+
+
+def test_iterative_downscaling_components():
+
+    quantities = _create_quantities()
+    lines = _create_lines(components=True)
+
+    serial = iterative_downscaling(quantities, lines)
+    # The components are evaluated in this process or in two workers
+    for processes in [1, 2]:
+        parallel = iterative_downscaling(quantities, lines, processes=processes)
+        for _s, _p in zip(serial, parallel):
+            pd.testing.assert_frame_equal(_s, _p, check_exact=True)
+
+
+def test_iterative_downscaling_batch():
+
+    quantities = _create_quantities(n=6)
+    lines = _create_lines(n=6)
+
+    single = iterative_downscaling(quantities, lines)
+    batch = iterative_downscaling(quantities, lines, batch_size=1)
+
+    for _s, _b in zip(single, batch):
+        pd.testing.assert_frame_equal(_s, _b)
+
+    batch = iterative_downscaling(quantities, lines, batch_size=5)
+    differences = compare_removal_traces(single[3], batch[3])
+
+    _total = quantities.loc[quantities["variable"] == "Centralized", "value"].sum()
+    assert abs(batch[0]["value"].sum() - _total) < 1e-9
+    assert differences["iterations"][1] < differences["iterations"][0]
+    assert compare_removal_traces(single[3], single[3])["identical"]
+
+
+def test_beam_search_downscaling():
+
+    quantities = _create_quantities(n=5)
+    lines = _create_lines(n=5)
+    population = {_r: len(_r) % 4 for _r in quantities["region"]}
+
+    greedy = iterative_downscaling(quantities, lines, population)
+    beam = beam_search_downscaling(
+        quantities, lines, population, beam_width=1, branching=1
+    )
+    assert beam.loc[0, "removed"] == greedy[3]["region"].tolist()
+
+    pareto = beam_search_downscaling(quantities, lines, population, beam_width=3)
+    assert pareto["NUTS3_CODE"].unique().tolist() == ["AT127"]
+    assert pareto.loc[0, "population"] <= greedy[3]["population"].sum()
+
+    parallel = beam_search_downscaling(
+        quantities, lines, population, beam_width=3, processes=2
+    )
+    pd.testing.assert_frame_equal(parallel, pareto)
+
+
+def test_iterative_downscaling_checkpoint(tmp_path, monkeypatch):
+
+    quantities = _create_quantities(n=5)
+    lines = _create_lines(n=5)
+    checkpoint = str(tmp_path / "checkpoint.npz")
+
+    complete = iterative_downscaling(quantities, lines)
+
+    # The first run is interrupted in the 4th iteration (after the checkpoint
+    # of the 2nd iteration)
+    _calls = list()
+
+    def _interrupted(*args):
+        _calls.append(args)
+        if len(_calls) > 3:
+            raise RuntimeError("interrupted")
+        return select_nodes_to_drop(*args)
+
+    with monkeypatch.context() as _patch:
+        _patch.setattr("iterative_downscaling.select_nodes_to_drop", _interrupted)
+        with pytest.raises(RuntimeError, match="interrupted"):
+            iterative_downscaling(
+                quantities, lines, checkpoint=checkpoint, checkpoint_interval=2
+            )
+    assert read_checkpoint(checkpoint)["iteration"] == 2
+
+    # Other quantities (e.g., scenarios with the same nodes) or parameters
+    # do not resume from the checkpoint
+    other = quantities.assign(value=quantities["value"] * 2)
+    with pytest.raises(ValueError, match="different run"):
+        iterative_downscaling(other, lines, checkpoint=checkpoint)
+    with pytest.raises(ValueError, match="different run"):
+        iterative_downscaling(quantities, lines, batch_size=2, checkpoint=checkpoint)
+
+    resumed = iterative_downscaling(quantities, lines, checkpoint=checkpoint)
+    for _c, _r in zip(complete, resumed):
+        pd.testing.assert_frame_equal(_c, _r)
+
+    # The checkpoint of a completed run is removed
+    assert not os.path.exists(checkpoint)
+
+
+def test_write_results(tmp_path):
+
+    quantities = _create_quantities()
+    lines = _create_lines()
+    generation, final_lines, benchmark, removed = iterative_downscaling(
+        quantities, lines
+    )
+
+    for path in [str(tmp_path / "results.gpkg"), str(tmp_path / "results")]:
+        for scenario in ["Gradual Development", "Directed Transition"]:
+            key = dict(country="AT", NUTS3_CODE="AT127", scenario=scenario, run_id=1)
+            write_results(
+                path, key, generation, final_lines, benchmark, quantities, removed
+            )
+
+        if path.endswith(".gpkg"):
+            _generation = gpd.read_file(path, layer="generation")
+            _indicators = gpd.read_file(path, layer="indicators")
+        else:
+            _generation = gpd.read_parquet(os.path.join(path, "generation"))
+            _indicators = pd.read_parquet(os.path.join(path, "indicators"))
+
+        assert len(_generation) == 2 * len(generation)
+        assert set(_generation["scenario"]) == {
+            "Gradual Development",
+            "Directed Transition",
+        }
+        assert len(_indicators) == 2 * benchmark.notna().sum().sum()
+
+
+def test_render_results(tmp_path):
+
+    quantities = _create_quantities()
+    lines = _create_lines()
+    generation, final_lines, benchmark, removed = iterative_downscaling(
+        quantities, lines
+    )
+
+    path = str(tmp_path / "results.gpkg")
+    for scenario in ["Gradual Development", "Directed Transition"]:
+        key = dict(country="AT", NUTS3_CODE="AT127", scenario=scenario, run_id=1)
+        write_results(path, key, generation, final_lines, benchmark, quantities)
+
+    files = render_results(
+        path, str(tmp_path / "figures"), processes=2, style="default", dpi=50
+    )
+
+    assert len(files) == 2
+    assert all(os.path.exists(_file) for _file in files)
+
+
+def test_read_lau_shapefile(tmp_path):
+    _shapefile = str(tmp_path / "laus.shp")
+    gpd.GeoDataFrame(
+        {
+            "CNTR_CODE": ["AT", "DE", "AT"],
+            "LAU_ID": ["1", "2", "3"],
+            "LAU_NAME": ["Achau", "Berlin", "Himberg"],
+            "POP_2019": [1, 2, 3],
+        },
+        geometry=[box(0, 0, 1, 1), box(1, 0, 2, 1), box(2, 0, 3, 1)],
+        crs="EPSG:3035",
+    ).to_file(_shapefile)
+
+    _laus = read_lau_shapefile("AT", _shapefile)
+    assert list(_laus.columns) == LAU_COLUMNS + ["geometry"]
+    assert _laus["LAU_NAME"].tolist() == ["Achau", "Himberg"]
+
+    # an extract of other columns is rebuilt (although it is newer)
+    _laus[["LAU_ID", "geometry"]].to_parquet(tmp_path / "laus.AT.parquet")
+    assert read_lau_shapefile("AT", _shapefile).equals(_laus)
+
+    # the extract of the country replaces the shapefile
+    for _suffix in [".shp", ".dbf", ".shx"]:
+        os.remove(str(tmp_path / "laus") + _suffix)
+    _extract = read_lau_shapefile("AT", _shapefile)
+    assert os.path.exists(tmp_path / "laus.AT.parquet")
+    assert _extract.equals(_laus) and _extract.crs == _laus.crs
@@ -0,0 +1,103 @@
+import os
+import pytest
+from pipeline import create_stage
+from pipeline import hash_stage
+from pipeline import order_stages
+from pipeline import run_pipeline
+
+
+def _scale(source=None, target=None, factor=None):
+    with open(source) as _file:
+        _value = float(_file.read())
+    with open(target, "w") as _file:
+        _file.write(str(_value * factor))
+
+
+def _create_stages(folder=None, factor=2):
+    _path = lambda _name: os.path.join(folder, _name)
+    # listed in reverse order of the dependencies
+    return [
+        create_stage(
+            "second",
+            _scale,
+            inputs=dict(source=_path("first.txt")),
+            outputs=dict(target=_path("second.txt")),
+            parameters=dict(factor=0),
+        ),
+        create_stage(
+            "first",
+            _scale,
+            inputs=dict(source=_path("input.txt")),
+            outputs=dict(target=_path("first.txt")),
+            parameters=dict(factor=factor),
+        ),
+    ]
+
+
+def test_order_stages(tmp_path):
+    _stages = _create_stages(tmp_path)
+    assert [_s["name"] for _s in order_stages(_stages)] == ["first", "second"]
+
+    _stages[1]["inputs"]["source"] = _stages[0]["outputs"]["target"]
+    with pytest.raises(ValueError, match="depend on each other"):
+        order_stages(_stages)
+
+
+def test_run_pipeline(tmp_path):
+    _state = os.path.join(tmp_path, "state.json")
+    (tmp_path / "input.txt").write_text("1")
+
+    _status = run_pipeline(_create_stages(tmp_path), _state)
+    assert _status == {"first": "run", "second": "run"}
+    assert run_pipeline(_create_stages(tmp_path), _state) == {
+        "first": "skipped",
+        "second": "skipped",
+    }
+
+    # 'first' rewrites the same content, so that 'second' is not affected
+    assert run_pipeline(_create_stages(tmp_path), _state, force=["first"]) == {
+        "first": "run",
+        "second": "skipped",
+    }
+
+    # changed parameters, inputs and missing outputs are rerun
+    assert run_pipeline(_create_stages(tmp_path, factor=3), _state) == {
+        "first": "run",
+        "second": "run",
+    }
+    (tmp_path / "input.txt").write_text("2")
+    assert run_pipeline(_create_stages(tmp_path, factor=3), _state) == {
+        "first": "run",
+        "second": "run",
+    }
+    os.remove(tmp_path / "second.txt")
+    assert run_pipeline(_create_stages(tmp_path, factor=3), _state) == {
+        "first": "skipped",
+        "second": "run",
+    }
+    assert (tmp_path / "first.txt").read_text() == "6.0"
+
+
+def test_run_pipeline_nested_folders(tmp_path):
+    # neither the folder of the state nor of the outputs exists yet
+    _state = os.path.join(tmp_path, "results", "state.json")
+    (tmp_path / "input.txt").write_text("1")
+    _stages = _create_stages(tmp_path)
+    _stages[1]["outputs"]["target"] = os.path.join(tmp_path, "nested", "first.txt")
+    _stages[0]["inputs"]["source"] = _stages[1]["outputs"]["target"]
+
+    assert run_pipeline(_stages, _state) == {"first": "run", "second": "run"}
+    assert os.path.exists(_state)
+    assert (tmp_path / "nested" / "first.txt").read_text() == "2.0"
+
+
+def test_hash_stage_modules(tmp_path, monkeypatch):
+    (tmp_path / "algorithm.py").write_text("FACTOR = 2\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    _stage = create_stage("first", _scale, modules=["algorithm"])
+    _hash = hash_stage(_stage)
+
+    # a change of a declared module changes the hash of the stage
+    (tmp_path / "algorithm.py").write_text("FACTOR = 3\n")
+    assert hash_stage(_stage) != _hash
+    assert hash_stage(create_stage("first", _scale)) != _hash
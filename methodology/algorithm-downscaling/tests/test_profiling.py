@@ -0,0 +1,97 @@
+import json
+import threading
+import time
+
+import pytest
+
+import profiling
+
+
+def test_stage_disabled():
+
+    with profiling.stage("stage", regions=3) as counts:
+        counts["edges"] = 2
+
+    assert profiling.ENABLED is False
+    assert counts == {"regions": 3, "edges": 2}
+
+
+def test_stage(tmp_path, monkeypatch):
+
+    path = tmp_path / "profile.jsonl"
+    monkeypatch.setattr(profiling, "ENABLED", True)
+    monkeypatch.setattr(profiling, "_file", open(path, "w"))
+
+    with profiling.stage("outer", regions=3) as counts:
+        with profiling.stage("inner"):
+            profiling.record("iteration", iteration=1)
+        counts["edges"] = 2
+    profiling._file.close()
+
+    records = [json.loads(_line) for _line in open(path)]
+    assert [_r["stage"] for _r in records] == [
+        "outer/inner/iteration",
+        "outer/inner",
+        "outer",
+    ]
+    assert records[2]["regions"] == 3 and records[2]["edges"] == 2
+    assert records[2]["wall"] >= records[1]["wall"] >= 0
+
+
+def test_stage_threads(tmp_path, monkeypatch):
+
+    path = tmp_path / "profile.jsonl"
+    monkeypatch.setattr(profiling, "ENABLED", True)
+    monkeypatch.setattr(profiling, "_file", open(path, "w"))
+
+    def _run(name):
+        with profiling.stage(name):
+            for _iteration in range(50):
+                with profiling.stage("inner"):
+                    profiling.record("iteration", iteration=_iteration)
+
+    _threads = [threading.Thread(target=_run, args=(f"t{_i}",)) for _i in range(4)]
+    for _thread in _threads:
+        _thread.start()
+    for _thread in _threads:
+        _thread.join()
+    profiling._file.close()
+
+    records = [json.loads(_line) for _line in open(path)]
+    assert len(records) == 4 * (1 + 50 * 2)
+    assert {_r["stage"].split("/")[0] for _r in records} == {"t0", "t1", "t2", "t3"}
+    assert {_r["stage"].split("/", 1)[-1] for _r in records} == {
+        "inner/iteration",
+        "inner",
+        "t0",
+        "t1",
+        "t2",
+        "t3",
+    }
+
+
+@pytest.mark.skipif(
+    profiling.current_memory() is None, reason="resident set size not available"
+)
+def test_stage_peak_memory(tmp_path, monkeypatch):
+
+    path = tmp_path / "profile.jsonl"
+    monkeypatch.setattr(profiling, "ENABLED", True)
+    monkeypatch.setattr(profiling, "_file", open(path, "w"))
+
+    with profiling.stage("outer"):
+        with profiling.stage("allocate"):
+            _data = b"x" * 200 * 1024**2
+            time.sleep(0.1)
+            del _data
+        with profiling.stage("idle"):
+            time.sleep(0.1)
+    profiling._file.close()
+
+    records = {_r["stage"]: _r for _r in map(json.loads, open(path))}
+    assert records["outer/allocate"]["peak_memory"] >= (
+        records["outer/idle"]["peak_memory"] + 150
+    )
+    assert records["outer"]["peak_memory"] >= records["outer/allocate"]["peak_memory"]
+    # The high-water mark of the process is not reset after the allocation
+    assert records["outer/idle"]["max_rss"] > records["outer/idle"]["peak_memory"] + 150
@@ -0,0 +1,29 @@
+import pytest
+from regions import create_region_registry
+from regions import encode_regions
+from regions import decode_regions
+
+
+_REGIONS = ["AT127|Achau", "AT130|Wien|5", "AT127|Achau", "AT127|Laxenburg"]
+
+
+def test_create_region_registry():
+    _registry = create_region_registry(_REGIONS, lau_codes={"AT127|Achau": 31701})
+    assert list(_registry.index) == ["AT127|Achau", "AT130|Wien|5", "AT127|Laxenburg"]
+    assert list(_registry["NUTS3_CODE"]) == ["AT127", "AT130", "AT127"]
+    assert list(_registry["LAU_NAME"]) == ["Achau", "Wien", "Laxenburg"]
+    assert list(_registry["district"]) == [None, "5", None]
+    assert list(_registry["LAU_CODE"]) == [31701, -1, -1]
+
+
+def test_encode_decode_regions():
+    _registry = create_region_registry(_REGIONS)
+    _ids = encode_regions(_registry, _REGIONS)
+    assert list(_ids) == [0, 1, 0, 2]
+    assert list(decode_regions(_registry, _ids)) == _REGIONS
+
+
+def test_encode_regions_fail():
+    _registry = create_region_registry(_REGIONS)
+    with pytest.raises(ValueError, match="Himberg"):
+        encode_regions(_registry, ["AT127|Achau", "AT127|Himberg"])
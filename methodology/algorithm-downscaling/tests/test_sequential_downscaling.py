@@ -115,3 +115,19 @@ def test_sequential_downscaling():
     )
 
     assert is_df.equals(_SOL_DF) == True
+
+
+def test_classify_heat_generation():
+
+    heat_generation = _create_gen_iamdf()
+    needs = {"Biomass": 5, "Hydrogen": 800}
+
+    classified, aggregated = classify_heat_generation(heat_generation, needs)
+
+    assert set(classified.variable) == {
+        "Centralized|Hydrogen",
+        "Decentralized|Biomass",
+        "Decentralized|Direct-electric",
+    }
+    _values = aggregated.data.set_index("variable")["value"].to_dict()
+    assert _values == {"Centralized": 3, "Decentralized": 3}
@@ -0,0 +1,134 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+import pytest
+import pyarrow as pa
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import box
+
+import service
+from service import create_server
+
+
+def _create_network(n=3):
+    # Grid of n x n LAUs of one sub-region and scenario
+    _rows = []
+    _geometry = []
+    for i in range(n):
+        for j in range(n):
+            _region = "AT127|LAU {}-{}".format(i, j)
+            _rows.append([_region, "Centralized", 0.5 + (3 * i + 5 * j) % 7 / 3])
+            _rows.append([_region, "Decentralized", 1.25 + (2 * i + j) % 5 / 7])
+            _geometry.extend([box(i, j, i + 1, j + 1)] * 2)
+
+    _df = pd.DataFrame(_rows, columns=["region", "variable", "value"])
+    _df = _df.assign(NUTS3_CODE="AT127", scenario="S", unit="TWh")
+    return gpd.GeoDataFrame(_df, geometry=_geometry, crs="EPSG:3035")
+
+
+@pytest.fixture(scope="module")
+def url():
+    _server = create_server(port=0)
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    yield "http://127.0.0.1:{}".format(_server.server_address[1])
+    _server.shutdown()
+    _server.server_close()
+
+
+@pytest.fixture(scope="module")
+def network_url():
+    _server = create_server(port=0, network=_create_network())
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    yield "http://127.0.0.1:{}".format(_server.server_address[1])
+    _server.shutdown()
+    _server.server_close()
+
+
+def _post(url=None, path=None, request=None, accept=None):
+    _request = urllib.request.Request(url + path, json.dumps(request).encode())
+    if accept is not None:
+        _request.add_header("Accept", accept)
+    try:
+        with urllib.request.urlopen(_request) as _r:
+            _body = _r.read()
+            if accept == service.ARROW_TYPE:
+                return _r.status, pa.ipc.open_stream(_body).read_pandas()
+            return _r.status, json.loads(_body)
+    except urllib.error.HTTPError as _error:
+        return _error.code, json.loads(_error.read())
+
+
+def test_service_sequential(url):
+    _request = {"scenario": "Directed Transition", "regions": ["AT312"]}
+    _status, _response = _post(url, "/sequential", _request)
+    assert _status == 200
+    assert {_r["region"] for _r in _response["aggregated"]} == {"AT312"}
+
+    # technologies/sources without requirements are decentralized
+    _request["requirements"] = {"Geothermal": 0, "Hydrogen": 0, "Waste": 0}
+    _status, _changed = _post(url, "/sequential", _request)
+    assert _status == 200
+    assert _changed["aggregated"] != _response["aggregated"]
+
+
+def test_service_errors(url):
+    assert _post(url, "/sequential", {"scenario": "Unknown"})[0] == 400
+    assert _post(url, "/iterative", {"NUTS3": "AT312", "scenario": "x"})[0] == 400
+    assert _post(url, "/unknown", {})[0] == 404
+
+
+def test_service_arrow(url):
+    _request = {"scenario": "Directed Transition", "regions": ["AT312"]}
+    _status, _json = _post(url, "/sequential", _request)
+
+    _request["table"] = "aggregated"
+    _status, _table = _post(url, "/sequential", _request, service.ARROW_TYPE)
+    assert _status == 200
+    pd.testing.assert_frame_equal(_table, pd.DataFrame(_json["aggregated"]))
+
+    _request["table"] = "unknown"
+    assert _post(url, "/sequential", _request, service.ARROW_TYPE)[0] == 400
+
+
+def test_service_iterative(network_url):
+    _status, _response = _post(
+        network_url, "/iterative", {"NUTS3": "AT127", "scenario": "S"}
+    )
+    assert _status == 200
+
+    _network = _create_network()
+    _total = _network.loc[_network["variable"] == "Centralized", "value"].sum()
+    _generation = pd.DataFrame(_response["generation"])
+    assert abs(_generation["value"].sum() - _total) < 1e-9
+    assert len(_generation) + len(_response["removed_population"]) == 9
+
+
+def test_service_internal_errors(url, monkeypatch):
+    def _failing(service=None, request=None):
+        raise KeyError("bug")
+
+    # errors of the downscaling are no invalid requests
+    monkeypatch.setitem(service.ENDPOINTS, "/sequential", _failing)
+    _status, _response = _post(url, "/sequential", {"scenario": "x"})
+    assert _status == 500
+    assert _response["error"] == "KeyError: 'bug'"
+    assert _post(url, "/sequential", {})[0] == 400
+
+
+def test_service_workers():
+    _server = create_server(port=0, workers=2, network=_create_network())
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    _url = "http://127.0.0.1:{}".format(_server.server_address[1])
+    try:
+        # Both workers are started (and have loaded the inputs) in advance
+        _processes = _server.RequestHandlerClass.executor._processes
+        assert len(_processes) == 2
+        _status, _response = _post(
+            _url, "/iterative", {"NUTS3": "AT127", "scenario": "S"}
+        )
+        assert _status == 200
+    finally:
+        _server.shutdown()
+        _server.server_close()
@@ -1,11 +1,24 @@
+import os
+import subprocess
+import sys
 import pyam
 import pandas as pd
+import geopandas as gpd
+import pytest
+from shapely.geometry import LineString
 from utils import validate_input_data
 from utils import initialization
+from utils import classify_technologies
 from utils import pop_based_downscaling
 from utils import iamdf_to_dict
+from utils import iamdf_to_array
 from utils import sequential_algorithm
+from utils import validate_allocation
+from utils import ipf_algorithm
 from utils import dict_to_df
+from utils import calculate_heat_density
+from iterative_utils import make_networkx_from_shapefile
+from iterative_utils import add_quantities_to_nodes
 
 
 def _create_gen_iamdf(scenario=False):
@@ -83,6 +96,17 @@ def test_requirements_initialization():
     assert (_sol == _val) == True
 
 
+def test_classify_technologies():
+    _needs = {"Hydrogen": 1000, "Synthetic gas": 150, "Biomass": 0}
+    _val = classify_technologies(_needs)
+    _sol = {
+        "Hydrogen": "Centralized",
+        "Synthetic gas": "Centralized",
+        "Biomass": "Decentralized",
+    }
+    assert _val == _sol
+
+
 def test_pop_based_downscaling():
     _gen = _create_gen_iamdf()
     _pop = _create_population_iamdf()
@@ -150,6 +174,21 @@ def test_iamdf_to_dict():
     assert _dict == _sol
 
 
+def test_iamdf_to_dict_single_key():
+    _gen = _create_gen_iamdf()
+    _dict = iamdf_to_dict(df=_gen, keys=["variable"])
+    _sol = {"Hydrogen": 3, "Biomass": 2, "Direct-electric": 1}
+    assert _dict == _sol
+
+
+def test_iamdf_to_array():
+    _gen = _create_gen_iamdf()
+    _index, _values = iamdf_to_array(df=_gen, keys=["variable", "scenario"])
+    _dict = iamdf_to_dict(df=_gen, keys=["scenario", "variable"])
+    assert list(_index.names) == ["scenario", "variable"]
+    assert dict(zip(_index, _values)) == _dict
+
+
 def test_sequential_algorithm():
     _dict_gen = {("Scenario A", "Hydrogen"): 80, ("Scenario A", "Direct-electric"): 120}
     _dict_dem = {
@@ -171,6 +210,104 @@ def test_sequential_algorithm():
     assert _gen_local == _sol
 
 
+def test_ipf_algorithm():
+    _dict_gen = {("Scenario A", "Hydrogen"): 80, ("Scenario A", "Direct-electric"): 120}
+    _dict_dem = {
+        ("Scenario A", "West Austria"): 50,
+        ("Scenario A", "Middle Austria"): 50,
+        ("Scenario A", "East Austria"): 100,
+    }
+    _dict_req = {"Hydrogen": 100, "Direct-electric": 0}
+    _dict_pot = {"West Austria": 5, "Middle Austria": 50, "East Austria": 100}
+    _gen_local, _diagnostics = ipf_algorithm(
+        _dict_gen, _dict_dem, _dict_req, _dict_pot, "Scenario A"
+    )
+    _sol = {
+        ("Scenario A", "Hydrogen", "East Austria"): 80,
+        ("Scenario A", "Direct-electric", "East Austria"): 20,
+        ("Scenario A", "Direct-electric", "Middle Austria"): 50,
+        ("Scenario A", "Direct-electric", "West Austria"): 50,
+    }
+    assert _diagnostics["converged"]
+    assert _gen_local.keys() == _sol.keys()
+    assert all(abs(_gen_local[_k] - _sol[_k]) < 1e-6 for _k in _sol.keys())
+
+
+def test_ipf_algorithm_mismatch():
+    _dict_gen = {
+        ("Scenario A", "Hydrogen"): 60,
+        ("Scenario A", "Synthetic gas"): 60,
+        ("Scenario A", "Direct-electric"): 80,
+    }
+    _dict_dem = {
+        ("Scenario A", "West Austria"): 100,
+        ("Scenario A", "Middle Austria"): 50,
+        ("Scenario A", "East Austria"): 50,
+    }
+    _dict_req = {"Hydrogen": 100, "Synthetic gas": 50, "Direct-electric": 0}
+    _dict_pot = {"West Austria": 5, "Middle Austria": 50, "East Austria": 100}
+    _gen_local, _diagnostics = ipf_algorithm(
+        _dict_gen, _dict_dem, _dict_req, _dict_pot, "Scenario A"
+    )
+    _report = validate_allocation(_gen_local, _dict_gen, _dict_dem, "Scenario A")
+    assert not _diagnostics["converged"]
+    assert set(_report["check"]) == {"demand"}
+
+
+def test_validate_allocation():
+    _dict_gen = {("Scenario A", "Hydrogen"): 80, ("Scenario A", "Direct-electric"): 120}
+    _dict_dem = {
+        ("Scenario A", "West Austria"): 50,
+        ("Scenario A", "Middle Austria"): 50,
+        ("Scenario A", "East Austria"): 100,
+    }
+    _dict_req = {"Hydrogen": 100, "Direct-electric": 0}
+    _dict_pot = {"West Austria": 5, "Middle Austria": 50, "East Austria": 100}
+    _gen_local = sequential_algorithm(
+        _dict_gen, dict(_dict_dem), _dict_req, _dict_pot, "Scenario A"
+    )
+    _report = validate_allocation(_gen_local, _dict_gen, _dict_dem, "Scenario A")
+    assert _report.empty
+
+
+def test_validate_allocation_fail():
+    _dict_gen = {("Scenario A", "Hydrogen"): 80, ("Scenario A", "Direct-electric"): 120}
+    _dict_dem = {
+        ("Scenario A", "West Austria"): 100,
+        ("Scenario A", "East Austria"): 100,
+    }
+    _gen_local = {
+        ("Scenario A", "Hydrogen", "East Austria"): 110,
+        ("Scenario A", "Direct-electric", "East Austria"): -10,
+        ("Scenario A", "Direct-electric", "West Austria"): 100,
+    }
+    _report = validate_allocation(_gen_local, _dict_gen, _dict_dem, "Scenario A")
+    assert _report["check"].tolist() == ["generation", "generation", "negative"]
+    _variables = ["Hydrogen", "Direct-electric", "Direct-electric"]
+    assert _report["variable"].tolist() == _variables
+    assert _report["mismatch"].tolist() == [30, -30, -10]
+
+
+def test_validate_allocation_unknown():
+    _dict_gen = {("Scenario A", "Hydrogen"): 80}
+    _dict_dem = {("Scenario A", "East Austria"): 80}
+    _gen_local = {
+        ("Scenario A", "Hydrogen", "East Austria"): 80,
+        ("Scenario A", "Biomass", "East Austria"): 5,
+        ("Scenario A", "Hydrogen", "Tyrol"): 7,
+    }
+    _report = validate_allocation(_gen_local, _dict_gen, _dict_dem, "Scenario A")
+    assert _report["check"].tolist() == [
+        "generation",
+        "generation",
+        "demand",
+        "demand",
+    ]
+    assert _report["variable"].tolist() == ["Hydrogen", "Biomass", None, "Hydrogen"]
+    assert _report["region"].tolist() == [None, "East Austria", "East Austria", "Tyrol"]
+    assert _report["mismatch"].tolist() == [7, 5, 5, 7]
+
+
 def test_dict_to_df():
     dictionary = {("Scenario A", "Hydrogen", "Austria"): 100}
     column_names = ["Scenario", "Variable", "Region", "Value"]
@@ -183,3 +320,96 @@ def test_dict_to_df():
         columns=column_names,
     )
     assert DF.equals(df)
+
+
+def test_calculate_heat_density():
+    _gen = pyam.IamDataFrame(
+        pd.DataFrame(
+            [
+                ["model_a", "scen_a", "Region A", "Centralized", "TWh", 2],
+                ["model_a", "scen_a", "Region A", "Decentralized", "TWh", 5],
+                ["model_a", "scen_a", "Region B", "Centralized", "TWh", 3],
+            ],
+            columns=["model", "scenario", "region", "variable", "unit", 2050],
+        )
+    )
+    _area = pyam.IamDataFrame(
+        pd.DataFrame(
+            [
+                ["model_a", "Baseline", "Region A", "Total area", "km**2", 500],
+                ["model_a", "Baseline", "Region B", "Total area", "km**2", 1500],
+            ],
+            columns=["model", "scenario", "region", "variable", "unit", 2050],
+        )
+    )
+    _hd = calculate_heat_density(_gen, _area).data
+    assert list(_hd["unit"].unique()) == ["GWh/km**2"]
+    assert _hd["value"].tolist() == [4, 2]
+
+
+def _create_connection_lines():
+    return gpd.GeoDataFrame(
+        {
+            "START": ["AT127|Achau", "AT127|Achau", "AT127|Himberg"],
+            "END": ["AT127|Himberg", "AT127|Laxenburg", "AT127|Laxenburg"],
+        },
+        geometry=[
+            LineString([(0, 0), (3, 4)]),
+            LineString([(0, 0), (6, 0)]),
+            LineString([(3, 4), (6, 0)]),
+        ],
+    )
+
+
+def test_make_networkx_from_shapefile():
+    _graph = make_networkx_from_shapefile(_create_connection_lines())
+    assert list(_graph.nodes) == ["AT127|Himberg", "AT127|Achau", "AT127|Laxenburg"]
+    assert _graph.number_of_edges() == 3
+    assert _graph["AT127|Achau"]["AT127|Himberg"]["weight"] == 5
+    assert _graph["AT127|Laxenburg"]["AT127|Achau"]["weight"] == 6
+
+
+def _create_node_quantities():
+    return pd.DataFrame(
+        [
+            ["AT127|Achau", "Centralized", 2],
+            ["AT127|Achau", "Decentralized", 3],
+            ["AT127|Himberg", "Centralized", 4],
+            ["AT127|Himberg", "Decentralized", 1],
+            ["AT127|Laxenburg", "Centralized", 0],
+            ["AT127|Laxenburg", "Decentralized", 5],
+        ],
+        columns=["region", "variable", "value"],
+    )
+
+
+def test_add_quantities_to_nodes():
+    _graph = make_networkx_from_shapefile(_create_connection_lines())
+    _graph = add_quantities_to_nodes(_graph, _create_node_quantities())
+    assert _graph.nodes["AT127|Achau"] == {"Centralized": 2, "Decentralized": 3}
+    assert _graph.nodes["AT127|Laxenburg"] == {"Centralized": 0, "Decentralized": 5}
+
+
+def test_add_quantities_to_nodes_fail():
+    _graph = make_networkx_from_shapefile(_create_connection_lines())
+    _quantities = _create_node_quantities()
+    _quantities.loc[0, "region"] = "AT127|Himberg"
+    with pytest.raises(ValueError, match="Achau.*Himberg"):
+        add_quantities_to_nodes(_graph, _quantities)
+
+
+def test_lazy_imports():
+    # the heavy dependencies are only imported by the functions that use them
+    _code = (
+        "import sys, utils, sequential_downscaling, iterative_downscaling; "
+        "print(' '.join(sorted({'pyam', 'geopandas', 'matplotlib'} & "
+        "set(sys.modules))))"
+    )
+    _output = subprocess.run(
+        [sys.executable, "-c", _code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    ).stdout
+    assert _output.split() == []
@@ -1,8 +1,9 @@
-import pyam as py
 import logging
 import pandas as pd
 import numpy as np
-import networkx as nx
+
+import columnar
+from columnar import IAMC_COLUMNS
 
 
 logger = logging.getLogger(__name__)
@@ -18,16 +19,17 @@ def validate_input_data(generation=None, pop_density=None, population=None):
 
     Parameters
     ----------
-    generation : IamDataFrame, required
-        Includes the heat generation by technology/source.
+    generation : IamDataFrame or dict, required
+        Includes the heat generation by technology/source (IamDataFrame or
+        columnar data, see 'columnar').
         So far, it is necessary to include values of one scenario here.
         This will be updated in further extensions.
         The default is None.
-    pop_density : IamDataFrame, required
+    pop_density : IamDataFrame or dict, required
         Includes the population density of the regions (areas to be downscaled).
         The scenario should be the same as the one of the generation parameter.
         The default is None.
-    population : IamDataFrame, required
+    population : IamDataFrame or dict, required
         Includes the population per region.
         The scenario should be the same as the one of the 'generation' parameter.
         The default is None.
@@ -43,11 +45,12 @@ def validate_input_data(generation=None, pop_density=None, population=None):
     _string = []
     check = True
 
-    if not isinstance(generation, py.IamDataFrame):
+    _is_iamc = lambda _df: columnar.is_iamdf(_df) or columnar.is_columnar(_df)
+    if not _is_iamc(generation):
         _string.append("Generation")
-    if not isinstance(pop_density, py.IamDataFrame):
+    if not _is_iamc(pop_density):
         _string.append("Population density")
-    if not isinstance(population, py.IamDataFrame):
+    if not _is_iamc(population):
         _string.append("Population")
 
     n = len(_string)
@@ -63,10 +66,14 @@ def validate_input_data(generation=None, pop_density=None, population=None):
     else:
         logger.info("All input data is in the IamDataFrame format")
 
-        _sce = generation.scenario
+        generation = columnar.from_iamdf(generation)
+        pop_density = columnar.from_iamdf(pop_density)
+        population = columnar.from_iamdf(population)
+
+        _sce = columnar.get_values(generation, "scenario")
         for _s in _sce:
-            _pop_den_regions = pop_density.filter(scenario=_s).region
-            _pop_regions = population.filter(scenario=_s).region
+            _pop_den_regions = columnar.select(pop_density, scenario=_s)["region"]
+            _pop_regions = columnar.select(population, scenario=_s)["region"]
             if not set(_pop_den_regions) == set(_pop_regions):
                 _string.append(_s)
 
@@ -120,18 +127,49 @@ def initialization(technologies=None, requirements=None):
     return full_req
 
 
+def classify_technologies(requirements=None, threshold=150):
+
+    """
+
+    Parameters
+    ----------
+    requirements : dict, required
+        Includes the heat network infrastructure requirements of the different
+        heat generation technologies/sources.
+        The default is None.
+    threshold : float, optional
+        Minimum requirement of a technology/source to be supplied by a
+        (centralized) heat network.
+        The default is 150.
+
+    Returns
+    -------
+    categories : dict
+        Maps each technology/source to either 'Centralized' or 'Decentralized'.
+
+    """
+
+    categories = {
+        _t: "Centralized" if _v >= threshold else "Decentralized"
+        for _t, _v in requirements.items()
+    }
+
+    return categories
+
+
 def pop_based_downscaling(generation=None, population=None):
 
     """
 
     Parameters
     ----------
-    generation : IamDataFrame, required
-        Includes the heat generation by technology/source.
+    generation : IamDataFrame or dict, required
+        Includes the heat generation by technology/source (IamDataFrame or
+        columnar data, see 'columnar').
         So far, it is necessary to include values of one scenario here.
         This will be updated in further extensions.
         The default is None.
-    population : IamDataFrame, required
+    population : IamDataFrame or dict, required
         Includes the population per region.
         The scenario should be the same as the one of the 'generation' parameter.
         The default is None.
@@ -146,20 +184,21 @@ def pop_based_downscaling(generation=None, population=None):
 
     """
 
-    total_generation = dict()
+    generation = columnar.from_iamdf(generation)
+    population = columnar.from_iamdf(population)
+
     demand = dict()
-    scenarios = generation.scenario
+    scenarios = columnar.get_values(generation, "scenario")
     for _sce in scenarios:
-        total_generation = generation.filter(scenario=_sce).data["value"].sum()
-        total_population = population.filter(scenario=_sce).data["value"].sum()
-        for _r in population.filter(scenario=_sce).region:
-            demand[_sce, _r] = (
-                total_generation
-                * (
-                    population.filter(scenario=_sce, region=_r).data["value"]
-                    / total_population
-                )[0]
-            )
+        total_generation = columnar.select(generation, scenario=_sce)["value"].sum()
+        _population = columnar.select(population, scenario=_sce)
+        _share = _population["value"] / _population["value"].sum()
+        # Only the first value per region is considered
+        _first = dict()
+        for _r, _s in zip(_population["region"].tolist(), _share):
+            _first.setdefault(_r, _s)
+        for _r in sorted(_first):
+            demand[_sce, _r] = total_generation * _first[_r]
 
     return demand
 
@@ -170,13 +209,14 @@ def iamdf_to_dict(df=None, keys=None):
 
     Parameters
     ----------
-    df : IamDataFrame, required
-        Includes the data in the IAMC format that is tranformed to a dict.
+    df : IamDataFrame or dict, required
+        Includes the data in the IAMC format that is tranformed to a dict
+        (IamDataFrame or columnar data, see 'columnar').
         The default is none.
     keys : list, required
         A list containing the columns of the IamDataFrame used as key.
-        The order of elements within the list needs to be same as the columns
-        of the IamDataFrame (IAMC format).
+        The key tuples follow the column order of the IAMC format,
+        independent of the order of elements within the list.
         The default is None.
 
     Returns
@@ -186,31 +226,56 @@ def iamdf_to_dict(df=None, keys=None):
 
     """
 
-    _dict = dict()
-    _pandas_df = df.data
-    for index, row in _pandas_df.iterrows():
-        _k = []
-        if "model" in keys:
-            _k.append(row["model"])
-        if "scenario" in keys:
-            _k.append(row["scenario"])
-        if "region" in keys:
-            _k.append(row["region"])
-        if "variable" in keys:
-            _k.append(row["variable"])
-        if "unit" in keys:
-            _k.append(row["unit"])
-        if "year" in keys:
-            _k.append(row["year"])
-
-        if len(keys) == 1:
-            _dict[_k[0]] = row["value"]
-        else:
-            _dict[tuple(_k)] = row["value"]
+    _data = columnar.from_iamdf(df)
+    _columns = [_c for _c in IAMC_COLUMNS if _c in keys]
+
+    if len(_columns) == 1:
+        _keys = _data[_columns[0]].tolist()
+    else:
+        _keys = zip(*(_data[_c].tolist() for _c in _columns))
+    _dict = dict(zip(_keys, _data["value"].tolist()))
 
     return _dict
 
 
+def iamdf_to_array(df=None, keys=None):
+
+    """
+
+    Parameters
+    ----------
+    df : IamDataFrame or dict, required
+        Includes the data in the IAMC format that is tranformed to an array
+        (IamDataFrame or columnar data, see 'columnar').
+        The default is none.
+    keys : list, required
+        A list containing the columns of the IamDataFrame used as index.
+        The index levels follow the column order of the IAMC format,
+        independent of the order of elements within the list.
+        The default is None.
+
+    Returns
+    -------
+    index : Index or MultiIndex
+        The labels of the selected columns, aligned with 'values'.
+    values : ndarray
+        The values of the IamDataFrame as a float array.
+
+    """
+
+    _data = columnar.from_iamdf(df)
+    _columns = [_c for _c in IAMC_COLUMNS if _c in keys]
+
+    _arrays = [np.asarray(_data[_c]) for _c in _columns]
+    if len(_columns) == 1:
+        index = pd.Index(_arrays[0], name=_columns[0])
+    else:
+        index = pd.MultiIndex.from_arrays(_arrays, names=_columns)
+    values = np.asarray(_data["value"], dtype=float)
+
+    return index, values
+
+
 def sequential_algorithm(
     generation=None, demand=None, requirements=None, potential=None, scenario=None
 ):
@@ -269,247 +334,315 @@ def sequential_algorithm(
             _q = (demand[scenario, _l] / _load) * generation[scenario, _k_req]
             quantity[scenario, _k_req, _l] = _q
             demand[scenario, _l] -= quantity[scenario, _k_req, _l]
-            if np.round(demand[scenario, _l], 6) < 0:
-                print("Heat demand/generation mismatch - under construction")
 
     return quantity
 
 
-def dict_to_df(dictionary=None, col_name=None):
+def ipf_algorithm(
+    generation=None,
+    demand=None,
+    requirements=None,
+    potential=None,
+    scenario=None,
+    tolerance=1e-9,
+    max_iterations=1000,
+):
 
     """
 
     Parameters
     ----------
-    dictionary : dict, required
-        Includes a dictionary that is tranformed to the IAMC format and
-        IamDataFrame. It is required that the key tuple of the dictionary
-        includes the information of the 'scenario', 'variable', and 'region'
-        column (in this order).
+    generation : dict, required
+        A dictionary including the heat generation by technology/source with
+        scenario and variable as keys.
         The default is None.
-    col_name : list, optional
-        Includes column names that are used for the IAMC format. If this
-        parameter is not passed to the function, the default description,
-        as described above in the 'dictionary' description, is used.
+    demand : dict, required
+        A dictionary including the (downscaled) heat demand on the region
+        level with scenario and region as keys.
+        Contrary to the sequential algorithm, the dictionary is not modified.
         The default is None.
+    requirements : dict, required
+        Requirements of heat network infrastructure at the local level. The key
+        of the dictionary is the heat generation technology/source.
+        The default is None.
+    potential : dict, required
+        Potential of heat network infrastructure at the local level. The key
+        of the dictionary is the region.
+        The default is None.
+    scenario : string, required
+        Sets the scenario.
+        The default is None.
+    tolerance : float, optional
+        Maximum relative deviation from the regional heat demand at which the
+        iterative proportional fitting is considered converged.
+        The default is 1e-9.
+    max_iterations : int, optional
+        Maximum number of sweeps (scaling of technologies and regions).
+        The default is 1000.
 
     Returns
     -------
-    df : DataFrame
-
-    """
-
-    df = df = pd.DataFrame(dictionary, index=[0]).T.reset_index()
-
-    if col_name == None:
-        df.columns = ["Scenario", "Variable", "Region", "Value"]
-    else:
-        df.columns = col_name
-
-    return df
-
-
-def calculate_heat_density(heat_generation=None, area=None):
+    quantity : dict
+        The heat generation by technology/source at the local level.
+        The key of the dict is a tuple including scenario, variable,
+        and region (in this order).
+    diagnostics : dict
+        Includes whether the algorithm 'converged', the number of
+        'iterations' and the remaining maximum relative 'demand_residual'.
+        The heat generation per technology/source is always met exactly,
+        since each sweep ends with the scaling of the technologies.
 
     """
 
-    Parameters
-    ----------
-    heat_generation : IamDataFrame, required
-        Heat generation at the region level. The default is None.
-    area : IamDataFrame, required
-        Total area at the region level. The default is None.
+    _technologies = list(requirements.keys())
+    _regions = [_k[1] for _k in demand.keys() if _k[0] == scenario]
+
+    _gen = np.array([generation[scenario, _t] for _t in _technologies], dtype=float)
+    _dem = np.array([demand[scenario, _r] for _r in _regions], dtype=float)
+    _pot = np.array([potential[_r] for _r in _regions], dtype=float)
+    _req = np.array([requirements[_t] for _t in _technologies], dtype=float)
+
+    # The seed distributes every technology/source proportional to the demand
+    # of its eligible regions, i.e., the first step of the sequential algorithm.
+    _seed = (_pot[None, :] >= _req[:, None]) * np.clip(_dem, 0, None)[None, :]
+
+    # The allocation is kept as seed * a[t] * b[r], so that each sweep only
+    # needs two matrix-vector products of the seed with the scaling factors.
+    a = np.ones(len(_technologies))
+    b = np.ones(len(_regions))
+    _residual = np.inf
+    _iteration = 0
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        while _iteration < max_iterations:
+            _iteration += 1
+            _col = _seed.T @ a
+            b = np.where(_col > 0, _dem / _col, 0)
+            _row = _seed @ b
+            a = np.where(_row > 0, _gen / _row, 0)
+
+            _dem_alloc = b * (_seed.T @ a)
+            _residual = np.max(
+                np.abs(_dem_alloc - _dem) / np.maximum(np.abs(_dem), 1e-12),
+                initial=0,
+            )
+            if _residual <= tolerance:
+                break
 
-    Returns
-    -------
-    hd : IamDataFrame
-        Heat density at the local level.
+    _alloc = _seed * a[:, None] * b[None, :]
+    _t_idx, _r_idx = np.nonzero(_seed)
 
-    """
-    val_gen = heat_generation.filter(variable="Centralized").data
-    for index, row in val_gen.iterrows():
-        _a = area.filter(region=row["region"]).data["value"][0] / 1000
-        val_gen.loc[index, "value"] = row["value"] / _a
-        val_gen.loc[index, "unit"] = "GWh/km**2"
-    hd = py.IamDataFrame(val_gen)
-    return hd
+    quantity = {
+        (scenario, _technologies[_t], _regions[_r]): _alloc[_t, _r]
+        for _t, _r in zip(_t_idx.tolist(), _r_idx.tolist())
+    }
+    diagnostics = {
+        "converged": bool(_residual <= tolerance),
+        "iterations": _iteration,
+        "demand_residual": float(_residual),
+    }
 
+    return quantity, diagnostics
 
-###
-# Below, the utils of the iterative downscaling are defined.
-###
 
-
-def make_networkx_from_shapefile(connection=None):
+def validate_allocation(
+    quantity=None, generation=None, demand=None, scenario=None, tolerance=1e-6
+):
 
     """
 
     Parameters
     ----------
-    connection : Shapefile, required
-        Includes the available connection lines between nodes.
+    quantity : dict, required
+        The heat generation by technology/source at the local level as
+        returned by the sequential algorithm. The key of the dict is a tuple
+        including scenario, variable, and region (in this order).
         The default is None.
-
-    Returns
-    -------
-    graph : Networkx
-        Initial graph with connection lines.
-
-    """
-
-    graph = nx.Graph()
-    for index, region in connection.iterrows():
-        graph.add_edge(
-            u_of_edge=region.END, v_of_edge=region.START, weight=region.geometry.length
-        )
-    return graph
-
-
-def add_quantities_to_nodes(graph=None, quantities=None):
-
-    """
-
-    Parameters
-    ----------
-    graph : Networkx, required
+    generation : dict, required
+        A dictionary including the heat generation by technology/source with
+        scenario and variable as keys.
         The default is None.
-    quantities : Shapefile, required
-        Includes the amount of centralized and decentralized heat generation.
+    demand : dict, required
+        A dictionary including the (downscaled) heat demand on the region
+        level with scenario and region as keys. Note that this needs to be the
+        demand before the allocation, since the sequential algorithm reduces
+        the values of the dictionary in place.
         The default is None.
+    scenario : string, required
+        Sets the scenario that is validated.
+        The default is None.
+    tolerance : float, optional
+        Tolerance of the mass balances, relative to the generation or demand
+        (and absolute for values below one).
+        The default is 1e-6.
 
     Returns
     -------
-    graph : Networkx
-        The graph with centralized and decentralized heat generation per node.
+    report : DataFrame
+        One row per violated mass balance with the columns 'scenario',
+        'check', 'variable', 'region' and 'mismatch'. The check is either
+        'generation' (allocations per technology/source minus generation),
+        'demand' (allocations per region minus demand) or 'negative'
+        (negative allocation). Allocations to a technology/source or region
+        without generation or demand are reported per allocation (check
+        'generation' or 'demand' with the allocated value as mismatch). The
+        report is empty if the allocation is valid.
 
     """
 
-    for key in graph._node:
-        for _type in ["Centralized", "Decentralized"]:
-            graph._node[key][_type] = float(
-                quantities.loc[
-                    (quantities.region == key) & (quantities.variable == _type)
-                ].value
-            )
-
-    return graph
+    _keys = [_k for _k in quantity.keys() if _k[0] == scenario]
+    _values = np.fromiter((quantity[_k] for _k in _keys), float, len(_keys))
 
+    _technologies = pd.Index([_k[1] for _k in generation.keys() if _k[0] == scenario])
+    _regions = pd.Index([_k[1] for _k in demand.keys() if _k[0] == scenario])
+    _tech_idx = _technologies.get_indexer([_k[1] for _k in _keys])
+    _reg_idx = _regions.get_indexer([_k[2] for _k in _keys])
 
-def calculate_cluster_coefficient(graph=None):
+    _generation = np.array([generation[scenario, _t] for _t in _technologies])
+    _demand = np.array([demand[scenario, _r] for _r in _regions])
 
-    """
+    # Allocations to unknown technologies/sources or regions are violations
+    _gen_unknown = np.flatnonzero(_tech_idx < 0)
+    _dem_unknown = np.flatnonzero(_reg_idx < 0)
+    _gen_valid = _tech_idx >= 0
+    _dem_valid = _reg_idx >= 0
 
-    Parameters
-    ----------
-    graph : Networkx, required
-        Includes the graph with heat generation quantities (centralized and decentralized) and connection lines.
-        The default is None.
-
-    Returns
-    -------
-    Results : dict
-        Value of the cluster coefficient per node.
-
-    """
-
-    results = dict()
-    max_quantity = max(graph._node[key]["Centralized"] for key in graph._node.keys())
-
-    for key in graph._node.keys():
-        # e.g., key = AT127|Achau
-        _alpha = dict()
-        for node1 in graph._adj[key]:
-            # e.g., node1 == AT127|Biedermannsdorf
-            # Biedermannsdorf, Hennersdorf, Himberg, Laxenburg, Leopoldsdorf, Maria-Lanzendorf, Münchendorf
-            for node2 in graph._adj[node1]:
-                # e.g., Achau, Guntramsdorf, Hennersdorf, Laxenburg, Vösendorf, Wiender Neudorf
-                if key in graph._adj[node2]:
-                    _alpha[node1, node2] = 1
-
-        number = len(_alpha.keys())
-        m = len(graph._adj[key])
-        q = graph._node[key]["Centralized"]
-        if m > 1:
-            results[key] = (q / max_quantity) * (number / (m * (m - 1)))
-        else:
-            results[key] = 0
+    _gen_mismatch = (
+        np.bincount(
+            _tech_idx[_gen_valid],
+            weights=_values[_gen_valid],
+            minlength=len(_technologies),
+        )
+        - _generation
+    )
+    _dem_mismatch = (
+        np.bincount(
+            _reg_idx[_dem_valid], weights=_values[_dem_valid], minlength=len(_regions)
+        )
+        - _demand
+    )
+    _gen_fail = np.abs(_gen_mismatch) > tolerance * np.maximum(1, _generation)
+    _dem_fail = np.abs(_dem_mismatch) > tolerance * np.maximum(1, _demand)
+    _negative = np.flatnonzero(_values < -tolerance)
+
+    report = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "check": "generation",
+                    "variable": _technologies[_gen_fail],
+                    "region": None,
+                    "mismatch": _gen_mismatch[_gen_fail],
+                }
+            ),
+            pd.DataFrame(
+                {
+                    "check": "generation",
+                    "variable": [_keys[_i][1] for _i in _gen_unknown],
+                    "region": [_keys[_i][2] for _i in _gen_unknown],
+                    "mismatch": _values[_gen_unknown],
+                }
+            ),
+            pd.DataFrame(
+                {
+                    "check": "demand",
+                    "variable": None,
+                    "region": _regions[_dem_fail],
+                    "mismatch": _dem_mismatch[_dem_fail],
+                }
+            ),
+            pd.DataFrame(
+                {
+                    "check": "demand",
+                    "variable": [_keys[_i][1] for _i in _dem_unknown],
+                    "region": [_keys[_i][2] for _i in _dem_unknown],
+                    "mismatch": _values[_dem_unknown],
+                }
+            ),
+            pd.DataFrame(
+                {
+                    "check": "negative",
+                    "variable": [_keys[_i][1] for _i in _negative],
+                    "region": [_keys[_i][2] for _i in _negative],
+                    "mismatch": _values[_negative],
+                }
+            ),
+        ],
+        ignore_index=True,
+    )
+    report.insert(0, "scenario", scenario)
 
-    return results
+    return report
 
 
-def calculate_distance_coefficient(graph=None):
+def dict_to_df(dictionary=None, col_name=None):
 
     """
 
     Parameters
     ----------
-    graph : Networkx, required
-        Includes a graph with nodes, lines and centralized/decentralized heat quantities.
+    dictionary : dict, required
+        Includes a dictionary that is tranformed to the IAMC format and
+        IamDataFrame. It is required that the key tuple of the dictionary
+        includes the information of the 'scenario', 'variable', and 'region'
+        column (in this order).
+        The default is None.
+    col_name : list, optional
+        Includes column names that are used for the IAMC format. If this
+        parameter is not passed to the function, the default description,
+        as described above in the 'dictionary' description, is used.
         The default is None.
 
     Returns
     -------
-    results : dict
-        Includes the value of the distance coefficient per node.
+    df : DataFrame
 
     """
 
-    results = dict()
-    distances = dict()
-
-    for node1 in graph._node.keys():
-        distances[node1] = 0
-        for node2 in graph._node.keys():
-            if nx.has_path(graph, source=node1, target=node2):
-                _d = nx.single_source_dijkstra(
-                    graph, source=node1, target=node2, weight="weight"
-                )
-                if _d[0] > distances[node1]:
-                    distances[node1] = _d[0]
-                else:
-                    distances[node1] = np.Inf
-
-        results[node1] = 1 / (2 * distances[node1])
-    min_distance = min(distances[node] for node in distances.keys())
-    max_quantity = max(
-        graph._node[node]["Decentralized"] for node in graph._node.keys()
-    )
+    df = df = pd.DataFrame(dictionary, index=[0]).T.reset_index()
 
-    for key in results.keys():
-        results[key] *= min_distance
-        results[key] *= graph._node[key]["Centralized"]
-        results[key] *= 1 / max_quantity
+    if col_name == None:
+        df.columns = ["Scenario", "Variable", "Region", "Value"]
+    else:
+        df.columns = col_name
 
-    return
+    return df
 
 
-def calculate_total_indicator_value(
-    cluster_coefficient=None, distance_coefficient=None
-):
+def calculate_heat_density(heat_generation=None, area=None):
 
     """
 
     Parameters
     ----------
-    cluster_coefficient : dict, required
-        Includes the cluster coefficient value per node.
-        The default is None.
-    distance_coefficient : TYPE, optional
-        Includes the distance coefficient value per node.
-        The default is None.
+    heat_generation : IamDataFrame or dict, required
+        Heat generation at the region level (IamDataFrame or columnar data,
+        see 'columnar'). The default is None.
+    area : IamDataFrame or dict, required
+        Total area at the region level. The default is None.
 
     Returns
     -------
-    results : dict
-        Includes the calculated total indicator value per node.
+    hd : IamDataFrame or dict
+        Heat density at the local level (columnar data, if the heat
+        generation is columnar data).
 
     """
 
-    results = dict()
+    val_gen = columnar.select(
+        columnar.from_iamdf(heat_generation), variable="Centralized"
+    )
+    _area = columnar.from_iamdf(area)
+
+    # The first area per region
+    _area = dict(zip(_area["region"].tolist()[::-1], _area["value"][::-1]))
+    _area = np.array([_area.get(_r, np.nan) for _r in val_gen["region"].tolist()])
 
-    for key in cluster_coefficient.keys():
-        results[key] = cluster_coefficient[key]
-        # results[key] = cluster_coefficient[key] + distance_coefficient[key]
-        # Only the cluster coefficient is used for the benchmark.
-        # The distance coefficient will be considered in future work.
-    return results
+    val_gen["value"] = val_gen["value"] / (_area / 1000)
+    val_gen = columnar.rename(
+        val_gen, "unit", {_u: "GWh/km**2" for _u in val_gen["unit"].categories}
+    )
+    if columnar.is_columnar(heat_generation):
+        return val_gen
+    hd = columnar.to_iamdf(val_gen)
+    return hd
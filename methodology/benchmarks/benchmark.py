@@ -0,0 +1,575 @@
+"""
+Scaling benchmarks of the downscaling engines
+
+    python benchmark.py run --output results.json
+    python benchmark.py compare baseline.json results.json
+
+The sequential engine, the functions of the iterative pipeline and the build,
+solve and post-processing of the optimization model are timed on synthetic
+inputs (see 'synthetic.py') with 10**2 to 10**5 regions. The import times of
+the modules are timed as well. Each engine runs in a
+separate process, since the flat modules of 'algorithm-downscaling' and
+'optimization model' share module names (e.g., 'utils').
+
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from synthetic import create_model_inputs
+from synthetic import create_network_topology
+from synthetic import create_synthetic_laus
+from synthetic import create_synthetic_lines
+
+METHODOLOGY_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENGINE_FOLDERS = {
+    "sequential": os.path.join(METHODOLOGY_FOLDER, "algorithm-downscaling"),
+    "iterative": os.path.join(METHODOLOGY_FOLDER, "algorithm-downscaling"),
+    "optimization": os.path.join(METHODOLOGY_FOLDER, "optimization model"),
+    "imports": METHODOLOGY_FOLDER,
+}
+
+# Modules, whose import time is benchmarked (in a fresh interpreter each)
+MODULES = {
+    "algorithm-downscaling": [
+        "utils",
+        "iterative_utils",
+        "sequential_downscaling",
+        "iterative_downscaling",
+        "profiling",
+    ],
+    "optimization model": ["model"],
+}
+
+SIZES = [10**2, 10**3, 10**4, 10**5]
+
+# Largest number of regions per stage, which is benchmarked by default (the
+# stages scale quadratically or worse beyond, e.g., the bounding box pairs of
+# 'create_connection_lines' in memory). Use '--no-limits' to run all.
+MAX_REGIONS = {
+    "sequential_downscaling[sequential]": 10**4,
+    "sequential_downscaling[ipf]": 10**4,
+    "create_connection_lines": 10**4,
+    "calculate_distance_coefficient": 10**2,
+    "iterative_downscaling": 10**2,
+    "iterative_downscaling[processes=1]": 10**3,
+    "build": 10**4,
+    "solve": 10**4,
+    "post-processing": 10**4,
+}
+
+TECHNOLOGIES = {
+    "Geothermal": 500,
+    "Hydrogen": 400,
+    "Waste": 300,
+    "Synthetic gas": 200,
+    "Biomass": 100,
+    "Heat pump (air)": 50,
+    "Heat pump (ground)": 20,
+    "Direct-electric": 0,
+}
+
+
+def measure(function=None, *args, repeat=1, **kwargs):
+
+    """
+
+    Parameters
+    ----------
+    function : callable, required
+        Function to be timed. The default is None.
+    *args, **kwargs
+        The arguments of the function.
+    repeat : int, optional
+        Number of repetitions (the fastest one is reported), keyword only.
+        The default is 1.
+
+    Returns
+    -------
+    seconds : float
+        Includes the fastest wall-clock time.
+    result : object
+        Includes the return value of the last call.
+
+    """
+
+    seconds = math.inf
+    for _ in range(repeat):
+        _start = time.perf_counter()
+        result = function(*args, **kwargs)
+        seconds = min(seconds, time.perf_counter() - _start)
+
+    return seconds, result
+
+
+def benchmark_sequential(regions=None, repeat=1, limits=None, **kwargs):
+
+    """
+
+    Parameters
+    ----------
+    regions : int, required
+        Number of regions. The default is None.
+    repeat : int, optional
+        Number of repetitions. The default is 1.
+    limits : dict, optional
+        Largest number of regions per stage. The default is None.
+
+    Returns
+    -------
+    results : list
+        Includes the seconds per stage (None for skipped stages).
+
+    """
+
+    import pyam
+
+    from sequential_downscaling import sequential_downscaling
+
+    laus = create_synthetic_laus(regions)
+    _region = laus["NUTS3_CODE"] + "|" + laus["LAU_NAME"]
+
+    def _iamdf(region, variable, unit, value):
+        return pyam.IamDataFrame(
+            pd.DataFrame(
+                {
+                    "model": "benchmark",
+                    "scenario": "scenario",
+                    "region": region,
+                    "variable": variable,
+                    "unit": unit,
+                    2050: value,
+                }
+            )
+        )
+
+    _total = laus["POP_2019"].sum() / 1000
+    generation = _iamdf(
+        "AT",
+        list(TECHNOLOGIES),
+        "TWh",
+        _total * np.linspace(1, 2, len(TECHNOLOGIES)) / len(TECHNOLOGIES) / 1.5,
+    )
+    pop_density = _iamdf(_region, "Population density", "1/km**2", laus["POP_DENS_2"])
+    population = _iamdf(_region, "Population", "", laus["POP_2019"])
+
+    results = list()
+    for _method in ["sequential", "ipf"]:
+        _stage = "sequential_downscaling[{}]".format(_method)
+        if limits is not None and regions > limits.get(_stage, math.inf):
+            results.append((_stage, None))
+            continue
+        seconds, _ = measure(
+            sequential_downscaling,
+            generation,
+            TECHNOLOGIES,
+            pop_density,
+            population,
+            _method,
+            repeat=repeat,
+        )
+        results.append((_stage, seconds))
+
+    return results
+
+
+def benchmark_iterative(regions=None, repeat=1, limits=None, **kwargs):
+
+    """
+
+    Parameters
+    ----------
+    regions : int, required
+        Number of regions. The default is None.
+    repeat : int, optional
+        Number of repetitions. The default is 1.
+    limits : dict, optional
+        Largest number of regions per stage. The default is None.
+
+    Returns
+    -------
+    results : list
+        Includes the seconds per stage (None for skipped stages).
+
+    """
+
+    from iterative_downscaling import create_connection_lines
+    from iterative_downscaling import iterative_downscaling
+    from iterative_utils import add_quantities_to_nodes
+    from iterative_utils import calculate_cluster_coefficient
+    from iterative_utils import calculate_distance_coefficient
+    from iterative_utils import make_networkx_from_shapefile
+
+    # All LAUs form one NUTS3 region
+    laus = create_synthetic_laus(regions, laus_per_nuts3=regions)
+    quantities = create_network_topology(laus)
+    lines = create_synthetic_lines(quantities)
+
+    def _graph():
+        return add_quantities_to_nodes(make_networkx_from_shapefile(lines), quantities)
+
+    stages = {
+        "create_connection_lines": lambda: create_connection_lines(
+            quantities, subregion="AT001", scenario="Gradual Development"
+        ),
+        "calculate_cluster_coefficient": lambda: calculate_cluster_coefficient(
+            _graph()
+        ),
+        "calculate_distance_coefficient": lambda: calculate_distance_coefficient(
+            _graph()
+        ),
+        "iterative_downscaling": lambda: iterative_downscaling(quantities, lines),
+        "iterative_downscaling[processes=1]": lambda: iterative_downscaling(
+            quantities, lines, processes=1
+        ),
+    }
+
+    results = list()
+    for _stage, _function in stages.items():
+        if limits is not None and regions > limits.get(_stage, math.inf):
+            results.append((_stage, None))
+            continue
+        seconds, _ = measure(_function, repeat=repeat)
+        results.append((_stage, seconds))
+
+    return results
+
+
+def benchmark_optimization(regions=None, repeat=1, limits=None, solver=None, **kwargs):
+
+    """
+
+    Parameters
+    ----------
+    regions : int, required
+        Number of regions. The default is None.
+    repeat : int, optional
+        Number of repetitions. The default is 1.
+    limits : dict, optional
+        Largest number of regions per stage. The default is None.
+    solver : String, optional
+        Name of the solver. The default is None ("gurobi").
+
+    Returns
+    -------
+    results : list
+        Includes the seconds per stage (None for skipped stages).
+
+    """
+
+    import model as optimization
+
+    laus = create_synthetic_laus(regions)
+    inputs = create_model_inputs(laus)
+    nuts3_to_lau = pd.DataFrame(
+        {"NUTS3": laus["NUTS3_CODE"], "LAU ID": laus["LAU_ID"].astype(int)}
+    )
+
+    def _skip(stage):
+        return limits is not None and regions > limits.get(stage, math.inf)
+
+    results = list()
+    if _skip("build"):
+        return [("build", None), ("solve", None), ("post-processing", None)]
+    seconds, model = measure(optimization.build_model, *inputs, repeat=repeat)
+    results.append(("build", seconds))
+
+    if _skip("solve"):
+        return results + [("solve", None), ("post-processing", None)]
+    seconds, _ = measure(
+        optimization.solve_model, model, solver or "gurobi", False, repeat=repeat
+    )
+    results.append(("solve", seconds))
+
+    if _skip("post-processing"):
+        return results + [("post-processing", None)]
+    with tempfile.TemporaryDirectory() as _folder:
+        seconds, _ = measure(
+            optimization.write_results, model, nuts3_to_lau, _folder, repeat=repeat
+        )
+    results.append(("post-processing", seconds))
+
+    return results
+
+
+def benchmark_imports(regions=None, repeat=1, **kwargs):
+
+    """
+
+    Parameters
+    ----------
+    regions : int, optional
+        Not used (the import time does not depend on the number of regions).
+        The default is None.
+    repeat : int, optional
+        Number of repetitions. The default is 1.
+
+    Returns
+    -------
+    results : list
+        Includes the seconds per module, each imported in a fresh interpreter.
+
+    """
+
+    _code = (
+        "import time; _start = time.perf_counter(); import {}; "
+        "print(time.perf_counter() - _start)"
+    )
+
+    results = list()
+    for _folder, _modules in MODULES.items():
+        for _module in _modules:
+            seconds = math.inf
+            for _ in range(repeat):
+                _output = subprocess.run(
+                    [sys.executable, "-W", "ignore", "-c", _code.format(_module)],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                    cwd=os.path.join(METHODOLOGY_FOLDER, _folder),
+                ).stdout
+                seconds = min(seconds, float(_output.split()[-1]))
+            results.append(("import {}".format(_module), seconds))
+
+    return results
+
+
+BENCHMARKS = {
+    "sequential": benchmark_sequential,
+    "iterative": benchmark_iterative,
+    "optimization": benchmark_optimization,
+    "imports": benchmark_imports,
+}
+
+
+def run_engine(engine=None, sizes=None, repeat=1, limits=None, solver=None):
+
+    """
+
+    Parameters
+    ----------
+    engine : String, required
+        Name of the engine ('sequential', 'iterative' or 'optimization').
+        The default is None.
+    sizes : list, required
+        Includes the numbers of regions. The default is None.
+    repeat : int, optional
+        Number of repetitions. The default is 1.
+    limits : dict, optional
+        Largest number of regions per stage. The default is None.
+    solver : String, optional
+        Name of the solver of the optimization model. The default is None.
+
+    Returns
+    -------
+    records : list
+        Includes one record (engine, stage, regions, seconds) per stage
+        and number of regions.
+
+    """
+
+    sys.path.insert(0, ENGINE_FOLDERS[engine])
+    records = list()
+    # The import times are measured once (independent of the regions)
+    for _regions in [0] if engine == "imports" else sizes:
+        for _stage, _seconds in BENCHMARKS[engine](
+            _regions, repeat=repeat, limits=limits, solver=solver
+        ):
+            records.append(
+                {
+                    "engine": engine,
+                    "stage": _stage,
+                    "regions": _regions,
+                    "seconds": _seconds,
+                    "repeat": repeat,
+                }
+            )
+
+    return records
+
+
+def run_benchmarks(
+    engines=None, sizes=None, repeat=1, limits=None, solver=None, output=None
+):
+
+    """
+
+    Parameters
+    ----------
+    engines : list, required
+        Includes the names of the engines. The default is None.
+    sizes : list, required
+        Includes the numbers of regions. The default is None.
+    repeat : int, optional
+        Number of repetitions. The default is 1.
+    limits : dict, optional
+        Largest number of regions per stage. The default is None.
+    solver : String, optional
+        Name of the solver of the optimization model. The default is None.
+    output : String, required
+        Path of the results (JSON). The default is None.
+
+    Returns
+    -------
+    results : dict
+        Includes the metadata and the records of all engines.
+
+    """
+
+    records = list()
+    for _engine in engines:
+        with tempfile.TemporaryDirectory() as _folder:
+            _file = os.path.join(_folder, "records.json")
+            _command = [sys.executable, os.path.abspath(__file__), "engine", _engine]
+            _command += ["--sizes"] + [str(_s) for _s in sizes]
+            _command += ["--repeat", str(repeat), "--output", _file]
+            _command += ["--limits", json.dumps(limits)]
+            if solver is not None:
+                _command += ["--solver", solver]
+            subprocess.run(_command, check=True, cwd=_folder)
+            with open(_file) as _f:
+                records.extend(json.load(_f))
+
+    try:
+        _commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=METHODOLOGY_FOLDER,
+        ).stdout.strip()
+    except OSError:
+        _commit = None
+
+    results = {
+        "metadata": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "commit": _commit or None,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "solver": solver,
+        },
+        "records": records,
+    }
+    with open(output, "w") as _f:
+        json.dump(results, _f, indent=2)
+
+    return results
+
+
+def compare_benchmarks(baseline=None, candidate=None, threshold=1.2, min_seconds=0.01):
+
+    """
+
+    Parameters
+    ----------
+    baseline : dict, required
+        Includes the results of the reference run. The default is None.
+    candidate : dict, required
+        Includes the results of the run to be checked. The default is None.
+    threshold : float, optional
+        Ratio of the seconds (candidate / baseline) above which a stage is
+        flagged as regression. The default is 1.2.
+    min_seconds : float, optional
+        Stages faster than this in both runs are not flagged (timer noise).
+        The default is 0.01.
+
+    Returns
+    -------
+    comparison : DataFrame
+        Includes the seconds of both runs, their ratio and the flag
+        'regression' per engine, stage and number of regions.
+
+    """
+
+    _keys = ["engine", "stage", "regions"]
+    _baseline = pd.DataFrame(baseline["records"]).dropna(subset=["seconds"])
+    _candidate = pd.DataFrame(candidate["records"]).dropna(subset=["seconds"])
+
+    comparison = _baseline[_keys + ["seconds"]].merge(
+        _candidate[_keys + ["seconds"]], on=_keys, suffixes=("_baseline", "_candidate")
+    )
+    comparison["ratio"] = (
+        comparison["seconds_candidate"] / comparison["seconds_baseline"]
+    )
+    comparison["regression"] = (comparison["ratio"] > threshold) & (
+        comparison[["seconds_baseline", "seconds_candidate"]].max(axis=1) >= min_seconds
+    )
+
+    return comparison
+
+
+def main(arguments=None):
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    _run = commands.add_parser("run", help="run the benchmarks")
+    _run.add_argument("--engines", nargs="+", default=list(BENCHMARKS))
+    _run.add_argument("--sizes", nargs="+", type=int, default=SIZES)
+    _run.add_argument("--repeat", type=int, default=1)
+    _run.add_argument("--solver", default=None)
+    _run.add_argument("--no-limits", action="store_true")
+    _run.add_argument("--output", default="benchmark-results.json")
+
+    _engine = commands.add_parser("engine", help=argparse.SUPPRESS)
+    _engine.add_argument("engine", choices=list(BENCHMARKS))
+    _engine.add_argument("--sizes", nargs="+", type=int, default=SIZES)
+    _engine.add_argument("--repeat", type=int, default=1)
+    _engine.add_argument("--solver", default=None)
+    _engine.add_argument("--limits", type=json.loads, default=None)
+    _engine.add_argument("--output", required=True)
+
+    _compare = commands.add_parser("compare", help="flag regressions")
+    _compare.add_argument("baseline")
+    _compare.add_argument("candidate")
+    _compare.add_argument("--threshold", type=float, default=1.2)
+    _compare.add_argument("--min-seconds", type=float, default=0.01)
+
+    args = parser.parse_args(arguments)
+
+    if args.command == "run":
+        run_benchmarks(
+            args.engines,
+            args.sizes,
+            args.repeat,
+            None if args.no_limits else MAX_REGIONS,
+            args.solver,
+            args.output,
+        )
+    elif args.command == "engine":
+        records = run_engine(
+            args.engine, args.sizes, args.repeat, args.limits, args.solver
+        )
+        with open(args.output, "w") as _f:
+            json.dump(records, _f)
+    else:
+        with open(args.baseline) as _f:
+            baseline = json.load(_f)
+        with open(args.candidate) as _f:
+            candidate = json.load(_f)
+        comparison = compare_benchmarks(
+            baseline, candidate, args.threshold, args.min_seconds
+        )
+        print(comparison.to_string(index=False))
+        if comparison["regression"].any():
+            print("{} regression(s) found".format(comparison["regression"].sum()))
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
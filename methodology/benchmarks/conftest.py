@@ -0,0 +1,12 @@
+import os
+import sys
+
+# The synthetic inputs are tested with the iterative pipeline, whose flat
+# modules are imported from 'algorithm-downscaling' (as by 'run_engine')
+sys.path.insert(
+    0,
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "algorithm-downscaling",
+    ),
+)
@@ -0,0 +1,436 @@
+"""
+Synthetic local administrative units (LAUs) for scale testing
+
+The LAUs are Voronoi polygons of random points (EPSG:3035), whereby a share
+of the points is concentrated in dense cores (like Vienna). The LAUs are
+grouped into NUTS3 regions of neighbouring LAUs. The outputs follow the
+schemas of the real inputs, i.e.,
+
+    create_synthetic_laus      -> 'at-laus.shp' (optimization model)
+    create_network_topology    -> 'create_initial_network_topology' (which
+                                  is also the input of 'create_connection_lines')
+    create_synthetic_lines     -> 'create_connection_lines'
+    create_environment_subsets -> 'lau-env-subset.csv' (optimization model)
+    create_model_inputs        -> 'read_input_data' (optimization model)
+
+All outputs are deterministic by seed.
+
+"""
+
+import math
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyam
+import shapely
+
+# Columns of the LAU shapefile (e.g., 'at-laus.shp')
+LAU_COLUMNS = [
+    "GISCO_ID",
+    "CNTR_CODE",
+    "LAU_ID",
+    "LAU_NAME",
+    "POP_2019",
+    "POP_DENS_2",
+    "AREA_KM2",
+    "YEAR",
+    "FID",
+    "geometry",
+]
+
+# Heat generation of GENeSYS-MOD in 2050 (PJ) at the country level
+HEAT_GENERATION = {
+    "Biomass": 12.1,
+    "Direct electric": 7.7,
+    "Heat pump (air)": 81.8,
+    "Heat pump (ground)": 20.5,
+    "Hydrogen": 3.2,
+    "Waste": 6.4,
+    "Geothermal": 4.1,
+    "Synthetic gas": 2.5,
+}
+
+
+def create_synthetic_laus(
+    regions=None,
+    seed=0,
+    country="AT",
+    area=40,
+    laus_per_nuts3=60,
+    laus_per_core=2000,
+    core_share=0.15,
+):
+
+    """
+
+    Parameters
+    ----------
+    regions : int, required
+        Number of LAUs. The default is None.
+    seed : int, optional
+        Seed of the random numbers. The default is 0.
+    country : String, optional
+        Country code. The default is "AT".
+    area : float, optional
+        Average area of a LAU in km**2. The default is 40.
+    laus_per_nuts3 : int, optional
+        Average number of LAUs per NUTS3 region. The default is 60.
+    laus_per_core : int, optional
+        Number of LAUs per dense core (at least one core). The default is 2000.
+    core_share : float, optional
+        Share of the LAUs in dense cores. The default is 0.15.
+
+    Returns
+    -------
+    laus : GeoDataFrame
+        Includes the columns of the LAU shapefile ('LAU_COLUMNS') and the
+        NUTS3 region ('NUTS3_CODE') and whether the LAU is part of a dense
+        core ('CORE') per LAU.
+
+    """
+
+    _rng = np.random.default_rng(seed)
+    _side = math.sqrt(regions * area) * 1000
+    _x0, _y0 = 4.3e6, 2.6e6
+
+    # Points of the LAUs (uniform background and normally distributed cores)
+    _cores = max(1, regions // laus_per_core)
+    _in_core = _rng.random(regions) < core_share
+    _centres = _rng.uniform(0.2 * _side, 0.8 * _side, size=(_cores, 2))
+    _points = _rng.uniform(0, _side, size=(regions, 2))
+    _core = _rng.integers(0, _cores, regions)
+    _points[_in_core] = _centres[_core[_in_core]] + _rng.normal(
+        0, 0.05 * _side, size=(_in_core.sum(), 2)
+    )
+    _points = np.clip(_points, 0, _side) + [_x0, _y0]
+
+    # Voronoi polygons, which are matched with their points afterwards
+    _points = shapely.points(_points)
+    _extent = shapely.box(_x0, _y0, _x0 + _side, _y0 + _side)
+    _cells = shapely.get_parts(
+        shapely.voronoi_polygons(shapely.multipoints(_points), extend_to=_extent)
+    )
+    _point, _cell = shapely.STRtree(_cells).query(_points, predicate="intersects")
+    _order = np.full(regions, -1)
+    _order[_point] = _cell
+    geometry = shapely.intersection(_cells[_order], _extent)
+
+    # NUTS3 regions of the LAUs closest to randomly selected LAUs
+    _nuts3 = max(1, round(regions / laus_per_nuts3))
+    _seeds = _rng.choice(regions, size=_nuts3, replace=False)
+    _, _nearest = shapely.STRtree(_points[_seeds]).query_nearest(_points)
+    _codes = np.array(["{}{:03d}".format(country, _k + 1) for _k in range(_nuts3)])
+
+    # Population (log-normal), which is ten times higher in dense cores
+    _population = np.round(_rng.lognormal(math.log(2500), 0.9, regions))
+    _population[_in_core] *= 10
+    _area = shapely.area(geometry) / 10**6
+
+    _ids = np.arange(regions) + 10001
+    laus = gpd.GeoDataFrame(
+        {
+            "GISCO_ID": ["{}_{}".format(country, _id) for _id in _ids],
+            "CNTR_CODE": country,
+            "LAU_ID": _ids.astype(str),
+            "LAU_NAME": ["LAU {}".format(_id) for _id in _ids],
+            "POP_2019": _population,
+            "POP_DENS_2": _population / _area,
+            "AREA_KM2": _area,
+            "YEAR": 2019,
+            "FID": ["{}_{}".format(country, _id) for _id in _ids],
+            "NUTS3_CODE": _codes[_nearest],
+            "CORE": _in_core,
+        },
+        geometry=geometry,
+        crs="EPSG:3035",
+    )
+
+    return laus
+
+
+def create_network_topology(
+    laus=None, scenarios=["Gradual Development"], demand=8e-6, seed=0
+):
+
+    """
+
+    Parameters
+    ----------
+    laus : GeoDataFrame, required
+        Includes the LAUs of 'create_synthetic_laus'. The default is None.
+    scenarios : list, optional
+        Includes the names of the scenarios. The default is
+        ["Gradual Development"].
+    demand : float, optional
+        Heat demand per capita in TWh. The default is 8e-6.
+    seed : int, optional
+        Seed of the random numbers. The default is 0.
+
+    Returns
+    -------
+    network : GeoDataFrame
+        Nodal centralized and decentralized heat generation (including
+        geometry) per LAU and scenario as 'create_initial_network_topology'.
+
+    """
+
+    _rng = np.random.default_rng(seed)
+    _region = laus["NUTS3_CODE"] + "|" + laus["LAU_NAME"]
+    _demand = laus["POP_2019"].to_numpy() * demand
+
+    _frames = list()
+    for _scenario in scenarios:
+        # Share of centralized heat generation increases with the density
+        _share = 0.05 + 0.6 / (1 + np.exp(-np.log(laus["POP_DENS_2"] / 1000)))
+        _share = np.clip(_share * _rng.uniform(0.8, 1.2, len(laus)), 0, 0.95)
+        for _variable, _value in [
+            ("Centralized", _demand * _share),
+            ("Decentralized", _demand * (1 - _share)),
+        ]:
+            _frames.append(
+                gpd.GeoDataFrame(
+                    {
+                        "model": "synthetic",
+                        "scenario": _scenario,
+                        "region": _region,
+                        "variable": _variable,
+                        "unit": "TWh",
+                        "year": 2050,
+                        "value": _value,
+                        "NUTS3_CODE": laus["NUTS3_CODE"],
+                        "LAU_ID": laus["LAU_ID"],
+                    },
+                    geometry=laus.geometry,
+                )
+            )
+
+    network = pd.concat(_frames, ignore_index=True)
+
+    return network
+
+
+def find_neighbours(laus=None):
+
+    """
+
+    Parameters
+    ----------
+    laus : GeoDataFrame, required
+        Includes the LAUs. The default is None.
+
+    Returns
+    -------
+    neighbours : ndarray
+        Includes the pairs of positions (first < second) of adjacent LAUs.
+
+    """
+
+    _geometry = laus.geometry.values
+    _a, _b = shapely.STRtree(_geometry).query(_geometry, predicate="intersects")
+    _a, _b = _a[_a < _b], _b[_a < _b]
+
+    # Polygons, which only touch at a corner, are no neighbours
+    _shared = shapely.length(shapely.intersection(_geometry[_a], _geometry[_b]))
+    neighbours = np.stack([_a[_shared > 0], _b[_shared > 0]], axis=1)
+
+    return neighbours
+
+
+def create_synthetic_lines(network=None, subregion=None, scenario=None):
+
+    """
+
+    Parameters
+    ----------
+    network : GeoDataFrame, required
+        Includes the nodal heat generation and its geometry as
+        'create_network_topology'. The default is None.
+    subregion : String, optional
+        Includes the name of the NUTS3 region. The default is None (all).
+    scenario : String, optional
+        Includes the name of the scenario. The default is None (first).
+
+    Returns
+    -------
+    lines : GeoDataFrame
+        Includes the connection lines between the centroids of adjacent
+        LAUs as 'create_connection_lines'.
+
+    """
+
+    if scenario is None:
+        scenario = network["scenario"].iloc[0]
+    _var = network.loc[
+        (network["scenario"] == scenario) & (network["variable"] == "Centralized")
+    ]
+    if subregion is not None:
+        _var = _var.loc[_var["NUTS3_CODE"] == subregion]
+
+    _pairs = find_neighbours(_var)
+    _centroids = shapely.centroid(_var.geometry.values)
+    _region = _var["region"].to_numpy()
+
+    # The columns are in the order of 'create_connection_lines'
+    lines = gpd.GeoDataFrame(
+        {
+            "geometry": shapely.linestrings(
+                np.stack(
+                    [
+                        shapely.get_coordinates(_centroids[_pairs[:, 0]]),
+                        shapely.get_coordinates(_centroids[_pairs[:, 1]]),
+                    ],
+                    axis=1,
+                )
+            ),
+            "START": _region[_pairs[:, 0]],
+            "END": _region[_pairs[:, 1]],
+        },
+        geometry="geometry",
+        crs=network.crs,
+    )
+
+    return lines
+
+
+def create_environment_subsets(laus=None):
+
+    """
+
+    Parameters
+    ----------
+    laus : GeoDataFrame, required
+        Includes the LAUs. The default is None.
+
+    Returns
+    -------
+    subset_per_lau : DataFrame
+        Includes the LAU ID (column 0) and the list of the IDs of the
+        adjacent LAUs as string (column 1) as 'lau-env-subset.csv'.
+
+    """
+
+    _ids = laus["LAU_ID"].to_numpy()
+    _pairs = find_neighbours(laus)
+
+    _subsets = [list() for _ in _ids]
+    for _a, _b in np.concatenate([_pairs, _pairs[:, ::-1]]):
+        _subsets[_a].append(_ids[_b])
+
+    subset_per_lau = pd.DataFrame(
+        {0: _ids.astype(int), 1: [str(sorted(_s)) for _s in _subsets]}
+    )
+
+    return subset_per_lau
+
+
+def create_model_inputs(laus=None, scenario="Gradual Development", seed=0):
+
+    """
+
+    Parameters
+    ----------
+    laus : GeoDataFrame, required
+        Includes the LAUs of 'create_synthetic_laus'. The default is None.
+    scenario : String, optional
+        Name of the scenario. The default is "Gradual Development".
+    seed : int, optional
+        Seed of the random numbers. The default is 0.
+
+    Returns
+    -------
+    inputs : tuple
+        Includes area_eff, per_area_set, pop, genesysmod, at_laus and
+        subset_per_lau as 'read_input_data' of the optimization model.
+
+    """
+
+    _rng = np.random.default_rng(seed)
+    _ids = laus["LAU_ID"].astype(int).to_numpy()
+
+    # Dense LAUs are more likely suited for district heating (I/II)
+    _category = np.where(
+        laus["POP_DENS_2"] > 1000,
+        "II",
+        np.where(_rng.random(len(laus)) < 0.25, "III", "IV"),
+    )
+    _category[laus["CORE"].to_numpy() & (laus["POP_DENS_2"] > 5000)] = "I"
+
+    area_eff = pd.DataFrame(
+        {"LAU ID": _ids, "LAU NAME": laus["LAU_NAME"], "VALUE": _category}
+    )
+    per_area_set = pd.DataFrame(
+        {
+            "LAU ID": _ids,
+            "LAU NAME": laus["LAU_NAME"],
+            "AREA": laus["AREA_KM2"],
+            "PERMANENT SETTLEMENT AREA": np.round(
+                laus["AREA_KM2"] * _rng.uniform(0.1, 0.6, len(laus)), 2
+            ),
+        }
+    )
+    pop = pd.DataFrame(
+        {
+            "model": "synthetic",
+            "Scenario": "BSL",
+            "region": _ids,
+            "variable": "Population",
+            "unit": 1,
+            2050: np.round(laus["POP_2019"] * _rng.uniform(0.9, 1.2, len(laus))),
+        }
+    )
+
+    # Heat generation scales with the population (Austria: about 9 million)
+    _scale = laus["POP_2019"].sum() / 9e6
+    genesysmod = pyam.IamDataFrame(
+        pd.DataFrame(
+            {
+                "model": "GeneSys-Mod",
+                "scenario": scenario,
+                "region": laus["CNTR_CODE"].iloc[0],
+                "variable": list(HEAT_GENERATION),
+                "unit": "PJ",
+                2050: [_value * _scale for _value in HEAT_GENERATION.values()],
+            }
+        )
+    )
+
+    at_laus = laus[LAU_COLUMNS]
+    subset_per_lau = create_environment_subsets(laus)
+
+    return area_eff, per_area_set, pop, genesysmod, at_laus, subset_per_lau
+
+
+def write_model_inputs(inputs=None, folder=None):
+
+    """
+
+    Parameters
+    ----------
+    inputs : tuple, required
+        Includes the inputs of 'create_model_inputs'. The default is None.
+    folder : String, required
+        Includes the data folder, which can be read by 'read_input_data' of
+        the optimization model. The default is None.
+
+    Returns
+    -------
+    folder : String
+        Includes the data folder.
+
+    """
+
+    area_eff, per_area_set, pop, genesysmod, at_laus, subset_per_lau = inputs
+
+    os.makedirs(os.path.join(folder, "lau-shp"), exist_ok=True)
+    area_eff.to_excel(os.path.join(folder, "eff-area.xlsx"), index=False)
+    per_area_set.to_excel(os.path.join(folder, "per-area-lau.xlsx"), index=False)
+    pop.to_excel(os.path.join(folder, "pop-lau.xlsx"), index=False)
+    genesysmod.to_excel(os.path.join(folder, "genesys-mod.xlsx"))
+    at_laus.to_file(os.path.join(folder, "lau-shp", "at-laus.shp"))
+    subset_per_lau.to_csv(
+        os.path.join(folder, "lau-env-subset.csv"), header=False, index=False
+    )
+
+    return folder
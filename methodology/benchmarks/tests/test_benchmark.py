@@ -0,0 +1,47 @@
+import pytest
+from benchmark import compare_benchmarks
+from benchmark import measure
+
+
+def test_measure():
+    _calls = list()
+
+    def _function(*args, **kwargs):
+        _calls.append(args)
+        return args, kwargs
+
+    # positional arguments are passed to the function (not to 'repeat')
+    seconds, result = measure(_function, 3, 4, repeat=2, key="value")
+    assert result == ((3, 4), {"key": "value"})
+    assert len(_calls) == 2
+    assert seconds >= 0
+
+
+def _create_results(seconds=None):
+    return {
+        "records": [
+            {"engine": "iterative", "stage": _stage, "regions": 100, "seconds": _s}
+            for _stage, _s in seconds.items()
+        ]
+    }
+
+
+def test_compare_benchmarks():
+    baseline = _create_results(
+        {"slower": 1.0, "faster": 1.0, "noise": 0.001, "skipped": 1.0, "removed": 1}
+    )
+    candidate = _create_results(
+        {"slower": 1.5, "faster": 0.5, "noise": 0.005, "skipped": None, "new": 1}
+    )
+
+    comparison = compare_benchmarks(baseline, candidate).set_index("stage")
+
+    # skipped stages and stages of only one run are not compared
+    assert sorted(comparison.index) == ["faster", "noise", "slower"]
+    assert comparison.loc["slower", "ratio"] == pytest.approx(1.5)
+    assert comparison["regression"].to_dict() == {
+        "slower": True,
+        "faster": False,
+        "noise": False,
+    }
+    assert not compare_benchmarks(baseline, candidate, threshold=2)["regression"].any()
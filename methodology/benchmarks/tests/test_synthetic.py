@@ -0,0 +1,43 @@
+import numpy as np
+from geopandas.testing import assert_geodataframe_equal
+from synthetic import create_network_topology
+from synthetic import create_synthetic_laus
+from synthetic import create_synthetic_lines
+from iterative_downscaling import create_connection_lines
+from iterative_downscaling import iterative_downscaling
+
+
+def test_synthetic_laus_are_deterministic():
+    _laus = create_synthetic_laus(50, seed=1, laus_per_nuts3=25)
+
+    assert_geodataframe_equal(
+        _laus, create_synthetic_laus(50, seed=1, laus_per_nuts3=25)
+    )
+    assert_geodataframe_equal(
+        create_synthetic_lines(create_network_topology(_laus, seed=1)),
+        create_synthetic_lines(create_network_topology(_laus, seed=1)),
+    )
+    assert not _laus.geometry.equals(create_synthetic_laus(50, seed=2).geometry)
+
+
+def test_synthetic_topology_downscaling():
+    # All LAUs form one NUTS3 region
+    _laus = create_synthetic_laus(40, laus_per_nuts3=40)
+    _network = create_network_topology(_laus)
+    _lines = create_synthetic_lines(_network)
+
+    _connections = create_connection_lines(
+        _network, subregion="AT001", scenario="Gradual Development"
+    )
+    assert list(_connections.columns) == list(_lines.columns)
+    assert _connections.crs == _lines.crs
+    assert sorted(map(sorted, _connections[["START", "END"]].values.tolist())) == (
+        sorted(map(sorted, _lines[["START", "END"]].values.tolist()))
+    )
+
+    generation, final_lines, benchmark, removed = iterative_downscaling(
+        _network, _connections
+    )
+    _total = _network.loc[_network["variable"] == "Centralized", "value"].sum()
+    assert np.isclose(generation["value"].sum(), _total)
+    assert len(generation) + len(removed) == len(_laus)
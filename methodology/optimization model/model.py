@@ -1,22 +1,30 @@
 import pandas as pd
-import pyam
 import utils
-import geopandas as gpd
 import csv
 import pyomo.environ as py
 import pyomo
 from datetime import datetime
 import os
+import sys
+
+from contextlib import nullcontext
+
+# The profiling module of the downscaling algorithms is optional. It is found
+# if its folder is on the path (e.g., PYTHONPATH=../algorithm-downscaling).
+try:
+    import profiling
+except ImportError:
+    profiling = None
 
 
 def init_heat_demand_per_lau(model, lau):
     scenario = model.scenario
-    return model.demand_per_lau[scenario, int(lau)]
+    return model.demand_per_lau[scenario, lau]
 
 
 def init_area_eff_factor(model, lau):
-    if int(lau) in model.phi_l.keys():
-        category = model.phi_l[int(lau)]
+    if lau in model.phi_l.keys():
+        category = model.phi_l[lau]
         
         if category == 'IV':
             return 1
@@ -27,34 +35,21 @@ def init_area_eff_factor(model, lau):
         elif category == 'I':
             return 0.5
 
-    elif int(lau) == 90001:
+    elif lau == 90001:
         return 0.65
     else:
         return 1
 
 
 def init_per_area_per_lau(model, lau):
-    if int(lau) in model.area_l.keys():
-        return model.area_l[int(lau)]
+    if lau in model.area_l.keys():
+        return model.area_l[lau]
     else:
         return 10e10
 
 def init_per_area_env_l(model, lau):
     area = 0
-    data = model.subset_per_lau
-    data = data[data[0] == int(lau)][1].item()
-    data = data.replace('[', '')
-    data = data.replace(']', '')
-    data = data.split(",")
-    for i in data:
-        i = i.replace("['", "")
-        i = i.replace("'", "")
-        i = i.replace("'", "")
-        i = i.replace("]", "")
-        i = i.replace('"', "")
-        
-        lau_id = int(i)
-        
+    for lau_id in model.subset_per_lau[lau]:
         if lau_id in model.area_l.keys():
             area += model.area_l[lau_id] * model.p_phi_l[lau]
         
@@ -87,89 +82,10 @@ def write_IAMC(output_df, model, scenario, region, variable, unit, time, values)
             },
             index=[0],
         )
-    output_df = output_df.append(_df)
+    output_df = pd.concat([output_df, _df])
     return output_df
 
 
-""" (A) READ INPUT DATA """
-
-area_eff = pd.read_excel('data/eff-area.xlsx')
-per_area_set = pd.read_excel('data/per-area-lau.xlsx')
-pop = pd.read_excel('data/pop-lau.xlsx')
-
-genesysmod = pyam.IamDataFrame('data/genesys-mod.xlsx')
-
-at_laus = gpd.read_file('data/lau-shp/at-laus.shp')
-
-
-""" (B) PREPARE INPUT DATA """
-
-# dh_total ... Heat generation from GENeSYS-MOD's cost-optimal solution used in district heating
-# q_total_l ... Total heat demand at local administrative unit 'l'
-
-dh_total, q_total_l = utils.set_dh_total_heat_parameters(genesysmod, pop)
-
-phi_l = dict(zip(area_eff['LAU ID'], area_eff['VALUE']))
-area_l = dict(zip(per_area_set['LAU ID'], per_area_set['PERMANENT SETTLEMENT AREA']))
-
-# subset_per_lau = utils.set_environment_for_each_lau(at_laus)
-# _file = open('data/lau-env-subset.csv', 'w')
-# writer = csv.writer(_file)
-# for key, val in subset_per_lau.items():
-#     writer.writerow([key, val])
-# _file.close()
-
-subset_per_lau = pd.read_csv('data/lau-env-subset.csv', header=None)
-
-
-""" (C) OPTIMIZATION MODEL """
-
-model = py.ConcreteModel()
-model.name = "downscaling"
-
-model.set_laus = py.Set(initialize=at_laus['LAU_ID'])
-model.subset_per_lau = subset_per_lau
-model.demand_per_lau = q_total_l
-model.phi_l = phi_l
-model.area_l = area_l
-
-model.scenario = 'Gradual Development'
-
-model.v_q_dh_l = py.Var(model.set_laus, domain=py.NonNegativeReals)
-model.v_q_ons_l = py.Var(model.set_laus, domain=py.NonNegativeReals)
-model.v_q_env_l = py.Var(model.set_laus, domain=py.NonNegativeReals)
-
-
-model.p_Q_dh_gen = py.Param(
-    initialize=dh_total[model.scenario],
-    within=py.NonNegativeReals,
-    doc='Total amount of district heating')
-
-model.p_q_total_l = py.Param(
-    model.set_laus,
-    initialize=init_heat_demand_per_lau,
-    within=py.NonNegativeReals,
-    doc='Total heat demand per local administrative unit')
-
-model.p_phi_l = py.Param(
-    model.set_laus,
-    initialize=init_area_eff_factor,
-    within=py.NonNegativeReals,
-    doc='Reduction factor to obtain effective area of district heating per local administrative unit')
-
-model.p_per_area_l = py.Param(
-    model.set_laus,
-    initialize=init_per_area_per_lau,
-    within=py.NonNegativeReals,
-    doc='Permanent settlement area per local administrative unit')
-
-model.p_per_area_env_l = py.Param(
-    model.set_laus,
-    initialize=init_per_area_env_l,
-    within=py.NonNegativeReals,
-    doc='Surrounding area per local administrative unit')
-
-
 def objective_function(model=None):
     first_term = sum(
         model.v_q_dh_l[lau] / (model.p_phi_l[lau] * model.p_per_area_l[lau])
@@ -181,51 +97,30 @@ def objective_function(model=None):
     return first_term + second_term
 
 
-model.objective = py.Objective(expr=objective_function, sense=py.maximize)
-
-
 def c_sum_per_lau(model, lau):
     return model.v_q_dh_l[lau] + model.v_q_ons_l[lau] == model.p_q_total_l[lau]
-model.c_sum_per_lau = py.Constraint(model.set_laus, rule=c_sum_per_lau)
 
 
 def c_limit_dh_for_all_laus(model):
     return sum(
         model.v_q_dh_l[lau]
         for lau in model.set_laus) <= model.p_Q_dh_gen
-model.c_limit_dh_for_all_laus = py.Constraint(rule=c_limit_dh_for_all_laus)
 
 
 def c_calculate_env_dh_per_lau(model, lau):
     rightside = 0
-    data = model.subset_per_lau
-    data = data[data[0] == int(lau)][1].item()
-    data = data.replace('[', '')
-    data = data.replace(']', '')
-    data = data.split(",")
-    for i in data:
-        i = i.replace("['", "")
-        i = i.replace("'", "")
-        i = i.replace("'", "")
-        i = i.replace("]", "")
-        i = i.replace('"', "")
-        
-        lau_id = int(i)
-        
-        
-        if str(lau_id) in model.set_laus:
-            rightside += model.v_q_dh_l[str(lau_id)]
+    for lau_id in model.subset_per_lau[lau]:
+        if lau_id in model.set_laus:
+            rightside += model.v_q_dh_l[lau_id]
         else:
             print(lau_id)
-            
-            
+
     return model.v_q_env_l[lau] == rightside
-model.c_cal_env_dh = py.Constraint(model.set_laus, rule=c_calculate_env_dh_per_lau)
 
 
 def c_set_dh_to_zero(model, lau):
-    if int(lau) in model.phi_l.keys():
-        category = model.phi_l[int(lau)]
+    if lau in model.phi_l.keys():
+        category = model.phi_l[lau]
         
         if category == 'IV':
             return model.v_q_dh_l[lau] == 0
@@ -235,81 +130,216 @@ def c_set_dh_to_zero(model, lau):
             return py.Constraint.Skip
     else:
         return py.Constraint.Skip
-    
-model.c_set_dh_to_zero = py.Constraint(model.set_laus, rule=c_set_dh_to_zero)
-    
 
-model.write('Downscaling.lp', io_options={"symbolic_solver_labels": True})
-_file = open("Downscaling.txt", "w", encoding="utf-8")
-model.pprint(ostream=_file, verbose=False, prefix="")
-_file.close()
-
-Solver = pyomo.opt.SolverFactory("gurobi")
-Solver.options["LogFile"] = str(model.name) + ".log"
-solution = Solver.solve(model, tee=True)
-solution.write()
-model.objective.display()
-
-# i = 0
-# for lau in model.set_laus:
-#     if model.v_q_dh_l[lau].value * 1000 / (model.p_phi_l[lau] * model.p_per_area_l[lau]) > 0.01:
-#         i += 1
-#         print('{} : {}'.format(lau, model.v_q_dh_l[lau].value * 1000 / (model.p_phi_l[lau] * model.p_per_area_l[lau])))
-# print(i)
-
-time = datetime.now().strftime("%Y%m%dT%H%M")
-path = os.path.join("solution", "{}-{}".format(model.scenario, time))
-
-if not os.path.exists(path):
-    os.makedirs(path)
-
-df_out = pd.DataFrame()
-_scenario = model.scenario
-_model = model.name
-
-for lau in model.set_laus:
-    if model.v_q_dh_l[lau].value * 1000 / (model.p_phi_l[lau] * model.p_per_area_l[lau]) > 0.01:
-        df_out = write_IAMC(df_out, _model, _scenario, lau, "Heat density", "GWh / km ** 2", 2050, model.v_q_dh_l[lau].value * 1000 / (model.p_phi_l[lau] * model.p_per_area_l[lau]))
-df_out.to_excel(os.path.join(path, "heat-density.xlsx"), index=False)
-
-df_out = pd.DataFrame()
-for lau in model.set_laus:
-    if lau in ['50101', '50205', '50301', '50309', '50314']:
-        df_out = write_IAMC(df_out, _model, _scenario, lau, "District heating", "MWh", 2050, model.v_q_dh_l[lau].value * 1000000)
-        df_out = write_IAMC(df_out, _model, _scenario, lau, "On-Site / Dec.", "MWh", 2050, model.v_q_ons_l[lau].value * 1000000)
-df_out.to_excel(os.path.join(path, "heat-supply.xlsx"), index=False)
-
-df_out = pd.DataFrame()
-df_out_lau_heat_density = pd.DataFrame()
-dh_final = 0
-dh_out = pd.DataFrame()
-
-nuts3_to_lau = pd.read_excel('data/Allocating_LAU_to_NUTS3_1.1.2020.xlsx')
-nuts3 = nuts3_to_lau['NUTS3'].unique()
-for nut in nuts3:
-    temp = nuts3_to_lau[nuts3_to_lau['NUTS3'] == nut]
-    dh = 0
-    area = 0
-    for lau in temp['LAU ID']:
-        if str(lau) in model.set_laus:
-            lau = str(lau)
-            if model.v_q_dh_l[lau].value * 1000 / (model.p_phi_l[lau] * model.p_per_area_l[lau]) > 0.01:
-                dh += model.v_q_dh_l[lau].value * 1000
-                area += model.p_phi_l[lau] * model.p_per_area_l[lau]
-    if area != 0:
-        df_out = write_IAMC(df_out, _model, _scenario, nut, "Heat density", "GWh / km ** 2", 2050, dh / area)
-    else:
-        df_out = write_IAMC(df_out, _model, _scenario, nut, "Heat density", "GWh / km ** 2", 2050, 0)
-        
-    if area != 0:
-        if dh / area > 10:
-            for lau in temp['LAU ID']:
-                lau = str(lau)
-                if model.v_q_dh_l[lau].value * 1000 / (model.p_phi_l[lau] * model.p_per_area_l[lau]) > 0.01:
-                    df_out_lau_heat_density = write_IAMC(df_out_lau_heat_density, _model, _scenario, lau, "Heat density", "GWh / km ** 2", 2050, model.v_q_dh_l[lau].value * 1000 / (model.p_phi_l[lau] * model.p_per_area_l[lau]))
-                    dh_final += model.v_q_dh_l[lau].value
 
-dh_out = write_IAMC(dh_out, _model, _scenario, "AT", "District Heating", "TWh", 2050, dh_final)                
-df_out_lau_heat_density.to_excel(os.path.join(path, "high-heat-density-lau-10.xlsx"), index=False)            
-dh_out.to_excel(os.path.join(path, "final-district-heating.xlsx"), index=False)                      
-df_out.to_excel(os.path.join(path, "heat-density-nuts3.xlsx"), index=False)
+def read_input_data(folder="data"):
+    """ (A) READ INPUT DATA """
+
+    # pyam and pyogrio are only imported here, since they take seconds
+    import pyam
+    import pyogrio
+
+    area_eff = pd.read_excel(os.path.join(folder, 'eff-area.xlsx'))
+    per_area_set = pd.read_excel(os.path.join(folder, 'per-area-lau.xlsx'))
+    pop = pd.read_excel(os.path.join(folder, 'pop-lau.xlsx'))
+
+    genesysmod = pyam.IamDataFrame(os.path.join(folder, 'genesys-mod.xlsx'))
+
+    # Only the LAU codes are used by the model, so the polygons are not read
+    at_laus = pyogrio.read_dataframe(
+        os.path.join(folder, 'lau-shp', 'at-laus.shp'),
+        columns=['LAU_ID'], read_geometry=False)
+
+    # subset_per_lau = utils.set_environment_for_each_lau(at_laus)
+    # _file = open('data/lau-env-subset.csv', 'w')
+    # writer = csv.writer(_file)
+    # for key, val in subset_per_lau.items():
+    #     writer.writerow([key, val])
+    # _file.close()
+
+    subset_per_lau = pd.read_csv(
+        os.path.join(folder, 'lau-env-subset.csv'), header=None)
+
+    return area_eff, per_area_set, pop, genesysmod, at_laus, subset_per_lau
+
+
+def build_model(
+        area_eff=None, per_area_set=None, pop=None, genesysmod=None,
+        at_laus=None, subset_per_lau=None, scenario='Gradual Development'):
+    """ (B) PREPARE INPUT DATA AND (C) OPTIMIZATION MODEL """
+
+    # dh_total ... Heat generation from GENeSYS-MOD's cost-optimal solution used in district heating
+    # q_total_l ... Total heat demand at local administrative unit 'l'
+
+    dh_total, q_total_l = utils.set_dh_total_heat_parameters(genesysmod, pop)
+
+    phi_l = dict(zip(area_eff['LAU ID'], area_eff['VALUE']))
+    area_l = dict(zip(per_area_set['LAU ID'], per_area_set['PERMANENT SETTLEMENT AREA']))
+
+    model = py.ConcreteModel()
+    model.name = "downscaling"
+
+    # LAUs are indexed by their (integer) LAU code, the code is only written
+    # as string to the results
+    model.set_laus = py.Set(initialize=at_laus['LAU_ID'].astype(int).tolist())
+    model.subset_per_lau = utils.parse_environment_subsets(subset_per_lau)
+    model.demand_per_lau = q_total_l
+    model.phi_l = phi_l
+    model.area_l = area_l
+
+    model.scenario = scenario
+
+    model.v_q_dh_l = py.Var(model.set_laus, domain=py.NonNegativeReals)
+    model.v_q_ons_l = py.Var(model.set_laus, domain=py.NonNegativeReals)
+    model.v_q_env_l = py.Var(model.set_laus, domain=py.NonNegativeReals)
+
+
+    model.p_Q_dh_gen = py.Param(
+        initialize=dh_total[model.scenario],
+        within=py.NonNegativeReals,
+        doc='Total amount of district heating')
+
+    model.p_q_total_l = py.Param(
+        model.set_laus,
+        initialize=init_heat_demand_per_lau,
+        within=py.NonNegativeReals,
+        doc='Total heat demand per local administrative unit')
+
+    model.p_phi_l = py.Param(
+        model.set_laus,
+        initialize=init_area_eff_factor,
+        within=py.NonNegativeReals,
+        doc='Reduction factor to obtain effective area of district heating per local administrative unit')
+
+    model.p_per_area_l = py.Param(
+        model.set_laus,
+        initialize=init_per_area_per_lau,
+        within=py.NonNegativeReals,
+        doc='Permanent settlement area per local administrative unit')
+
+    model.p_per_area_env_l = py.Param(
+        model.set_laus,
+        initialize=init_per_area_env_l,
+        within=py.NonNegativeReals,
+        doc='Surrounding area per local administrative unit')
+
+    model.objective = py.Objective(expr=objective_function, sense=py.maximize)
+
+    model.c_sum_per_lau = py.Constraint(model.set_laus, rule=c_sum_per_lau)
+    model.c_limit_dh_for_all_laus = py.Constraint(rule=c_limit_dh_for_all_laus)
+    model.c_cal_env_dh = py.Constraint(model.set_laus, rule=c_calculate_env_dh_per_lau)
+    model.c_set_dh_to_zero = py.Constraint(model.set_laus, rule=c_set_dh_to_zero)
+
+    return model
+
+
+def solve_model(model=None, solver="gurobi", tee=True):
+
+    Solver = pyomo.opt.SolverFactory(solver)
+    if solver == "gurobi":
+        Solver.options["LogFile"] = str(model.name) + ".log"
+    solution = Solver.solve(model, tee=tee)
+    if tee:
+        solution.write()
+        model.objective.display()
+
+    return solution
+
+
+def write_results(model=None, nuts3_to_lau=None, path=None):
+    """ (D) POST-PROCESSING """
+
+    # i = 0
+    # for lau in model.set_laus:
+    #     if model.v_q_dh_l[lau].value * 1000 / (model.p_phi_l[lau] * model.p_per_area_l[lau]) > 0.01:
+    #         i += 1
+    #         print('{} : {}'.format(lau, model.v_q_dh_l[lau].value * 1000 / (model.p_phi_l[lau] * model.p_per_area_l[lau])))
+    # print(i)
+
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    df_out = pd.DataFrame()
+    _scenario = model.scenario
+    _model = model.name
+
+    for lau in model.set_laus:
+        if model.v_q_dh_l[lau].value * 1000 / (model.p_phi_l[lau] * model.p_per_area_l[lau]) > 0.01:
+            df_out = write_IAMC(df_out, _model, _scenario, str(lau), "Heat density", "GWh / km ** 2", 2050, model.v_q_dh_l[lau].value * 1000 / (model.p_phi_l[lau] * model.p_per_area_l[lau]))
+    df_out.to_excel(os.path.join(path, "heat-density.xlsx"), index=False)
+
+    df_out = pd.DataFrame()
+    for lau in model.set_laus:
+        if lau in [50101, 50205, 50301, 50309, 50314]:
+            df_out = write_IAMC(df_out, _model, _scenario, str(lau), "District heating", "MWh", 2050, model.v_q_dh_l[lau].value * 1000000)
+            df_out = write_IAMC(df_out, _model, _scenario, str(lau), "On-Site / Dec.", "MWh", 2050, model.v_q_ons_l[lau].value * 1000000)
+    df_out.to_excel(os.path.join(path, "heat-supply.xlsx"), index=False)
+
+    df_out = pd.DataFrame()
+    df_out_lau_heat_density = pd.DataFrame()
+    dh_final = 0
+    dh_out = pd.DataFrame()
+
+    nuts3_to_lau = nuts3_to_lau.astype({'LAU ID': int})
+    nuts3 = nuts3_to_lau['NUTS3'].unique()
+    for nut in nuts3:
+        temp = nuts3_to_lau[nuts3_to_lau['NUTS3'] == nut]
+        dh = 0
+        area = 0
+        for lau in temp['LAU ID']:
+            if lau in model.set_laus:
+                if model.v_q_dh_l[lau].value * 1000 / (model.p_phi_l[lau] * model.p_per_area_l[lau]) > 0.01:
+                    dh += model.v_q_dh_l[lau].value * 1000
+                    area += model.p_phi_l[lau] * model.p_per_area_l[lau]
+        if area != 0:
+            df_out = write_IAMC(df_out, _model, _scenario, nut, "Heat density", "GWh / km ** 2", 2050, dh / area)
+        else:
+            df_out = write_IAMC(df_out, _model, _scenario, nut, "Heat density", "GWh / km ** 2", 2050, 0)
+            
+        if area != 0:
+            if dh / area > 10:
+                for lau in temp['LAU ID']:
+                    if model.v_q_dh_l[lau].value * 1000 / (model.p_phi_l[lau] * model.p_per_area_l[lau]) > 0.01:
+                        df_out_lau_heat_density = write_IAMC(df_out_lau_heat_density, _model, _scenario, str(lau), "Heat density", "GWh / km ** 2", 2050, model.v_q_dh_l[lau].value * 1000 / (model.p_phi_l[lau] * model.p_per_area_l[lau]))
+                        dh_final += model.v_q_dh_l[lau].value
+
+    dh_out = write_IAMC(dh_out, _model, _scenario, "AT", "District Heating", "TWh", 2050, dh_final)                
+    df_out_lau_heat_density.to_excel(os.path.join(path, "high-heat-density-lau-10.xlsx"), index=False)            
+    dh_out.to_excel(os.path.join(path, "final-district-heating.xlsx"), index=False)                      
+    df_out.to_excel(os.path.join(path, "heat-density-nuts3.xlsx"), index=False)
+
+    return path
+
+
+if __name__ == "__main__":
+    # Opt-in profiling (--profile/--cprofile or DOWNSCALING_PROFILE/_CPROFILE)
+    if profiling is not None:
+        profiling.configure()
+        _stage = profiling.stage
+    else:
+        if '--profile' in sys.argv or os.environ.get('DOWNSCALING_PROFILE'):
+            print('Profiling requires the folder algorithm-downscaling on the '
+                  'path (e.g., PYTHONPATH=../algorithm-downscaling)')
+        _stage = lambda name, **counts: nullcontext(counts)
+
+    with _stage('read_input_data'):
+        inputs = read_input_data()
+    with _stage('build_model', regions=len(inputs[4])) as _counts:
+        model = build_model(*inputs)
+        _counts['variables'] = model.nvariables()
+        _counts['constraints'] = model.nconstraints()
+
+    model.write('Downscaling.lp', io_options={"symbolic_solver_labels": True})
+    _file = open("Downscaling.txt", "w", encoding="utf-8")
+    model.pprint(ostream=_file, verbose=False, prefix="")
+    _file.close()
+
+    with _stage('solve_model'):
+        solve_model(model)
+
+    time = datetime.now().strftime("%Y%m%dT%H%M")
+    path = os.path.join("solution", "{}-{}".format(model.scenario, time))
+
+    with _stage('write_results'):
+        nuts3_to_lau = pd.read_excel('data/Allocating_LAU_to_NUTS3_1.1.2020.xlsx')
+        write_results(model, nuts3_to_lau, path)
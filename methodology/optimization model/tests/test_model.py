@@ -0,0 +1,62 @@
+import os
+import pytest
+import pandas as pd
+
+import model
+
+FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOLUTION = os.path.join(FOLDER, "solution", "Gradual Development-20220325T1437")
+
+
+@pytest.fixture(scope="module")
+def inputs():
+    return model.read_input_data(os.path.join(FOLDER, "data"))
+
+
+def _set_published_solution(downscaling=None):
+    # The district heating per LAU follows from the published heat densities
+    _density = pd.read_excel(os.path.join(SOLUTION, "heat-density.xlsx"))
+    _density = dict(zip(_density["region"].astype(int), _density["value"]))
+    for lau in downscaling.set_laus:
+        _dh = (
+            _density.get(lau, 0)
+            * downscaling.p_phi_l[lau]
+            * downscaling.p_per_area_l[lau]
+            / 1000
+        )
+        downscaling.v_q_dh_l[lau].value = _dh
+        downscaling.v_q_ons_l[lau].value = max(0, downscaling.p_q_total_l[lau] - _dh)
+
+
+def test_build_model(inputs):
+    downscaling = model.build_model(*inputs)
+
+    laus = len(inputs[4])
+    assert len(downscaling.set_laus) == laus
+    assert downscaling.nvariables() == 3 * laus
+    assert len(downscaling.c_sum_per_lau) == laus
+    assert len(downscaling.c_cal_env_dh) == laus
+    assert downscaling.scenario == "Gradual Development"
+
+    # The published solution is feasible
+    _set_published_solution(downscaling)
+    _dh = sum(downscaling.v_q_dh_l[lau].value for lau in downscaling.set_laus)
+    assert _dh <= downscaling.p_Q_dh_gen.value
+
+
+def test_write_results(inputs, tmp_path):
+    downscaling = model.build_model(*inputs)
+    _set_published_solution(downscaling)
+
+    nuts3_to_lau = pd.read_excel(
+        os.path.join(FOLDER, "data", "Allocating_LAU_to_NUTS3_1.1.2020.xlsx")
+    )
+    path = model.write_results(downscaling, nuts3_to_lau, str(tmp_path / "results"))
+
+    for _file in sorted(os.listdir(SOLUTION)):
+        pd.testing.assert_frame_equal(
+            pd.read_excel(os.path.join(path, _file)),
+            pd.read_excel(os.path.join(SOLUTION, _file)),
+            check_dtype=False,
+            rtol=1e-6,
+        )
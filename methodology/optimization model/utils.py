@@ -48,4 +48,31 @@ def set_environment_for_each_lau(lau=None):
                     list_env_lau.extend([row2['LAU_ID']])
         lau_env[row1['LAU_ID']] = list_env_lau
     
-    return lau_env
\ No newline at end of file
+    return lau_env
+
+def parse_environment_subsets(subset_per_lau=None):
+
+    """
+
+    Parameters
+    ----------
+    subset_per_lau : DataFrame, required
+        Includes the LAU code (column 0) and the list of the codes of the
+        adjacent LAUs as string (column 1), e.g., as read from
+        'lau-env-subset.csv'. The default is None.
+
+    Returns
+    -------
+    subsets : dict
+        Includes the list of the (integer) codes of the adjacent LAUs per
+        (integer) LAU code.
+
+    """
+
+    subsets = dict()
+    for lau, data in zip(subset_per_lau[0], subset_per_lau[1]):
+        for _c in "[]'\"":
+            data = data.replace(_c, "")
+        subsets[int(lau)] = [int(i) for i in data.split(",")]
+
+    return subsets